@@ -0,0 +1,74 @@
+"""
+Admin Router
+Author: Tom Aston
+"""
+
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, status
+
+from app.core.cache import get_docs_cache_stats, get_jti_filter_stats
+from app.core.database import database
+from app.core.dependencies import AccessTokenBearer, RoleChecker
+from app.core.executor import nlp_executor
+from app.service.document_service import similarity_batcher
+
+admin_router = APIRouter()
+
+access_token_bearer = AccessTokenBearer()
+admin_role_checker = RoleChecker(["admin"])
+
+
+@admin_router.get("/nlp-executor", status_code=status.HTTP_200_OK)
+async def get_nlp_executor_stats(
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+) -> dict:
+    """
+    GET NLP executor queue depth, task counters and per task timings endpoint
+    """
+    return nlp_executor.get_stats()
+
+
+@admin_router.get("/similarity-batcher", status_code=status.HTTP_200_OK)
+async def get_similarity_batcher_stats(
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+) -> dict:
+    """
+    GET similarity query batch counts and sizes endpoint
+    """
+    return similarity_batcher.get_stats()
+
+
+@admin_router.get("/cache", status_code=status.HTTP_200_OK)
+async def get_cache_stats(
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+) -> dict:
+    """
+    GET document cache hit and miss counts endpoint
+    """
+    return get_docs_cache_stats()
+
+
+@admin_router.get("/jti-filter", status_code=status.HTTP_200_OK)
+async def get_revoked_token_filter_stats(
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+) -> dict:
+    """
+    GET revoked token filter size and the share of token checks answered without redis endpoint
+    """
+    return get_jti_filter_stats()
+
+
+@admin_router.get("/db-pool", status_code=status.HTTP_200_OK)
+async def get_db_pool_stats(
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+) -> dict:
+    """
+    GET database connection pool occupancy, checkout counters and connection wait histogram endpoint
+    """
+    return database.get_pool_stats()
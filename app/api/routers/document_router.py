@@ -5,22 +5,27 @@ Author: Tom Aston
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import config_manager
 from app.core.database import database
-from app.core.dependencies import AccessTokenBearer, RoleChecker, get_current_user
+from app.core.dependencies import AccessTokenBearer, AuthContext, RoleChecker, get_auth_context
 from app.core.pagination import Pagination, pagination_params
 from app.schema.document_schema import (
+    BulkIngestClientResponse,
     DocumentCreateClientRequest,
     DocumentCreatedClientResponse,
     DocumentGetByIdClientResponse,
+    DocumentSimilarityClientRequest,
+    DocumentSimilarityClientResponse,
     DocumentUpdateClientRequest,
     PaginationClientResponse,
+    SimilarityMatrixClientRequest,
+    SimilarityMatrixClientResponse,
 )
-from app.service.document_service import DocumentService
-from app.models.user import User
+from app.service.document_service import DocumentService, split_lines
 
 document_router = APIRouter()
 document_service = DocumentService()
@@ -36,14 +41,13 @@ admin_role_checker = RoleChecker(["admin"])
     status_code=status.HTTP_200_OK,
 )
 async def get_all_documents(
-    db: Annotated[AsyncSession, Depends(database.get_db)],
     token: Annotated[dict, Depends(access_token_bearer)],
     _: Annotated[bool, Depends(admin_role_checker)],
-) -> list[DocumentGetByIdClientResponse]:
+) -> Response:
     """
-    GET all documents endpoint
+    GET all documents endpoint, the response_model documents the pre-rendered JSON body returned
     """
-    return await document_service.get_all(db=db)
+    return await document_service.get_all()
 
 
 @document_router.get(
@@ -63,6 +67,21 @@ async def get_all_documents_paginated(
     return await document_service.get_all_paginated(db=db, pagination=pagination)
 
 
+@document_router.get(
+    "/export",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def export_documents(
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+) -> StreamingResponse:
+    """
+    GET all documents as newline delimited JSON endpoint, one DocumentCreatedClientResponse per line
+    """
+    return await document_service.export_documents()
+
+
 @document_router.get(
     "/{id}",
     response_model=DocumentGetByIdClientResponse,
@@ -107,12 +126,73 @@ async def create_document(
     db: Annotated[AsyncSession, Depends(database.get_db)],
     token: Annotated[dict, Depends(access_token_bearer)],
     _: Annotated[bool, Depends(user_role_checker)],
-    user: Annotated[User, Depends(get_current_user)],
+    auth: Annotated[AuthContext, Depends(get_auth_context)],
 ) -> DocumentCreatedClientResponse:
     """
     CREATE a new document endpoint
     """
-    return await document_service.create_document(document_body=document_body, db=db, user=user)
+    return await document_service.create_document(document_body=document_body, db=db, user_id=auth.user_id)
+
+
+@document_router.post(
+    "/bulk",
+    response_model=BulkIngestClientResponse,
+    status_code=status.HTTP_200_OK,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+)
+async def ingest_documents(
+    request: Request,
+    db: Annotated[AsyncSession, Depends(database.get_db)],
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(admin_role_checker)],
+    auth: Annotated[AuthContext, Depends(get_auth_context)],
+    batch_size: int = Query(ge=1, le=10_000, default=config_manager.BULK_INGEST_BATCH_SIZE),
+) -> BulkIngestClientResponse:
+    """
+    CREATE documents in bulk endpoint, the body is JSON lines of document create requests read as it streams in
+    """
+    return await document_service.ingest_documents(
+        lines=split_lines(request.stream()), db=db, user_id=auth.user_id, batch_size=batch_size
+    )
+
+
+@document_router.post(
+    "/similar",
+    response_model=list[DocumentSimilarityClientResponse],
+    status_code=status.HTTP_200_OK,
+)
+async def get_similar_documents(
+    similarity_body: DocumentSimilarityClientRequest,
+    db: Annotated[AsyncSession, Depends(database.get_db)],
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(user_role_checker)],
+) -> list[DocumentSimilarityClientResponse]:
+    """
+    POST find the stored documents most similar to a text endpoint
+    """
+    return await document_service.get_similar(similarity_request=similarity_body, db=db)
+
+
+@document_router.post(
+    "/similarity-matrix",
+    response_model=SimilarityMatrixClientResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def get_similarity_matrix(
+    matrix_body: SimilarityMatrixClientRequest,
+    db: Annotated[AsyncSession, Depends(database.get_db)],
+    token: Annotated[dict, Depends(access_token_bearer)],
+    _: Annotated[bool, Depends(user_role_checker)],
+) -> SimilarityMatrixClientResponse:
+    """
+    POST compare texts and stored documents with each other endpoint
+    """
+    return await document_service.get_similarity_matrix(matrix_request=matrix_body, db=db)
 
 
 @document_router.patch(
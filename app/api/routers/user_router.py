@@ -67,11 +67,12 @@ async def login_user(
 @user_router.get("/refresh", status_code=status.HTTP_200_OK)
 async def get_new_access_token(
     token: Annotated[dict, Depends(RefreshTokenBearer())],
+    db: Annotated[AsyncSession, Depends(database.get_db)],
 ) -> JSONResponse:
     """
     GET refresh token endpoint
     """
-    return await user_service.refresh_token(token)
+    return await user_service.refresh_token(token, db)
 
 
 @user_router.get("/logout", status_code=status.HTTP_200_OK)
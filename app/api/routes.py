@@ -5,6 +5,7 @@ Author: Tom Aston
 
 from fastapi import APIRouter
 
+from app.api.routers.admin_router import admin_router
 from app.api.routers.document_router import document_router
 from app.api.routers.user_router import user_router
 from app.core.config import config_manager
@@ -14,3 +15,5 @@ routers = APIRouter()
 routers.include_router(document_router, prefix=f"/api/{config_manager.VERSION}/document", tags=["document"])
 
 routers.include_router(user_router, prefix=f"/api/{config_manager.VERSION}/user", tags=["user"])
+
+routers.include_router(admin_router, prefix=f"/api/{config_manager.VERSION}/admin", tags=["admin"])
@@ -0,0 +1,82 @@
+"""
+Backfill Document Embeddings
+Author: Tom Aston
+
+Computes the stored embedding of every document that has none, or whose embedding was produced by a different
+model than the one currently configured.
+
+Usage:
+    python -m app.cli.backfill_embeddings [--batch-size 256]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from app.core.cache import invalidate_documents_in_cache
+from app.core.config import config_manager
+from app.core.database import database
+from app.nlp.embedding import DocumentEmbedder
+from app.repository.document_repository import DocumentRepository
+
+logger = logging.getLogger("uvicorn")
+
+
+async def backfill_embeddings(batch_size: int) -> int:
+    """
+    backfill document embeddings in batches ordered by id, committing and invalidating the cache after each batch
+
+    Parameters:
+    - batch_size: int: number of documents embedded and written per batch
+
+    Returns:
+    - int: number of documents updated
+    """
+    document_repository = DocumentRepository()
+    embedder = DocumentEmbedder(
+        backend=config_manager.NLP_EMBEDDING_BACKEND,
+        model_name=config_manager.NLP_SPACY_MODEL,
+        vectors_only=config_manager.NLP_VECTORS_ONLY,
+        batch_size=config_manager.NLP_PIPE_BATCH_SIZE,
+        n_process=config_manager.NLP_PIPE_N_PROCESS,
+    )
+    embedding_model = embedder.model_id
+
+    updated = 0
+    last_id = 0
+    start_time = time.perf_counter()
+
+    async with database.session_local() as db:
+        while True:
+            rows = await document_repository.get_without_embedding(
+                db, embedding_model=embedding_model, after_id=last_id, limit=batch_size
+            )
+            if not rows:
+                break
+
+            batch = embedder.embed_documents([(row.title, row.content) for row in rows])
+            embeddings = {row.id: embedding for row, embedding in zip(rows, batch)}
+            await document_repository.update_embeddings(embeddings, db)
+            # drop the committed documents from every worker's caches, which also resyncs their similarity index
+            await invalidate_documents_in_cache(embeddings.keys())
+
+            updated += len(rows)
+            last_id = rows[-1].id
+            logger.info(f"Backfilled {updated} document embeddings ({updated / (time.perf_counter() - start_time):.1f}/s)")
+
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill stored document embeddings")
+    parser.add_argument("--batch-size", type=int, default=256, help="documents embedded and written per batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    updated = asyncio.run(backfill_embeddings(batch_size=args.batch_size))
+    print(f"Backfilled embeddings for {updated} documents")
+
+
+if __name__ == "__main__":
+    main()
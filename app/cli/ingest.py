@@ -0,0 +1,72 @@
+"""
+Bulk Document Ingestion
+Author: Tom Aston
+
+Creates documents from a JSONL file with one {"title", "content", "description"} object per line, embedding and
+inserting them in batches. Lines that fail are reported and skipped.
+
+Usage:
+    python -m app.cli.ingest documents.jsonl [--batch-size 500] [--user-id 1]
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from app.core.config import config_manager
+from app.core.database import database
+from app.core.executor import nlp_executor
+from app.schema.document_schema import BulkIngestClientResponse
+from app.service.document_service import DocumentService
+
+
+async def read_lines(path: str) -> AsyncIterator[str]:
+    """
+    read a file line by line
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            yield line
+
+
+async def ingest(path: str, batch_size: int, user_id: int | None) -> BulkIngestClientResponse:
+    """
+    ingest a JSONL file of documents
+
+    Parameters:
+    - path: str: JSONL file path
+    - batch_size: int: documents embedded and inserted together
+    - user_id: int: owner of the created documents
+
+    Returns:
+    - BulkIngestClientResponse: counts, errors and throughput of the ingestion
+    """
+    try:
+        async with database.session_local() as db:
+            return await DocumentService().ingest_documents(read_lines(path), db, user_id, batch_size)
+    finally:
+        nlp_executor.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk create documents from a JSONL file")
+    parser.add_argument("path", help="JSONL file with one document per line")
+    parser.add_argument(
+        "--batch-size", type=int, default=config_manager.BULK_INGEST_BATCH_SIZE, help="documents per batch"
+    )
+    parser.add_argument("--user-id", type=int, default=None, help="owner of the created documents")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = asyncio.run(ingest(args.path, batch_size=args.batch_size, user_id=args.user_id))
+    print(
+        f"Inserted {report.inserted} documents in {report.seconds:.1f}s ({report.rows_per_second:.1f} rows/s), "
+        f"{report.failed} failed"
+    )
+    for error in report.errors:
+        print(f"line {error.line}: {error.error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Bloom Filter
+Author: Tom Aston
+"""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    class to test set membership in a fixed amount of memory
+
+    An item that was added is always reported as present, an item that was not is reported as present with a
+    probability of about error_rate while no more than capacity items have been added. Items cannot be removed,
+    a filter is rebuilt to forget them.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        """
+        constructor for BloomFilter
+
+        Parameters:
+        - capacity: int: number of items the filter is sized for
+        - error_rate: float: false positive probability at capacity
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def add(self, item: str) -> None:
+        """
+        add an item
+        """
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        number of items added, size and the false positive probability at the current number of items
+        """
+        return {
+            "items": self._count,
+            "capacity": self.capacity,
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "false_positive_rate": (1 - math.exp(-self.num_hashes * self._count / self.num_bits)) ** self.num_hashes,
+        }
+
+    def _positions(self, item: str) -> list[int]:
+        """
+        bit positions of an item, derived from two halves of one hash
+        """
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        # odd so the positions do not repeat before num_hashes
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.num_bits for i in range(self.num_hashes)]
@@ -3,9 +3,23 @@ Cache module for the application
 Author: Tom Aston
 """
 
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Iterable
+
 import redis.asyncio as redis
 
+from .bloom_filter import BloomFilter
 from .config import config_manager
+from .local_cache import LocalCache
+from .single_flight import SingleFlight
+
+logger = logging.getLogger("uvicorn")
 
 jti_blocklist = redis.from_url(
     f"redis://{config_manager.REDIS_HOST}:{config_manager.REDIS_PORT}/0",
@@ -19,59 +33,537 @@ docs_cache = redis.from_url(
     decode_responses=True,
 )
 
+DOCUMENT_ID_KEY = "document:id:{id}"
+DOCUMENT_TITLE_KEY = "document:title:{title}"
+# set for a short while when a document is written so a read from before the write cannot cache it again
+DOCUMENT_WRITTEN_KEY = "document:written:{id}"
+# incremented by every document write so cached lists from before the write are never read again
+DOCUMENT_LIST_VERSION_KEY = "document:list:version"
+DOCUMENT_LIST_KEY = "document:list:{name}:v{version}"
+
+docs_cache_stats = {kind: {"hits": 0, "misses": 0} for kind in ("document", "title", "list")}
+
+# in process tier in front of docs_cache, only used while this worker is subscribed to invalidations
+local_docs_cache = LocalCache(
+    max_size=config_manager.DOCS_LOCAL_CACHE_SIZE, ttl=config_manager.DOCS_LOCAL_CACHE_EXPIRY
+)
+invalidation_listener_state: dict = {"subscribed": False, "task": None}
+# called by the listener with the ids of written documents, or None if writes may have been missed while it was
+# not subscribed, so in process state derived from documents can follow writes made by any worker
+document_write_handlers: list[Callable[[list[int] | None], Awaitable[None]]] = []
+# the latest notification of the write handlers, each runs after the one before it in a task of its own
+document_write_state: dict = {"task": None}
+
+# document list computations running in this worker, by cache key
+document_list_flights = SingleFlight()
+refresh_tasks: set[asyncio.Task] = set()
+
+# in process mirror of the revoked token ids in jti_blocklist, only used while this worker is subscribed to
+# revocations and has loaded the blocklist since subscribing
+jti_filter_state: dict = {
+    "filter": BloomFilter(config_manager.JTI_FILTER_CAPACITY, config_manager.JTI_FILTER_ERROR_RATE),
+    "synced": False,
+    "task": None,
+}
+jti_filter_stats = {"filtered": 0, "checked": 0}
+
 
 async def add_jti_to_blocklist(jti: str) -> None:
     """
-    Add token to blocklist
+    Add token to blocklist and tell every worker it was revoked
+
+    the token is set before it is published, so a worker loading the blocklist after subscribing either reads it
+    or receives the message
 
     Parameters:
     - jti: str: unique identifier for the token
     """
-    await jti_blocklist.set(name=jti, value="", ex=config_manager.JTI_TOKEN_EXPIRY)
+    async with jti_blocklist.pipeline(transaction=False) as pipe:
+        pipe.set(name=jti, value="", ex=config_manager.JTI_TOKEN_EXPIRY)
+        pipe.publish(config_manager.JTI_REVOCATION_CHANNEL, jti)
+        await pipe.execute()
+    jti_filter_state["filter"].add(jti)
 
 
 async def is_jti_blacklisted(jti: str) -> bool:
     """
     Check if token is blacklisted
 
+    while the revoked token filter is synced a token it does not contain was never revoked and redis is not
+    asked, only the tokens it contains, revoked or false positives, are checked against redis
+
     Parameters:
     - jti: str: unique identifier for the token
 
     Returns:
     - bool: True if token is blacklisted, False otherwise
     """
+    if jti_filter_state["synced"] and jti not in jti_filter_state["filter"]:
+        jti_filter_stats["filtered"] += 1
+        return False
+    jti_filter_stats["checked"] += 1
     return await jti_blocklist.get(jti) is not None
 
 
-async def add_docs_to_cache(key: str, value: str) -> None:
+async def load_jti_filter() -> BloomFilter:
+    """
+    Build a revoked token filter from every token in the blocklist
+
+    Returns:
+    - BloomFilter: filter sized for at least twice the number of revoked tokens
+    """
+    jtis = [jti async for jti in jti_blocklist.scan_iter(count=1000)]
+    capacity = max(config_manager.JTI_FILTER_CAPACITY, 2 * len(jtis))
+    jti_filter = BloomFilter(capacity, config_manager.JTI_FILTER_ERROR_RATE)
+    for jti in jtis:
+        jti_filter.add(jti)
+    return jti_filter
+
+
+async def listen_for_revocations() -> None:
+    """
+    Keep the revoked token filter in step with the blocklist, resubscribing if the connection is lost
+
+    the blocklist is loaded after subscribing so no revocation falls between the two, and reloaded every
+    JTI_FILTER_REBUILD_SECONDS so tokens that expired from the blocklist are dropped from the filter. The filter
+    is not used while it is being loaded or the subscription is lost
+    """
+    while True:
+        try:
+            async with jti_blocklist.pubsub() as pubsub:
+                await pubsub.subscribe(config_manager.JTI_REVOCATION_CHANNEL)
+                rebuild_at = 0.0
+                while True:
+                    if time.monotonic() >= rebuild_at:
+                        jti_filter_state["synced"] = False
+                        jti_filter_state["filter"] = await load_jti_filter()
+                        jti_filter_state["synced"] = True
+                        rebuild_at = time.monotonic() + config_manager.JTI_FILTER_REBUILD_SECONDS
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        jti_filter_state["filter"].add(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Token revocation listener failed, resubscribing")
+        finally:
+            jti_filter_state["synced"] = False
+        await asyncio.sleep(1)
+
+
+def start_revocation_listener() -> None:
+    """
+    Start mirroring token revocations into the revoked token filter in a background task
+    """
+    if jti_filter_state["task"] is None:
+        jti_filter_state["task"] = asyncio.create_task(listen_for_revocations())
+
+
+async def stop_revocation_listener() -> None:
+    """
+    Stop mirroring token revocations, every token is checked against redis again
+    """
+    task = jti_filter_state["task"]
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    jti_filter_state["task"] = None
+
+
+def get_jti_filter_stats() -> dict:
+    """
+    Revoked token filter size and the share of token checks it answered without redis
     """
-    Add docs to cache
+    lookups = jti_filter_stats["filtered"] + jti_filter_stats["checked"]
+    return {
+        **jti_filter_state["filter"].get_stats(),
+        **jti_filter_stats,
+        "synced": jti_filter_state["synced"],
+        "filtered_ratio": jti_filter_stats["filtered"] / lookups if lookups else 0.0,
+    }
+
+
+async def get_document_from_cache(id: int) -> str | None:
+    """
+    Get a cached document by id
 
     Parameters:
-    - key: str: key for the cache
-    - value: str: value to store in the cache
+    - id: int: document id
+
+    Returns:
+    - str: the cached document JSON, None on a miss
     """
-    await docs_cache.set(name=key, value=value, ex=config_manager.DOCS_CACHE_EXPIRY)
+    return await _get(DOCUMENT_ID_KEY.format(id=id), "document")
 
 
-async def is_docs_in_cache(key: str) -> bool:
+async def get_document_id_by_title_from_cache(title: str) -> int | None:
     """
-    Check if docs are in cache
+    Get the id of the cached document with a title
+
+    Title keys only point at a document id, so the caller reads the document by id and must check its title
+    still matches, a document renamed since the pointer was written is then treated as a miss
 
     Parameters:
-    - key: str: key for the cache
+    - title: str: document title
 
     Returns:
-    - bool: True if docs are in cache, False otherwise
+    - int: the document id, None on a miss
     """
-    return await docs_cache.exists(key)
+    id = await _get(DOCUMENT_TITLE_KEY.format(title=title), "title")
+    return int(id) if id is not None else None
 
 
-async def get_docs_from_cache(key: str) -> str:
+async def add_document_to_cache(id: int, title: str, value: str) -> None:
     """
-    Get docs from cache
+    Add a document to the cache under its id, with a pointer to it under its title
+
+    the document is not cached while it has been written within the last DOCS_CACHE_WRITE_TOMBSTONE_MS, so a
+    read that loaded the row before a concurrent update or delete committed cannot put it back after the
+    invalidation. The check and the set are one transaction watching the write marker
+
+    Parameters:
+    - id: int: document id
+    - title: str: document title
+    - value: str: document JSON
+    """
+    written_key = DOCUMENT_WRITTEN_KEY.format(id=id)
+    async with docs_cache.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(written_key)
+            if await pipe.exists(written_key):
+                return
+            pipe.multi()
+            pipe.set(name=DOCUMENT_ID_KEY.format(id=id), value=value, ex=config_manager.DOCUMENT_CACHE_EXPIRY)
+            pipe.set(name=DOCUMENT_TITLE_KEY.format(title=title), value=id, ex=config_manager.DOCUMENT_CACHE_EXPIRY)
+            await pipe.execute()
+        except redis.WatchError:
+            return
+    _set_local(DOCUMENT_ID_KEY.format(id=id), value)
+    _set_local(DOCUMENT_TITLE_KEY.format(title=title), str(id))
+
+
+async def invalidate_document_in_cache(id: int, titles: Iterable[str] = ()) -> None:
+    """
+    Remove a written document from the cache and move every cached document list to a new version
+
+    Parameters:
+    - id: int: document id
+    - titles: Iterable[str]: titles whose pointers should be dropped i.e. the title of a new document
+    """
+    await invalidate_documents_in_cache([id], titles)
+
+
+async def invalidate_documents_in_cache(ids: Iterable[int], titles: Iterable[str] = ()) -> None:
+    """
+    Remove written documents from the cache and move every cached document list to a new version
 
     Parameters:
-    - key: str: key for the cache
+    - ids: Iterable[int]: document ids
+    - titles: Iterable[str]: titles whose pointers should be dropped
+    """
+    ids = list(ids)
+    keys = [
+        *(DOCUMENT_ID_KEY.format(id=id) for id in ids),
+        *(DOCUMENT_TITLE_KEY.format(title=title) for title in titles),
+    ]
+    for key in (*keys, DOCUMENT_LIST_VERSION_KEY):
+        local_docs_cache.delete(key)
+
+    async with docs_cache.pipeline(transaction=False) as pipe:
+        for id in ids:
+            pipe.set(DOCUMENT_WRITTEN_KEY.format(id=id), 1, px=config_manager.DOCS_CACHE_WRITE_TOMBSTONE_MS)
+        if keys:
+            pipe.delete(*keys)
+        pipe.incr(DOCUMENT_LIST_VERSION_KEY)
+        # tell the other workers to drop the same keys from their local tier
+        pipe.publish(config_manager.DOCS_CACHE_INVALIDATION_CHANNEL, json.dumps([*keys, DOCUMENT_LIST_VERSION_KEY]))
+        await pipe.execute()
+
+
+async def get_or_compute_document_list(name: str, compute: Callable[[], Awaitable[str]]) -> str:
+    """
+    Get a cached document list at the current list version, computing and caching it on a miss
+
+    Stampede protection:
+        - concurrent misses in this worker are coalesced so compute runs once and every caller gets its result
+        - across workers only the holder of a short redis lock computes, the others poll for the value it stores
+        - with DOCS_CACHE_EARLY_REFRESH_BETA > 0 a hit may refresh the list in the background shortly before it
+          expires (probabilistic early expiration, the closer to expiry and the slower compute the likelier), so
+          the list rarely expires under load at all
+
+    a list computed while a write moved the version on is stored under the old version and never read
+
+    Parameters:
+    - name: str: name of the list i.e. "all", or of a value derived from every document i.e. "count"
+    - compute: Callable: async function returning the list JSON, exceptions are raised to every waiting caller
+
+    Returns:
+    - str: the list JSON
+    """
+    version = int(await _get(DOCUMENT_LIST_VERSION_KEY) or 0)
+    key = DOCUMENT_LIST_KEY.format(name=name, version=version)
+
+    cached = await _get(key, "list")
+    if cached is None:
+        return await document_list_flights.do(key, lambda: _compute_document_list(key, compute, refresh=False))
+
+    compute_seconds, expires_at, value = _unpack_list_entry(cached)
+    # refreshes have a flight of their own, a skipped refresh returns None which no miss must be handed
+    refresh_key = f"{key}:refresh"
+    if (
+        key not in document_list_flights
+        and refresh_key not in document_list_flights
+        and _should_refresh_early(compute_seconds, expires_at)
+    ):
+        task = asyncio.create_task(
+            document_list_flights.do(refresh_key, lambda: _compute_document_list(key, compute, refresh=True))
+        )
+        refresh_tasks.add(task)
+        task.add_done_callback(_finish_refresh)
+    return value
+
+
+def get_docs_cache_stats() -> dict:
+    """
+    Get the hit and miss counts of each cache tier
+
+    Returns:
+    - dict: {"local": local tier stats, "redis": {"document" | "title" | "list": {"hits", "misses", "hit_ratio"}}},
+      only lookups the local tier missed reach redis
+    """
+    return {
+        "local": {**local_docs_cache.get_stats(), "enabled": invalidation_listener_state["subscribed"]},
+        "redis": {
+            kind: {**counts, "hit_ratio": counts["hits"] / max(counts["hits"] + counts["misses"], 1)}
+            for kind, counts in docs_cache_stats.items()
+        },
+    }
+
+
+async def listen_for_invalidations() -> None:
+    """
+    Drop the keys other workers invalidate from the local tier, resubscribing if the connection is lost
+
+    the local tier is only used while subscribed and is cleared whenever the subscription is lost, as any
+    invalidation published in the meantime would have been missed. The ids of the written documents are passed
+    on to the document_write_handlers, None on every (re)subscription. The handlers run in background tasks,
+    in order, once the keys are dropped, so a slow handler never holds up the invalidations after it
+    """
+    while True:
+        try:
+            async with docs_cache.pubsub() as pubsub:
+                await pubsub.subscribe(config_manager.DOCS_CACHE_INVALIDATION_CHANNEL)
+                local_docs_cache.clear()
+                invalidation_listener_state["subscribed"] = True
+                _dispatch_document_writes(None)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        keys = json.loads(message["data"])
+                        for key in keys:
+                            local_docs_cache.delete(key)
+                        _dispatch_document_writes(_document_ids_of(keys))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Document cache invalidation listener failed, resubscribing")
+        finally:
+            invalidation_listener_state["subscribed"] = False
+            local_docs_cache.clear()
+        await asyncio.sleep(1)
+
+
+def start_invalidation_listener() -> None:
+    """
+    Start listening for document cache invalidations in a background task
+    """
+    if invalidation_listener_state["task"] is None:
+        invalidation_listener_state["task"] = asyncio.create_task(listen_for_invalidations())
+
+
+async def stop_invalidation_listener() -> None:
+    """
+    Stop listening for document cache invalidations
+    """
+    task = invalidation_listener_state["task"]
+    if task is None:
+        return
+    for pending in (task, document_write_state["task"]):
+        if pending is None:
+            continue
+        pending.cancel()
+        try:
+            await pending
+        except asyncio.CancelledError:
+            pass
+    invalidation_listener_state["task"] = None
+    document_write_state["task"] = None
+
+
+async def _get(key: str, kind: str | None = None) -> str | None:
+    """
+    Read a key from the local tier, falling back to redis and filling the local tier on a redis hit
+
+    Parameters:
+    - key: str: cache key
+    - kind: str: kind of lookup the redis hit or miss is counted under, None to not count it
+    """
+    use_local = invalidation_listener_state["subscribed"]
+    if use_local:
+        value = local_docs_cache.get(key)
+        if value is not None:
+            return value
+
+    value = await docs_cache.get(key)
+    if kind is not None:
+        _record(kind, value)
+    if use_local and value is not None:
+        local_docs_cache.set(key, value)
+    return value
+
+
+async def _compute_document_list(key: str, compute: Callable[[], Awaitable[str]], refresh: bool) -> str | None:
+    """
+    Compute and store a document list while holding its redis lock
+
+    if another worker holds the lock a miss waits for the list that worker stores, taking the lock itself as soon
+    as it is released without a list, i.e. when that worker's compute raised, and computes it anyway if neither
+    happens before the lock expires, while an early refresh is simply skipped
+    """
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + config_manager.DOCS_CACHE_LOCK_EXPIRY_MS / 1000
+    while True:
+        if await docs_cache.set(lock_key, token, nx=True, px=config_manager.DOCS_CACHE_LOCK_EXPIRY_MS):
+            try:
+                return await _store_document_list(key, compute)
+            finally:
+                await _release_lock(lock_key, token)
+
+        if refresh:
+            return None
+        if time.monotonic() >= deadline:
+            break
+
+        await asyncio.sleep(config_manager.DOCS_CACHE_LOCK_POLL_MS / 1000)
+        cached = await docs_cache.get(key)
+        if cached is not None:
+            _set_local(key, cached)
+            return _unpack_list_entry(cached)[2]
+
+    logger.warning(f"Timed out waiting for another worker to cache {key}, computing it")
+    return await _store_document_list(key, compute)
+
+
+async def _store_document_list(key: str, compute: Callable[[], Awaitable[str]]) -> str:
+    """
+    Compute a document list and cache it with how long it took and when it expires
+    """
+    start_time = time.perf_counter()
+    value = await compute()
+    compute_seconds = time.perf_counter() - start_time
+
+    entry = _pack_list_entry(compute_seconds, time.time() + config_manager.DOCS_CACHE_EXPIRY, value)
+    await docs_cache.set(name=key, value=entry, ex=config_manager.DOCS_CACHE_EXPIRY)
+    _set_local(key, entry)
+    return value
+
+
+async def _release_lock(lock_key: str, token: str) -> None:
+    """
+    Delete a lock only if it is still held with our token, it may have expired and been taken by another worker
+    """
+    async with docs_cache.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(lock_key)
+            if await pipe.get(lock_key) == token:
+                pipe.multi()
+                pipe.delete(lock_key)
+                await pipe.execute()
+        except redis.WatchError:
+            pass
+
+
+def _should_refresh_early(compute_seconds: float, expires_at: float) -> bool:
+    """
+    Decide whether to refresh an entry before it expires, the XFetch rule
+    now - compute_seconds * beta * ln(rand) >= expires_at
+    """
+    beta = config_manager.DOCS_CACHE_EARLY_REFRESH_BETA
+    if beta <= 0:
+        return False
+    return time.time() - compute_seconds * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def _pack_list_entry(compute_seconds: float, expires_at: float, value: str) -> str:
+    """
+    Prefix a cached list with a header line holding its compute time and expiry time
+    """
+    return f"{compute_seconds:.6f} {expires_at:.3f}\n{value}"
+
+
+def _unpack_list_entry(entry: str) -> tuple[float, float, str]:
+    """
+    Split a cached list into its compute time, expiry time and value
+    """
+    header, _, value = entry.partition("\n")
+    compute_seconds, expires_at = header.split(" ")
+    return float(compute_seconds), float(expires_at), value
+
+
+def _finish_refresh(task: asyncio.Task) -> None:
+    """
+    Drop a finished background refresh, logging it if it failed
+    """
+    refresh_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background refresh of a cached document list failed", exc_info=task.exception())
+
+
+def _dispatch_document_writes(ids: list[int] | None) -> None:
+    """
+    Notify the document write handlers in a background task that runs after the previous notification
+    """
+    if ids == []:
+        return
+    document_write_state["task"] = asyncio.create_task(_notify_document_writes(ids, document_write_state["task"]))
+
+
+async def _notify_document_writes(ids: list[int] | None, previous: asyncio.Task | None) -> None:
+    """
+    Pass written document ids to every document write handler, logging rather than raising their errors
+    """
+    if previous is not None:
+        await asyncio.wait([previous])
+    for handler in document_write_handlers:
+        try:
+            await handler(ids)
+        except Exception:
+            logger.exception("Document write handler failed")
+
+
+def _document_ids_of(keys: Iterable[str]) -> list[int]:
+    """
+    Ids of the documents whose keys were invalidated
+    """
+    prefix = DOCUMENT_ID_KEY.format(id="")
+    return [int(key[len(prefix) :]) for key in keys if key.startswith(prefix)]
+
+
+def _set_local(key: str, value: str) -> None:
+    """
+    Set a key in the local tier while this worker is subscribed to invalidations
+    """
+    if invalidation_listener_state["subscribed"]:
+        local_docs_cache.set(key, value)
+
+
+def _record(kind: str, value: str | None) -> str | None:
+    """
+    Count a cache lookup as a hit or a miss and pass its value through
     """
-    return await docs_cache.get(key)
+    docs_cache_stats[kind]["hits" if value is not None else "misses"] += 1
+    return value
@@ -43,6 +43,15 @@ class ConfigManager(BaseSettings):
         port=POSTGRES_HOST_PORT,
         database=POSTGRES_DB,
     )
+    DATABASE_REPLICA_URIS: list[str] = []  # JSON list of read replica URLs, empty runs every query on the primary
+    DB_REPLICA_POLICY: str = "round_robin"  # or "least_connections"
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0  # reads stay on the primary this long after a write, 0 disables it
+    DB_POOL_SIZE: int = 5  # connections kept open by each worker
+    DB_MAX_OVERFLOW: int = 10  # extra connections each worker may open under load
+    DB_POOL_TIMEOUT: float = 30  # seconds a request waits for a connection before failing
+    DB_POOL_RECYCLE: int = 1800  # seconds before a connection is replaced, -1 never replaces them
+    DB_POOL_PRE_PING: bool = False  # test connections on checkout, for networks that drop idle connections
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements cached per connection, 0 behind pgbouncer
 
     # security config-----------------------------------------
     JWT_SECRET: str = os.environ["JWT_SECRET"]
@@ -54,7 +63,46 @@ class ConfigManager(BaseSettings):
     REDIS_HOST: str = os.environ["REDIS_HOST"]
     REDIS_PORT: int = int(os.environ["REDIS_HOST_PORT"])
     JTI_TOKEN_EXPIRY: int = 3600  # 1 hour
+    JTI_REVOCATION_CHANNEL: str = "jti-revocation"
+    JTI_FILTER_CAPACITY: int = 100_000  # revoked tokens each worker's bloom filter is sized for
+    JTI_FILTER_ERROR_RATE: float = 0.001  # share of unrevoked tokens still checked against redis
+    JTI_FILTER_REBUILD_SECONDS: int = 600  # rebuilt from redis so expired tokens stop filling the filter
     DOCS_CACHE_EXPIRY: int = 60  # 1 min
+    DOCS_LOCAL_CACHE_SIZE: int = 4096  # entries held in each worker's in process cache, 0 disables it
+    DOCS_LOCAL_CACHE_EXPIRY: float = 5.0  # seconds, bounds staleness if an invalidation message is lost
+    DOCS_CACHE_INVALIDATION_CHANNEL: str = "document-cache-invalidation"
+    DOCS_CACHE_LOCK_EXPIRY_MS: int = 2000  # how long one worker may hold the right to recompute a cached list
+    DOCS_CACHE_LOCK_POLL_MS: int = 25
+    DOCS_CACHE_EARLY_REFRESH_BETA: float = 1.0  # > 1 refreshes cached lists earlier, 0 disables early refresh
+    DOCS_CACHE_WRITE_TOMBSTONE_MS: int = 5000  # how long after a write a document read may not refill its entry
+    DOCUMENT_CACHE_EXPIRY: int = 300  # 5 mins, entries are invalidated on write so this bounds memory and missed invalidations
+
+    # export config-----------------------------------------
+    EXPORT_BATCH_SIZE: int = 1000  # rows fetched from the server side cursor per chunk of a document export
+
+    # bulk ingestion config-----------------------------------------
+    BULK_INGEST_BATCH_SIZE: int = 500  # documents embedded together and inserted per INSERT ... RETURNING
+    BULK_INGEST_MAX_ERRORS: int = 1000  # per line errors kept in the ingestion report, all are counted
+
+    # nlp config-----------------------------------------
+    NLP_SPACY_MODEL: str = "en_core_web_md"
+    NLP_WARM_UP_ON_STARTUP: bool = False  # load NLP models at startup instead of on first use
+    NLP_EMBEDDING_BACKEND: str = "spacy"  # "spacy" to embed through nlp.pipe or "static" for direct vector lookups
+    NLP_VECTORS_ONLY: bool = True  # load the spaCy model without the components document vectors do not need
+    NLP_PIPE_BATCH_SIZE: int = 256
+    NLP_PIPE_N_PROCESS: int = 1
+    NLP_EXECUTOR_WORKERS: int = 2  # worker processes for preprocessing and embedding, 0 runs them on a thread
+    NLP_EXECUTOR_MAX_IN_FLIGHT: int | None = None  # tasks submitted to the workers at once, defaults to 2 per worker
+    NLP_EXECUTOR_MAX_PENDING: int = 256  # tasks waiting for the workers before requests are rejected with a 503
+    NLP_EXECUTOR_START_METHOD: str = "spawn"
+
+    # similarity search config-----------------------------------------
+    SIMILARITY_INDEX: str = "exact"  # "exact" brute force search or "ivf" approximate search
+    IVF_N_LISTS: int = 256  # more lists means faster searches at lower recall
+    IVF_N_PROBE: int = 8  # more probed lists means higher recall at higher latency
+    SIMILARITY_MATRIX_BLOCK_SIZE: int = 1024  # rows and columns per tile of a similarity matrix product
+    SIMILARITY_BATCH_MAX_SIZE: int = 32  # concurrent similarity queries embedded and scored together, 1 disables
+    SIMILARITY_BATCH_MAX_WAIT_MS: float = 5.0  # longest a similarity query waits for others to batch with
 
     class Config:
         case_sensitive = True
@@ -3,8 +3,12 @@ Database
 Author: Tom Aston
 """
 
-from typing import Any, AsyncGenerator
+import itertools
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Callable, Sequence
 
+from sqlalchemy import event, make_url
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -12,7 +16,10 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
-from sqlalchemy import MetaData
+from sqlalchemy import Engine, MetaData, UpdateBase
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
 
 from app.core.config import config_manager
 
@@ -29,18 +36,302 @@ class BaseModel:
         return cls.__name__.lower()
 
 
+REPLICA_POLICIES = ("round_robin", "least_connections")
+
+# upper bounds in milliseconds of the pool wait histogram buckets
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """
+    class to count connection pool checkouts through pool events and time the wait for a connection
+    """
+
+    def __init__(self) -> None:
+        """
+        constructor for PoolMetrics
+        """
+        self._stats = {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "checked_out": 0,
+            "max_checked_out": 0,
+            "timeouts": 0,
+        }
+        self._wait = {"count": 0, "total": 0.0, "max": 0.0}
+        self._wait_buckets = [0] * (len(POOL_WAIT_BUCKETS_MS) + 1)
+
+    def attach(self, pool: Pool) -> None:
+        """
+        listen to the checkout events of a pool
+        """
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        """
+        add the time one checkout waited for a connection to the wait histogram
+        """
+        wait_ms = 1000 * seconds
+        self._wait["count"] += 1
+        self._wait["total"] += wait_ms
+        self._wait["max"] = max(self._wait["max"], wait_ms)
+        bucket = next((i for i, bound in enumerate(POOL_WAIT_BUCKETS_MS) if wait_ms <= bound), -1)
+        self._wait_buckets[bucket] += 1
+        if timed_out:
+            self._stats["timeouts"] += 1
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        connections opened, checkouts, checkins and timeouts, the number of connections checked out now and at
+        most, and the mean, max and histogram of the wait for a connection in milliseconds
+        """
+        labels = [f"le_{bound}" for bound in POOL_WAIT_BUCKETS_MS] + ["inf"]
+        return {
+            **self._stats,
+            "wait_ms": {
+                "count": self._wait["count"],
+                "mean": self._wait["total"] / self._wait["count"] if self._wait["count"] else 0.0,
+                "max": self._wait["max"],
+                "histogram": dict(zip(labels, self._wait_buckets)),
+            },
+        }
+
+    def _on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self._stats["connects"] += 1
+
+    def _on_checkout(self, dbapi_connection: Any, connection_record: Any, connection_proxy: Any) -> None:
+        self._stats["checkouts"] += 1
+        self._stats["checked_out"] += 1
+        self._stats["max_checked_out"] = max(self._stats["max_checked_out"], self._stats["checked_out"])
+
+    def _on_checkin(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self._stats["checkins"] += 1
+        self._stats["checked_out"] -= 1
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    class to time how long each checkout waits for a free connection
+
+    the wait includes opening a new connection when the pool has none idle and may overflow, and waiting for a
+    connection to be checked in when it may not
+    """
+
+    metrics: PoolMetrics | None = None
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        """
+        recreate the pool, as the engine does when disposed, keeping its metrics
+        """
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self) -> Any:
+        started_at = time.perf_counter()
+        try:
+            connection_record = super()._do_get()
+        except PoolTimeoutError:
+            self._record_wait(started_at, timed_out=True)
+            raise
+        self._record_wait(started_at)
+        return connection_record
+
+    def _record_wait(self, started_at: float, timed_out: bool = False) -> None:
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - started_at, timed_out=timed_out)
+
+
+class ClientWrites:
+    """
+    class to carry when a client last wrote from one of its requests to the next
+
+    the read your writes middleware creates one per request from the client's last write cookie and sets it in
+    client_writes, the router reads and updates it
+    """
+
+    def __init__(self, last_write: float | None = None) -> None:
+        """
+        constructor for ClientWrites
+
+        Parameters:
+        - last_write: float: wall clock time of the client's last write, None if it has not written recently
+        """
+        self.last_write = last_write
+        self.wrote = False
+
+
+# writes of the client the current request came from, None outside a request
+client_writes: ContextVar[ClientWrites | None] = ContextVar("client_writes", default=None)
+
+
+class ReplicaRouter:
+    """
+    class to choose the engine a statement runs on
+
+    statements run on the primary unless they are marked with the use_replica execution option, marked reads
+    run on a replica chosen by the policy:
+        - round_robin: each replica in turn
+        - least_connections: the replica with the fewest connections checked out
+
+    read your writes: for read_your_writes_seconds after a client writes, that client's marked reads run on the
+    primary too, so it never sees replication lag on what it just wrote whichever worker serves it. The time of
+    the write travels with the client in a cookie, see ClientWrites, and other clients keep reading replicas
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: Sequence[Engine] = (),
+        policy: str = "round_robin",
+        read_your_writes_seconds: float = 5.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        constructor for ReplicaRouter
+
+        Parameters:
+        - primary: Engine: engine every write and unmarked read runs on
+        - replicas: Sequence[Engine]: engines marked reads are spread over, none runs everything on the primary
+        - policy: str: "round_robin" or "least_connections"
+        - read_your_writes_seconds: float: seconds after a write that reads stay on the primary, 0 disables it
+        - clock: Callable: wall clock time source in seconds, shared by every worker the client's cookie reaches
+        """
+        if policy not in REPLICA_POLICIES:
+            raise ValueError(f"replica policy must be one of {REPLICA_POLICIES}")
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.clock = clock
+        self._turns = itertools.cycle(range(len(self.replicas)))
+        self._stats = {"primary": 0, "replica": 0, "pinned": 0}
+
+    def record_write(self) -> None:
+        """
+        keep the current client's reads on the primary for read_your_writes_seconds from now
+        """
+        writes = client_writes.get()
+        if writes is not None:
+            writes.last_write = self.clock()
+            writes.wrote = True
+
+    def is_pinned(self) -> bool:
+        """
+        True if the current client wrote within the last read_your_writes_seconds
+        """
+        writes = client_writes.get()
+        if writes is None or writes.last_write is None:
+            return False
+        # a last write in the future is ignored so a forged cookie cannot pin a client for good
+        return 0 <= self.clock() - writes.last_write < self.read_your_writes_seconds
+
+    def get_engine(self, use_replica: bool) -> Engine:
+        """
+        engine for a statement
+
+        Parameters:
+        - use_replica: bool: the statement is a read that may run on a replica
+
+        Returns:
+        - Engine: a replica if the statement may use one and the client's reads are not pinned to the primary
+        """
+        if not use_replica or not self.replicas:
+            self._stats["primary"] += 1
+            return self.primary
+        if self.is_pinned():
+            self._stats["pinned"] += 1
+            return self.primary
+
+        self._stats["replica"] += 1
+        if self.policy == "least_connections":
+            return min(self.replicas, key=lambda engine: engine.pool.checkedout())
+        return self.replicas[next(self._turns)]
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        statements routed to the primary, to a replica and to the primary while pinned after a write
+        """
+        return dict(self._stats)
+
+
+class RoutingSession(Session):
+    """
+    session running reads marked with the use_replica execution option on a replica
+
+    once the session has written, every later statement in it runs on the primary, so it reads its own writes
+    and never mixes a replica's older snapshot into its transaction
+    """
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Engine:
+        router: ReplicaRouter | None = self.info.get("router")
+        if router is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+            router.record_write()
+
+        use_replica = (
+            clause is not None
+            and not self.info.get("wrote")
+            and clause.get_execution_options().get("use_replica", False)
+        )
+        return router.get_engine(use_replica)
+
+
 class Database:
     """
     database class
     """
 
-    def __init__(self, db_url: str) -> None:
+    def __init__(
+        self,
+        db_url: str,
+        replica_urls: Sequence[str] = (),
+        replica_policy: str = "round_robin",
+        read_your_writes_seconds: float = 5.0,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+        statement_cache_size: int = 100,
+    ) -> None:
         """
         database constructor
+
+        Parameters:
+        - db_url: str: primary database URL
+        - replica_urls: Sequence[str]: read replica URLs, reads marked with use_replica are spread over them
+        - replica_policy: str: how a replica is chosen, "round_robin" or "least_connections"
+        - read_your_writes_seconds: float: seconds after a write that marked reads stay on the primary
+        - pool_size: int: connections kept open in each pool
+        - max_overflow: int: connections opened beyond pool_size under load and closed when checked in
+        - pool_timeout: float: seconds a checkout waits for a connection before raising
+        - pool_recycle: int: seconds after which a connection is replaced on checkout, -1 never replaces them
+        - pool_pre_ping: bool: test each connection on checkout and replace it if it was dropped
+        - statement_cache_size: int: prepared statements cached per asyncpg connection, 0 disables caching
         """
-        self.engine: AsyncEngine = create_async_engine(
-            db_url,
-            echo=False,  # set to True to see the SQL queries in the console on fastapi
+        engine_options = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout,
+            "pool_recycle": pool_recycle,
+            "pool_pre_ping": pool_pre_ping,
+            "statement_cache_size": statement_cache_size,
+        }
+        self.engine, self.pool_metrics = self._create_engine(db_url, **engine_options)
+        self.replicas = [self._create_engine(url, **engine_options) for url in replica_urls]
+
+        self.router = ReplicaRouter(
+            self.engine.sync_engine,
+            [engine.sync_engine for engine, _ in self.replicas],
+            policy=replica_policy,
+            read_your_writes_seconds=read_your_writes_seconds,
         )
 
         self.session_local = async_sessionmaker(
@@ -49,8 +340,12 @@ class Database:
             bind=self.engine,
             expire_on_commit=False,
             class_=AsyncSession,
+            sync_session_class=RoutingSession,
+            info={"router": self.router},
         )
 
+        self.request_sessions = 0
+
     async def create_database(self) -> None:
         """
         create all the database tables defined in models if they don't already exist
@@ -61,12 +356,85 @@ class Database:
     async def get_db(self) -> AsyncGenerator[AsyncSession, None]:
         """
         get database session
+
+        FastAPI caches a dependency for the rest of the request, so every Depends(database.get_db) of a request,
+        in the route and in its dependencies, shares this one session and at most one pooled connection per
+        engine it uses
         """
         db: AsyncSession = self.session_local()
+        self.request_sessions += 1
         try:
             yield db
         finally:
             await db.close()
 
+    def get_pool_stats(self) -> dict[str, Any]:
+        """
+        pool size and occupancy, checkout counters and connection wait times of the primary and each replica,
+        statements routed to each and the number of sessions opened for requests
+        """
+        return {
+            **self._get_engine_pool_stats(self.engine, self.pool_metrics),
+            "replicas": [self._get_engine_pool_stats(engine, metrics) for engine, metrics in self.replicas],
+            "routing": self.router.get_stats(),
+            "request_sessions": self.request_sessions,
+        }
+
+    def _create_engine(
+        self, db_url: str, statement_cache_size: int, **pool_options: Any
+    ) -> tuple[AsyncEngine, PoolMetrics]:
+        """
+        create an engine with an instrumented pool
 
-database = Database(config_manager.DATABASE_URI)
+        Returns:
+        - AsyncEngine: the engine
+        - PoolMetrics: checkout counters and wait times of its pool
+        """
+        connect_args = {}
+        if make_url(db_url).get_driver_name() == "asyncpg":
+            # SQLAlchemy's cache of prepared statements and asyncpg's own, both must be 0 behind pgbouncer in
+            # transaction pooling mode
+            connect_args = {
+                "prepared_statement_cache_size": statement_cache_size,
+                "statement_cache_size": statement_cache_size,
+            }
+
+        engine = create_async_engine(
+            db_url,
+            echo=False,  # set to True to see the SQL queries in the console on fastapi
+            poolclass=InstrumentedQueuePool,
+            connect_args=connect_args,
+            **pool_options,
+        )
+
+        pool_metrics = PoolMetrics()
+        pool_metrics.attach(engine.sync_engine.pool)
+        engine.sync_engine.pool.metrics = pool_metrics
+        return engine, pool_metrics
+
+    def _get_engine_pool_stats(self, engine: AsyncEngine, pool_metrics: PoolMetrics) -> dict[str, Any]:
+        """
+        pool size and occupancy of an engine with its checkout counters and wait times
+        """
+        pool = engine.sync_engine.pool
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout(),
+            **pool_metrics.get_stats(),
+        }
+
+
+database = Database(
+    config_manager.DATABASE_URI,
+    replica_urls=config_manager.DATABASE_REPLICA_URIS,
+    replica_policy=config_manager.DB_REPLICA_POLICY,
+    read_your_writes_seconds=config_manager.DB_READ_YOUR_WRITES_SECONDS,
+    pool_size=config_manager.DB_POOL_SIZE,
+    max_overflow=config_manager.DB_MAX_OVERFLOW,
+    pool_timeout=config_manager.DB_POOL_TIMEOUT,
+    pool_recycle=config_manager.DB_POOL_RECYCLE,
+    pool_pre_ping=config_manager.DB_POOL_PRE_PING,
+    statement_cache_size=config_manager.DB_STATEMENT_CACHE_SIZE,
+)
@@ -4,6 +4,7 @@ Author: Tom Aston
 """
 
 import logging
+from typing import NamedTuple
 
 from fastapi import Depends, Request
 from fastapi.security import HTTPBearer
@@ -18,7 +19,7 @@ from app.errors import (
     InvalidTokenException,
     RefreshTokenException,
 )
-from app.models.user import User, UserRole
+from app.models.user import User
 from app.service.user_service import UserService
 
 from .auth import decode_token
@@ -41,36 +42,46 @@ class TokenBearer(HTTPBearer):
     async def __call__(self, request: Request) -> HTTPAuthorizationCredentials | None:
         """
         Override the __call__ method
+
+        the token is decoded and checked against the blocklist once per request, every bearer and dependency of
+        the request reuses the token data kept on request.state
         """
         credentials = await super().__call__(request)
 
         # credentials.credentials are the token itself i.e. the JWT token itself with header and payload
         token = credentials.credentials
 
-        if not self.validate_token(token):
-            raise InvalidTokenException()
+        token_data = self.get_token_data(request, token)
+        if token_data is None:
+            token_data = decode_token(token)
+
+            if token_data is None:
+                raise InvalidTokenException()
 
-        token_data = decode_token(token)
+            if await is_jti_blacklisted(token_data["jti"]):
+                raise InvalidTokenException()
 
-        if await is_jti_blacklisted(token_data["jti"]):
-            raise InvalidTokenException()
+            request.state.token = (token, token_data)
 
         self.verify_token_data(token_data)
 
         return token_data
 
-    def validate_token(self, token: str) -> bool:
+    def get_token_data(self, request: Request, token: str) -> dict | None:
         """
-        Validate the token
+        Get the token data already decoded for this request
 
         Parameters:
+        - request: Request: current request
         - token: str: JWT token
 
         Returns:
-        - bool: True if token is valid, False otherwise
+        - dict: token data, None if the token has not been decoded for this request
         """
-        token_data = decode_token(token)
-        return token_data is not None
+        decoded = getattr(request.state, "token", None)
+        if decoded is not None and decoded[0] == token:
+            return decoded[1]
+        return None
 
     def verify_token_data(self, token_data: dict) -> None:
         """
@@ -125,21 +136,56 @@ class RefreshTokenBearer(TokenBearer):
             raise RefreshTokenException()
 
 
+access_token_bearer = AccessTokenBearer()
+
+
+class AuthContext(NamedTuple):
+    """
+    the authenticated user as carried by the signed claims of the access token
+
+    role is None for tokens issued before the role was added to the claims
+    """
+
+    user_id: int
+    email: str
+    role: str | None
+    token: dict
+
+
+async def get_auth_context(token: dict = Depends(access_token_bearer)) -> AuthContext:
+    """
+    Get the authenticated user from the access token claims without touching the database
+
+    Parameters:
+    - token: dict: token data
+
+    Returns:
+    - AuthContext: user id, email and role of the current user
+    """
+    user_data = token["user"]
+    return AuthContext(user_id=user_data["id"], email=user_data["email"], role=user_data.get("role"), token=token)
+
+
 async def get_current_user(
-    token: dict = Depends(AccessTokenBearer()),
+    request: Request,
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(database.get_db),
 ) -> User:
     """
-    Get the current user
+    Get the current user, only for routes that need the full user row
+
+    the user is loaded once per request and kept on request.state
 
     Parameters:
-    - token: dict: token data
+    - auth: AuthContext: claims of the current user
 
     Returns:
-    - dict: user data
+    - User: user data
     """
-    user_email = token["user"]["email"]
-    user = await user_service.get_by_email(email=user_email, db=db)
+    user = getattr(request.state, "user", None)
+    if user is None:
+        user = await user_service.get_by_email(email=auth.email, db=db)
+        request.state.user = user
     return user
 
 
@@ -154,14 +200,24 @@ class RoleChecker:
         """
         self.allowed_roles = allowed_roles
 
-    async def __call__(self, user: User = Depends(get_current_user)) -> bool:
+    async def __call__(
+        self,
+        request: Request,
+        auth: AuthContext = Depends(get_auth_context),
+        db: AsyncSession = Depends(database.get_db),
+    ) -> bool:
         """
         Override the __call__ method
+
+        the role is read from the signed token claims, the user is only loaded for tokens without a role claim
         """
-        user_role: UserRole = user.role
+        user_role = auth.role
+        if user_role is None:
+            user: User = await get_current_user(request, auth, db)
+            user_role = user.role.value
 
         # check if the current user role is in the allowed roles, if not raise a 403 Forbidden error
-        if user_role.value not in self.allowed_roles:
+        if user_role not in self.allowed_roles:
             raise InsufficientPermissionsException()
 
         return True
@@ -0,0 +1,230 @@
+"""
+NLP Executor
+Author: Tom Aston
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from app.core.config import config_manager
+from app.errors import NLPExecutorBusyException
+from app.nlp import tasks
+
+logger = logging.getLogger("uvicorn")
+
+
+class NLPExecutor:
+    """
+    class to run CPU bound NLP work off the event loop
+
+    Tasks run in a process pool whose workers are started with an initializer, so each worker loads the NLP model
+    once and keeps it for every task it runs. With max_workers == 0 tasks run on a thread in this process instead.
+
+    Backpressure:
+        - at most max_in_flight tasks are submitted to the pool at once, the rest wait their turn
+        - at most max_pending tasks may wait, beyond that NLPExecutorBusyException is raised so callers fail
+          fast with a 503 rather than queueing unbounded work behind a saturated pool
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_pending: int,
+        max_in_flight: int | None = None,
+        initializer: Callable[..., None] | None = None,
+        initargs: tuple = (),
+        start_method: str = "spawn",
+    ) -> None:
+        """
+        constructor for NLPExecutor
+
+        Parameters:
+        - max_workers: int: number of worker processes, 0 runs tasks on a thread in this process
+        - max_pending: int: number of tasks allowed to wait for a free slot before new tasks are rejected
+        - max_in_flight: int: number of tasks submitted to the pool at once, defaults to 2 * max_workers
+        - initializer: Callable: run once in every worker before its first task i.e. to load the NLP model
+        - initargs: tuple: arguments for the initializer
+        - start_method: str: multiprocessing start method, "spawn" avoids forking a process running an event loop
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight or 2 * max(max_workers, 1)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.start_method = start_method
+
+        self._pool: ProcessPoolExecutor | None = None
+        self._started = False
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._pending = 0
+        self._in_flight = 0
+        self._counters = {"completed": 0, "failed": 0, "rejected": 0}
+        self._timings: dict[str, dict[str, float]] = {}
+
+    @property
+    def pending(self) -> int:
+        """
+        number of tasks waiting for a free slot
+        """
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        """
+        number of tasks submitted to the pool and not yet finished
+        """
+        return self._in_flight
+
+    def start(self) -> None:
+        """
+        create the process pool, or initialize this process when running without workers
+        """
+        if self._started:
+            return
+
+        if self.max_workers > 0:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=self.initializer,
+                initargs=self.initargs,
+            )
+        elif self.initializer is not None:
+            self.initializer(*self.initargs)
+        self._started = True
+
+    async def warm_up(self, fn: Callable[[], Any]) -> None:
+        """
+        start every worker now so their models are loaded before the first request
+
+        the pool only starts a worker when a task is submitted and none is idle, so submitting one task per worker
+        at once starts them all
+        """
+        await asyncio.gather(*(self.run(fn) for _ in range(max(self.max_workers, 1))))
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        run a picklable module level function in the pool and await its result
+
+        Parameters:
+        - fn: Callable: function to run
+        - args: positional arguments for fn, which must be picklable
+
+        Returns:
+        - result of fn
+
+        Throws:
+        - NLPExecutorBusyException if max_pending tasks are already waiting
+        """
+        if self._pending >= self.max_pending and self._slots.locked():
+            self._counters["rejected"] += 1
+            raise NLPExecutorBusyException()
+
+        queued_at = time.perf_counter()
+        self._pending += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._pending -= 1
+
+        # started after waiting so a task queued while a broken pool was replaced runs in the new pool
+        self.start()
+
+        started_at = time.perf_counter()
+        self._in_flight += 1
+        pool = self._pool
+        try:
+            if pool is None:
+                result = await asyncio.to_thread(fn, *args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            self._counters["completed"] += 1
+            return result
+        except BrokenProcessPool:
+            self._counters["failed"] += 1
+            # a worker died, replace the pool so later tasks are not failed with it, unless another task that
+            # failed with the same pool has already replaced it
+            if self._pool is pool:
+                logger.exception("NLP executor process pool is broken, restarting it")
+                self.shutdown(wait=False)
+            raise
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+            self._record(fn.__name__, started_at - queued_at, time.perf_counter() - started_at)
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        queue depth, task counters and per task timings
+
+        Returns:
+        - dict: workers, pending, in_flight, completed, failed, rejected and for each task name its count and
+          mean / max queue wait and run time in milliseconds
+        """
+        tasks_stats = {
+            name: {
+                "count": int(timing["count"]),
+                "mean_wait_ms": 1000 * timing["wait_total"] / timing["count"],
+                "max_wait_ms": 1000 * timing["wait_max"],
+                "mean_run_ms": 1000 * timing["run_total"] / timing["count"],
+                "max_run_ms": 1000 * timing["run_max"],
+            }
+            for name, timing in self._timings.items()
+        }
+        return {
+            "workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "in_flight": self._in_flight,
+            **self._counters,
+            "tasks": tasks_stats,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        stop the worker processes, the pool is recreated on the next task
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+        self._pool = None
+        self._started = False
+
+    def _record(self, name: str, wait_seconds: float, run_seconds: float) -> None:
+        """
+        add a finished task's queue wait and run time to its timings
+        """
+        timing = self._timings.setdefault(
+            name, {"count": 0, "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0, "run_max": 0.0}
+        )
+        timing["count"] += 1
+        timing["wait_total"] += wait_seconds
+        timing["wait_max"] = max(timing["wait_max"], wait_seconds)
+        timing["run_total"] += run_seconds
+        timing["run_max"] = max(timing["run_max"], run_seconds)
+
+
+nlp_executor = NLPExecutor(
+    max_workers=config_manager.NLP_EXECUTOR_WORKERS,
+    max_pending=config_manager.NLP_EXECUTOR_MAX_PENDING,
+    max_in_flight=config_manager.NLP_EXECUTOR_MAX_IN_FLIGHT,
+    initializer=tasks.initialize_worker,
+    initargs=(
+        {
+            "backend": config_manager.NLP_EMBEDDING_BACKEND,
+            "model_name": config_manager.NLP_SPACY_MODEL,
+            "vectors_only": config_manager.NLP_VECTORS_ONLY,
+            "batch_size": config_manager.NLP_PIPE_BATCH_SIZE,
+            "n_process": config_manager.NLP_PIPE_N_PROCESS,
+        },
+    ),
+    start_method=config_manager.NLP_EXECUTOR_START_METHOD,
+)
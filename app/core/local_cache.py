@@ -0,0 +1,96 @@
+"""
+Local Cache
+Author: Tom Aston
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class LocalCache:
+    """
+    class to cache values in process with a time to live and least recently used eviction
+
+    Entries expire ttl seconds after they are set and once max_size entries are held the least recently read
+    entry is evicted. Expired entries are removed lazily when they are read or reach the end of the LRU order.
+    The cache is not thread safe and is meant to be used from a single event loop.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        constructor for LocalCache
+
+        Parameters:
+        - max_size: int: number of entries held before the least recently used is evicted
+        - ttl: float: seconds an entry is served for after it is set
+        - clock: Callable: monotonic time source in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any | None:
+        """
+        get an unexpired value, marking it most recently used
+
+        Returns:
+        - the cached value, None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self.clock():
+            del self._entries[key]
+            self._stats["expirations"] += 1
+            entry = None
+
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        set a value, evicting the least recently used entries if the cache is full
+        """
+        if self.max_size < 1:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def delete(self, key: str) -> bool:
+        """
+        remove a value
+
+        Returns:
+        - bool: True if the key was cached, False otherwise
+        """
+        return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """
+        remove every value
+        """
+        self._entries.clear()
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        hits, misses, evictions, expirations, size and hit ratio
+        """
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+        }
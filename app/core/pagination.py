@@ -3,37 +3,98 @@ Pagination deps for the FastAPI app
 Author: Tom Aston
 """
 
+import base64
+import binascii
+import json
 from enum import Enum
+from typing import Literal, NamedTuple, Optional
 
 from fastapi import Query
 from pydantic import BaseModel
 
+from app.errors import InvalidCursorException
+
 
 class SortEnum(Enum):
     ASC = "asc"
     DESC = "desc"
 
 
+class PageCursor(NamedTuple):
+    """
+    position in a keyset paginated listing, the id of the first or last document of a page
+    """
+
+    id: int
+    direction: Literal["next", "prev"]
+    order: SortEnum
+
+
 class Pagination(BaseModel):
     perPage: int
     page: int
     order: SortEnum
+    cursor: Optional[PageCursor] = None
+
+
+def encode_cursor(cursor: PageCursor) -> str:
+    """
+    Encode a cursor as an opaque url safe string
+
+    Parameters:
+    - cursor: PageCursor: position to encode
+
+    Returns:
+    - str: base64 encoded cursor
+    """
+    data = json.dumps({"id": cursor.id, "d": cursor.direction, "o": cursor.order.value}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> PageCursor:
+    """
+    Decode a cursor returned by encode_cursor
+
+    Parameters:
+    - cursor: str: base64 encoded cursor
+
+    Returns:
+    - PageCursor: decoded position
+
+    Throws:
+    - InvalidCursorException if the cursor was not produced by encode_cursor
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["d"] not in ("next", "prev"):
+            raise ValueError(data["d"])
+        return PageCursor(id=int(data["id"]), direction=data["d"], order=SortEnum(data["o"]))
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError):
+        raise InvalidCursorException()
 
 
 def pagination_params(
     page: int = Query(ge=1, required=False, default=1),
     perPage: int = Query(ge=1, le=100, required=False, default=10),
     order: SortEnum = SortEnum.DESC,
+    cursor: Optional[str] = Query(required=False, default=None),
 ) -> Pagination:
     """
     Get pagination parameters
 
     Parameters:
-    - page: int: page number
+    - page: int: page number, only used without a cursor, prefer cursors as deep pages are slow to skip to
     - perPage: int: number of items per page
     - order: SortEnum: order of items
+    - cursor: str: next_cursor or prev_cursor of a previous page
 
     Returns:
     - Pagination: pagination parameters
+
+    Throws:
+    - InvalidCursorException if the cursor is invalid or was issued for the other order
     """
-    return Pagination(perPage=perPage, page=page, order=order)
+    page_cursor = decode_cursor(cursor) if cursor is not None else None
+    if page_cursor is not None and page_cursor.order != order:
+        raise InvalidCursorException()
+    return Pagination(perPage=perPage, page=page, order=order, cursor=page_cursor)
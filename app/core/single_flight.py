@@ -0,0 +1,57 @@
+"""
+Single Flight
+Author: Tom Aston
+"""
+
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    class to coalesce concurrent calls for the same key so only one of them runs
+
+    The first caller for a key runs the function, every caller arriving while it runs awaits the same result or
+    exception. Nothing is remembered once the call finishes, the next caller for the key runs it again.
+    """
+
+    def __init__(self) -> None:
+        """
+        constructor for SingleFlight
+        """
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        run fn for key unless a call for key is already running, in which case wait for its result
+
+        fn runs in a task of its own that every caller, the first included, awaits through a shield, so a
+        cancelled caller stops waiting without cancelling the call the other callers are waiting on
+
+        Parameters:
+        - key: str: key calls are coalesced on
+        - fn: Callable: async function computing the result
+
+        Returns:
+        - the result of fn
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        """
+        forget a finished call, marking its exception retrieved in case every caller stopped waiting
+        """
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
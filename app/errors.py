@@ -82,6 +82,22 @@ class InsufficientPermissionsException(AppException):
     pass
 
 
+class InvalidCursorException(AppException):
+    """
+    Raised when a pagination cursor cannot be decoded
+    """
+
+    pass
+
+
+class NLPExecutorBusyException(AppException):
+    """
+    Raised when too many NLP tasks are already waiting for a worker
+    """
+
+    pass
+
+
 def create_exception_hander(status_code: int, detail: Any) -> Callable[[Request, Exception], JSONResponse]:
     """
     Factory function that creates an exception handler for a given status code and detail
@@ -135,3 +151,11 @@ def register_all_errors(app: FastAPI) -> None:
         InsufficientPermissionsException,
         create_exception_hander(status.HTTP_403_FORBIDDEN, "Insufficient permissions"),
     )
+    app.add_exception_handler(
+        NLPExecutorBusyException,
+        create_exception_hander(status.HTTP_503_SERVICE_UNAVAILABLE, "NLP workers are busy, try again later"),
+    )
+    app.add_exception_handler(
+        InvalidCursorException,
+        create_exception_hander(status.HTTP_400_BAD_REQUEST, "Invalid pagination cursor"),
+    )
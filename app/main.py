@@ -10,12 +10,41 @@ App entry point
 Author: Tom Aston
 """
 
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 
 from app.api.routes import routers
+from app.core.cache import (
+    start_invalidation_listener,
+    start_revocation_listener,
+    stop_invalidation_listener,
+    stop_revocation_listener,
+)
 from app.core.config import config_manager
+from app.core.executor import nlp_executor
 from app.errors import register_all_errors
 from app.middleware import register_middleware
+from app.nlp import tasks
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    application startup and shutdown hooks
+    """
+    start_invalidation_listener()
+    start_revocation_listener()
+    nlp_executor.start()
+    if config_manager.NLP_WARM_UP_ON_STARTUP:
+        await nlp_executor.warm_up(tasks.warm_up)
+
+    yield
+
+    nlp_executor.shutdown()
+    await stop_invalidation_listener()
+    await stop_revocation_listener()
 
 
 class AppCreator:
@@ -28,6 +57,7 @@ class AppCreator:
             title=config_manager.PROJECT_NAME,
             version=config_manager.VERSION,
             description=config_manager.PROJECT_DESCRIPTION,
+            lifespan=lifespan,
         )
 
         @self.app.get("/", tags=["root"])
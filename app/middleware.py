@@ -4,6 +4,7 @@ Author: Tom Aston
 """
 
 import logging
+import math
 import time
 from typing import Callable
 
@@ -13,9 +14,26 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.requests import Request
 from fastapi.responses import Response
 
+from app.core.config import config_manager
+from app.core.database import ClientWrites, client_writes
+
 logger = logging.getLogger("uvicorn.access")
 logger.disabled = True
 
+# cookie carrying the wall clock time of the client's last write, see ClientWrites
+LAST_WRITE_COOKIE = "last_write"
+
+
+def parse_last_write(value: str | None) -> float | None:
+    """
+    time of the client's last write from its cookie, None if it is missing or malformed
+    """
+    try:
+        last_write = float(value)
+    except (TypeError, ValueError):
+        return None
+    return last_write if math.isfinite(last_write) else None
+
 
 def register_middleware(app: FastAPI) -> None:
     """
@@ -40,6 +58,30 @@ def register_middleware(app: FastAPI) -> None:
 
         return response
 
+    # Add read your writes middleware
+    @app.middleware("http")
+    async def read_your_writes(request: Request, call_next: Callable[[Request], Response]) -> Response:
+        """
+        Pin a client's replica reads to the primary for a while after it writes, on whichever worker serves it
+        """
+        writes = ClientWrites(parse_last_write(request.cookies.get(LAST_WRITE_COOKIE)))
+        token = client_writes.set(writes)
+        try:
+            response: Response = await call_next(request)
+        finally:
+            client_writes.reset(token)
+
+        if writes.wrote:
+            response.set_cookie(
+                LAST_WRITE_COOKIE,
+                str(writes.last_write),
+                max_age=max(1, math.ceil(config_manager.DB_READ_YOUR_WRITES_SECONDS)),
+                httponly=True,
+                samesite="lax",
+            )
+
+        return response
+
     # Add CORS middleware
     app.add_middleware(
         CORSMiddleware,
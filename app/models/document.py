@@ -3,7 +3,7 @@ Document Model
 Author: Tom Aston
 """
 
-from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, String
+from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, LargeBinary, String
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -23,6 +23,10 @@ class Document(BaseModel):
     description = Column(String, index=False)
     created = Column(TIMESTAMP, server_default=func.now())
 
+    # float32 document vector and the model@version it was computed with
+    embedding = Column(LargeBinary, nullable=True)
+    embedding_model = Column(String, nullable=True)
+
     user_id = Column(Integer, ForeignKey("user.id"), nullable=True)
 
     owner = relationship("User", back_populates="documents")
@@ -0,0 +1,156 @@
+"""
+Document Embedding
+Author: Tom Aston
+"""
+
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from app.nlp.embedding_engine import DEFAULT_BATCH_SIZE, DEFAULT_SPACY_MODEL, EmbeddingEngine, SpacyEmbeddingEngine
+from app.nlp.preprocess import TextPreprocessor
+from app.nlp.similarity_calculator import SimilarityCalculator
+from app.nlp.static_vector_embedder import StaticVectorEmbedder
+
+EMBEDDING_DTYPE = np.float32
+
+
+class DocumentEmbedding(NamedTuple):
+    """
+    embedding as stored on the document table
+    """
+
+    embedding: bytes
+    embedding_model: str
+
+
+def vector_to_bytes(vector: np.ndarray) -> bytes:
+    """
+    convert a vector to compact float32 bytes for storage
+    """
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def bytes_to_vector(data: bytes) -> np.ndarray:
+    """
+    convert stored float32 bytes back to a read only vector without copying
+    """
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+
+
+def get_document_text(title: str, content: str) -> str:
+    """
+    text a document is embedded from, the title followed by its contents
+    """
+    return f"{title} {content}"
+
+
+def create_embedding_engine(
+    backend: str = "spacy",
+    model_name: str = DEFAULT_SPACY_MODEL,
+    vectors_only: bool = True,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    n_process: int = 1,
+) -> EmbeddingEngine:
+    """
+    create an embedding engine
+
+    Parameters:
+    - backend: str: "spacy" to embed through nlp.pipe or "static" to look token vectors up directly
+    - model_name: str: name of an installed spaCy model
+    - vectors_only: bool: load the model without the components vectors do not need, spacy backend only
+    - batch_size: int: number of texts per nlp.pipe batch, spacy backend only
+    - n_process: int: number of processes nlp.pipe uses, spacy backend only
+    """
+    if backend == "static":
+        return StaticVectorEmbedder(model_name=model_name)
+    if backend == "spacy":
+        return SpacyEmbeddingEngine(
+            model_name=model_name, vectors_only=vectors_only, batch_size=batch_size, n_process=n_process
+        )
+    raise ValueError(f"unknown embedding backend {backend}")
+
+
+class DocumentEmbedder:
+    """
+    class to compute the stored embedding of a document
+
+    the similarity calculator, and with it the spaCy model, is only created on first use
+    """
+
+    def __init__(
+        self,
+        calculator: SimilarityCalculator | None = None,
+        backend: str = "spacy",
+        model_name: str = DEFAULT_SPACY_MODEL,
+        vectors_only: bool = True,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+    ) -> None:
+        """
+        constructor for DocumentEmbedder
+
+        Parameters:
+        - calculator: SimilarityCalculator: calculator to embed with, built from the remaining options if not given
+        - backend: str: embedding engine, "spacy" or "static"
+        - model_name: str: name of an installed spaCy model
+        - vectors_only: bool: load the model without the components vectors do not need
+        - batch_size: int: number of texts per nlp.pipe batch
+        - n_process: int: number of processes nlp.pipe uses
+        """
+        self._calculator = calculator
+        self.backend = backend
+        self.model_name = model_name
+        self.vectors_only = vectors_only
+        self.batch_size = batch_size
+        self.n_process = n_process
+
+    @property
+    def calculator(self) -> SimilarityCalculator:
+        """
+        similarity calculator used to embed documents
+        """
+        if self._calculator is None:
+            engine = create_embedding_engine(
+                backend=self.backend,
+                model_name=self.model_name,
+                vectors_only=self.vectors_only,
+                batch_size=self.batch_size,
+                n_process=self.n_process,
+            )
+            self._calculator = SimilarityCalculator(TextPreprocessor(), model_name=self.model_name, engine=engine)
+        return self._calculator
+
+    @property
+    def model_id(self) -> str:
+        """
+        model name and version stored alongside every embedding
+        """
+        return self.calculator.model_id
+
+    def warm_up(self) -> None:
+        """
+        load the preprocessor and model now rather than on the first request
+        """
+        self.calculator.embed("")
+
+    def embed_document(self, title: str, content: str) -> DocumentEmbedding:
+        """
+        compute the embedding of a document from its title and contents
+        """
+        vector = self.calculator.embed(get_document_text(title, content))
+        return DocumentEmbedding(embedding=vector_to_bytes(vector), embedding_model=self.model_id)
+
+    def embed_documents(self, documents: Sequence[tuple[str, str]]) -> list[DocumentEmbedding]:
+        """
+        compute the embeddings of many documents in one batch
+
+        Parameters:
+        - documents: Sequence[tuple[str, str]]: (title, content) pairs
+
+        Returns:
+        - list[DocumentEmbedding]: embeddings in the same order as the input
+        """
+        vectors = self.calculator.embed_batch([get_document_text(title, content) for title, content in documents])
+        model_id = self.model_id
+        return [DocumentEmbedding(embedding=vector_to_bytes(vector), embedding_model=model_id) for vector in vectors]
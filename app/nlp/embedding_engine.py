@@ -0,0 +1,119 @@
+"""
+Embedding Engine
+Author: Tom Aston
+"""
+
+from typing import TYPE_CHECKING, Sequence
+
+import numpy as np
+
+from app.nlp.resources import NLPResources, nlp_resources
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+DEFAULT_SPACY_MODEL = "en_core_web_md"
+DEFAULT_BATCH_SIZE = 256
+
+# components of the en_core_web pipelines, none of which Doc.vector needs as it averages the static word vectors
+VECTORS_ONLY_EXCLUDE = (
+    "tok2vec",
+    "tagger",
+    "morphologizer",
+    "parser",
+    "senter",
+    "attribute_ruler",
+    "lemmatizer",
+    "ner",
+)
+
+
+class EmbeddingEngine:
+    """
+    base class for engines turning already cleaned text strings into document vectors
+    """
+
+    @property
+    def model_id(self) -> str:
+        """
+        model name and version the vectors are produced by
+        """
+        raise NotImplementedError("Method not implemented")
+
+    @property
+    def dim(self) -> int:
+        """
+        width of the vectors produced
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        embed cleaned text strings
+
+        Returns:
+        - np.ndarray: float32 matrix of shape (len(texts), dim)
+        """
+        raise NotImplementedError("Method not implemented")
+
+
+class SpacyEmbeddingEngine(EmbeddingEngine):
+    """
+    class to embed text with a spaCy pipeline through nlp.pipe
+
+    In vectors only mode the model is loaded without the tagger, parser, NER, lemmatizer or any other component,
+    leaving just the tokenizer and the static vectors table that Doc.vector is computed from.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_SPACY_MODEL,
+        vectors_only: bool = True,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+        resources: NLPResources = nlp_resources,
+    ) -> None:
+        """
+        constructor for SpacyEmbeddingEngine
+
+        Parameters:
+        - model_name: str: name of an installed spaCy model
+        - vectors_only: bool: load the model without the components vectors do not need
+        - batch_size: int: number of texts per nlp.pipe batch
+        - n_process: int: number of processes nlp.pipe uses
+        - resources: NLPResources: resource manager the model is loaded from
+        """
+        self.model_name = model_name
+        self.vectors_only = vectors_only
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.resources = resources
+
+    @property
+    def nlp(self) -> "Language":
+        """
+        spaCy pipeline, loaded once per process on first access
+        """
+        exclude = VECTORS_ONLY_EXCLUDE if self.vectors_only else ()
+        return self.resources.get_spacy_model(self.model_name, exclude=exclude)
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.model_name}@{self.nlp.meta.get('version', 'unknown')}"
+
+    @property
+    def dim(self) -> int:
+        return int(self.nlp.vocab.vectors_length)
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        embed cleaned text strings through nlp.pipe
+
+        Returns:
+        - np.ndarray: float32 matrix of shape (len(texts), dim)
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        docs = self.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+        for i, doc in enumerate(docs):
+            vectors[i] = doc.vector
+        return vectors
@@ -0,0 +1,61 @@
+"""
+Similarity Index Evaluation
+Author: Tom Aston
+"""
+
+import time
+
+import numpy as np
+
+from app.nlp.vector_index import SimilarityIndex
+
+
+def recall_at_k(approximate_index: SimilarityIndex, exact_index: SimilarityIndex, queries: np.ndarray, k: int) -> float:
+    """
+    fraction of the exact top k neighbours the approximate index also returns, averaged over queries
+
+    Parameters:
+    - approximate_index: SimilarityIndex: index under evaluation
+    - exact_index: SimilarityIndex: brute force index holding the same vectors
+    - queries: np.ndarray: matrix of query vectors
+    - k: int: number of neighbours per query
+
+    Returns:
+    - float: recall@k between 0 and 1
+    """
+    return evaluate_index(approximate_index, exact_index, queries, k)["recall"]
+
+
+def evaluate_index(
+    approximate_index: SimilarityIndex, exact_index: SimilarityIndex, queries: np.ndarray, k: int
+) -> dict[str, float]:
+    """
+    measure recall@k and query latency of an approximate index against exact search
+
+    Returns:
+    - dict: recall, mean and p95 latency in milliseconds of both indexes
+    """
+    hits = 0
+    expected = 0
+    approximate_latencies = []
+    exact_latencies = []
+
+    for query in queries:
+        start = time.perf_counter()
+        exact_ids = {match.id for match in exact_index.search(query, k)}
+        exact_latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        approximate_ids = {match.id for match in approximate_index.search(query, k)}
+        approximate_latencies.append((time.perf_counter() - start) * 1000)
+
+        hits += len(exact_ids & approximate_ids)
+        expected += len(exact_ids)
+
+    return {
+        "recall": hits / expected if expected else 1.0,
+        "approximate_mean_ms": float(np.mean(approximate_latencies)),
+        "approximate_p95_ms": float(np.percentile(approximate_latencies, 95)),
+        "exact_mean_ms": float(np.mean(exact_latencies)),
+        "exact_p95_ms": float(np.percentile(exact_latencies, 95)),
+    }
@@ -0,0 +1,305 @@
+"""
+IVF Vector Index
+Author: Tom Aston
+"""
+
+import heapq
+from typing import Sequence
+
+import numpy as np
+
+from app.nlp.vector_index import (
+    IndexSnapshot,
+    SimilarityIndex,
+    SimilarityMatch,
+    TrainedLists,
+    VectorIndex,
+    normalize_rows,
+)
+
+DEFAULT_N_LISTS = 256
+DEFAULT_N_PROBE = 8
+TRAINING_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 20
+ASSIGNMENT_CHUNK_SIZE = 65_536
+
+
+class IVFIndex(SimilarityIndex):
+    """
+    approximate nearest neighbour index using an inverted file with a k-means coarse quantizer
+
+    Vectors are partitioned into n_lists clusters by spherical k-means. A query is only scored against the
+    vectors of its n_probe closest clusters, so search cost is roughly n_probe / n_lists of an exact search.
+        - n_lists: more lists means smaller lists and faster searches at lower recall
+        - n_probe: more probed lists means higher recall at higher latency, n_probe == n_lists is exact search
+
+    Each inverted list is a VectorIndex so inserts and deletes stay O(1). Until train_threshold vectors have been
+    added the index is untrained and searches are exact. The quantizer is retrained once the index grows by
+    retrain_growth times the size it was trained at, or on demand with train().
+
+    k-means takes tens of seconds at a few hundred thousand vectors, so with background_training add_batch only
+    flags needs_training and the caller trains in three steps: snapshot() on the owning thread, fit() on any
+    thread as it touches no index state, then install() on the owning thread. Searches use the old quantizer
+    until install swaps the new lists in, replaying every add and remove made since the snapshot.
+    """
+
+    def __init__(
+        self,
+        n_lists: int = DEFAULT_N_LISTS,
+        n_probe: int = DEFAULT_N_PROBE,
+        train_threshold: int | None = None,
+        retrain_growth: float = 4.0,
+        seed: int = 0,
+        background_training: bool = False,
+    ) -> None:
+        """
+        constructor for IVFIndex
+
+        Parameters:
+        - n_lists: int: number of k-means clusters the vectors are partitioned into
+        - n_probe: int: number of closest clusters scored per query
+        - train_threshold: int: vectors needed before the quantizer is trained, defaults to 4 * n_lists
+        - retrain_growth: float: retrain once the index is this many times larger than when last trained
+        - seed: int: seed for k-means initialisation and training samples
+        - background_training: bool: leave training to the caller, add_batch only flags needs_training
+        """
+        if n_lists < 1 or n_probe < 1:
+            raise ValueError("n_lists and n_probe must be at least 1")
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold if train_threshold is not None else 4 * n_lists
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.background_training = background_training
+        self._generation = 0
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        remove all vectors and the trained quantizer
+        """
+        self.centroids: np.ndarray | None = None
+        self.trained_size = 0
+        self._lists: list[VectorIndex] = [VectorIndex(initial_capacity=16)]
+        self._list_of: dict[int, int] = {}
+        # ids added or removed since the last snapshot, None when no snapshot is being trained on
+        self._changed: set[int] | None = None
+        # lists trained before a clear are never installed
+        self._generation += 1
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._list_of)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._list_of
+
+    @property
+    def needs_training(self) -> bool:
+        """
+        True once the index has reached train_threshold untrained or grown by retrain_growth since it was trained
+        """
+        if not self.is_trained:
+            return len(self) >= self.train_threshold
+        return len(self) >= self.trained_size * self.retrain_growth
+
+    def add(self, id: int, title: str, vector: np.ndarray) -> None:
+        """
+        add a document vector, replacing any vector already stored for the id
+        """
+        self.add_batch([id], [title], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def add_batch(self, ids: Sequence[int], titles: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        add many document vectors at once, replacing any vectors already stored for the ids
+        """
+        vectors = normalize_rows(vectors)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids) or len(ids) != len(titles):
+            raise ValueError("ids, titles and vectors must have the same length")
+        if not len(ids):
+            return
+
+        # a replaced vector may now belong to a different list
+        for id in ids:
+            self.remove(id)
+        if self._changed is not None:
+            self._changed.update(ids)
+
+        assignments = self._assign(vectors) if self.is_trained else np.zeros(len(ids), dtype=np.int64)
+        for list_no in np.unique(assignments):
+            members = np.flatnonzero(assignments == list_no)
+            self._lists[list_no].add_batch(
+                [ids[i] for i in members], [titles[i] for i in members], vectors[members]
+            )
+            for i in members:
+                self._list_of[ids[i]] = int(list_no)
+
+        if not self.background_training and self.needs_training:
+            self.train()
+
+    def remove(self, id: int) -> bool:
+        """
+        remove a document vector
+
+        Returns:
+        - bool: True if the id was in the index, False otherwise
+        """
+        if self._changed is not None:
+            self._changed.add(id)
+        list_no = self._list_of.pop(id, None)
+        if list_no is None:
+            return False
+        return self._lists[list_no].remove(id)
+
+    def search(self, vector: np.ndarray, k: int) -> list[SimilarityMatch]:
+        """
+        find approximately the k documents most similar to a query vector by scoring the n_probe closest lists
+
+        Returns:
+        - list[SimilarityMatch]: matches ordered by descending cosine similarity
+        """
+        if not len(self) or k < 1:
+            return []
+
+        query = normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        if not self.is_trained:
+            return self._lists[0].search(query, k)
+
+        centroid_scores = self.centroids @ query
+        n_probe = min(self.n_probe, len(self._lists))
+        probed = np.argpartition(centroid_scores, -n_probe)[-n_probe:]
+
+        candidates = []
+        for list_no in probed:
+            candidates.extend(self._lists[list_no].search(query, k))
+        return heapq.nlargest(k, candidates, key=lambda match: match.score)
+
+    def train(self) -> None:
+        """
+        (re)train the coarse quantizer with spherical k-means and redistribute every vector into its closest list
+        """
+        self.install(self.fit(self.snapshot()))
+
+    def snapshot(self) -> IndexSnapshot:
+        """
+        copy every id, title and vector to train on, adds and removes from now on are replayed by install
+        """
+        self._changed = set()
+        return IndexSnapshot(self._generation, *self._collect())
+
+    def fit(self, snapshot: IndexSnapshot) -> TrainedLists | None:
+        """
+        train a quantizer on a snapshot and distribute its vectors into new lists
+
+        reads no index state beyond its settings, so it may run on another thread while the index is in use
+
+        Returns:
+        - TrainedLists: lists to install, None if the snapshot is empty
+        """
+        ids, titles, vectors = snapshot.ids, snapshot.titles, snapshot.vectors
+        if not len(ids):
+            return None
+
+        rng = np.random.default_rng(self.seed)
+        n_lists = min(self.n_lists, len(ids))
+        sample_size = min(len(ids), n_lists * TRAINING_POINTS_PER_LIST)
+        sample = vectors[rng.choice(len(ids), size=sample_size, replace=False)]
+
+        centroids = spherical_kmeans(sample, n_lists, KMEANS_ITERATIONS, rng)
+        lists = [VectorIndex(initial_capacity=16) for _ in range(n_lists)]
+        list_of: dict[int, int] = {}
+
+        assignments = assign_to_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        boundaries = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        for list_no in range(n_lists):
+            members = order[boundaries[list_no] : boundaries[list_no + 1]]
+            if not len(members):
+                continue
+            member_ids = [ids[i] for i in members]
+            lists[list_no].add_batch(member_ids, [titles[i] for i in members], vectors[members])
+            list_of.update(dict.fromkeys(member_ids, list_no))
+        return TrainedLists(snapshot.generation, centroids, lists, list_of)
+
+    def install(self, trained: TrainedLists | None) -> None:
+        """
+        swap trained lists in, replaying the adds and removes made since their snapshot
+
+        lists trained before the index was cleared are dropped
+        """
+        changed, self._changed = self._changed or set(), None
+        if trained is None or trained.generation != self._generation:
+            return
+
+        old_lists, old_list_of = self._lists, self._list_of
+        self.centroids = trained.centroids
+        self._lists, self._list_of = trained.lists, trained.list_of
+        self.trained_size = len(trained.list_of)
+
+        replayed: list[tuple[int, str, np.ndarray]] = []
+        for id in changed:
+            self.remove(id)
+            stored = old_lists[old_list_of[id]].get(id) if id in old_list_of else None
+            if stored is not None:
+                replayed.append((id, *stored))
+        if replayed:
+            ids, titles, vectors = zip(*replayed)
+            self.add_batch(list(ids), list(titles), np.stack(vectors))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        index of the closest centroid for each vector
+        """
+        return assign_to_centroids(vectors, self.centroids)
+
+    def _collect(self) -> tuple[list[int], list[str], np.ndarray]:
+        """
+        gather every id, title and vector currently stored across all lists
+        """
+        ids: list[int] = []
+        titles: list[str] = []
+        blocks = []
+        for inverted_list in self._lists:
+            if len(inverted_list):
+                ids.extend(int(id) for id in inverted_list.ids)
+                titles.extend(inverted_list.titles)
+                blocks.append(inverted_list.vectors)
+        vectors = np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+        return ids, titles, vectors
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    index of the highest cosine similarity centroid for each normalized vector, computed in chunks
+    so the score matrix stays bounded
+    """
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGNMENT_CHUNK_SIZE):
+        chunk = vectors[start : start + ASSIGNMENT_CHUNK_SIZE]
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    k-means on the unit sphere, centroids are the normalized mean of their members
+
+    empty clusters are re-seeded with random vectors so every list ends up in use
+    """
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        new_centroids = normalize_rows(sums)
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            break
+        centroids = new_centroids
+    return centroids
@@ -0,0 +1,118 @@
+"""
+Micro Batcher
+Author: Tom Aston
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Generic, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    class to coalesce concurrent requests into batches
+
+    Each submitted item waits until max_batch_size items are queued or max_wait_ms has passed since the first
+    item of the batch arrived, whichever comes first. The batch is then processed with one call and every
+    caller's future is resolved with its own result. A failed batch fails every caller in it.
+
+    With max_batch_size == 1 every item is processed on its own as soon as it is submitted.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list[T]], Awaitable[Sequence[R]]],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    ) -> None:
+        """
+        constructor for MicroBatcher
+
+        Parameters:
+        - process_batch: async callable returning one result per item, in the order of the items
+        - max_batch_size: int: number of items that triggers an immediate flush
+        - max_wait_ms: float: longest time the first item of a batch waits for others to join it
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: list[tuple[T, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._stats = {"items": 0, "batches": 0, "max_batch_size": 0}
+
+    async def submit(self, item: T) -> R:
+        """
+        add an item to the next batch and wait for its result
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((item, future))
+
+        if len(self._queue) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        number of items and batches processed, and the mean and largest batch size
+        """
+        batches = self._stats["batches"]
+        return {
+            **self._stats,
+            "mean_batch_size": self._stats["items"] / batches if batches else 0.0,
+            "queued": len(self._queue),
+        }
+
+    def _flush(self) -> None:
+        """
+        take up to max_batch_size queued items and process them in a background task
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._queue = self._queue[: self.max_batch_size], self._queue[self.max_batch_size :]
+        if self._queue:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_ms / 1000, self._flush)
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._process(batch))
+        # keep a reference so the task is not garbage collected before it finishes
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch: list[tuple[T, asyncio.Future]]) -> None:
+        """
+        process a batch and resolve the future of every item in it
+        """
+        self._stats["items"] += len(batch)
+        self._stats["batches"] += 1
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"process_batch returned {len(results)} results for {len(batch)} items")
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # the caller may have been cancelled while the batch was running
+            if not future.done():
+                future.set_result(result)
@@ -5,13 +5,12 @@ Author: Tom Aston
 
 import re
 import string
-from functools import reduce
+from functools import lru_cache, reduce
+from typing import Iterable
 
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
+from app.nlp.resources import NLPResources, nlp_resources
 
-nltk.download("stopwords")
+DEFAULT_STEM_CACHE_SIZE = 100_000
 
 
 class TextPreprocessor:
@@ -28,16 +27,64 @@ class TextPreprocessor:
         - remove whitespace
     """
 
-    def __init__(self):
+    def __init__(self, stem_cache_size: int = DEFAULT_STEM_CACHE_SIZE, resources: NLPResources = nlp_resources) -> None:
         """
         constructor for TextPreprocessor
+
+        Parameters:
+        - stem_cache_size: int: maximum number of words held in the LRU stem cache, 0 disables caching
+        - resources: NLPResources: resource manager the stopwords are loaded from
         """
+        # nltk is imported here rather than at module level as importing the package is slow
+        from nltk.stem import PorterStemmer
+
         self.stemmer = PorterStemmer()
 
+        # vocabularies are Zipfian so most tokens are repeats of a few thousand words,
+        # PorterStemmer holds no mutable state and lru_cache is thread safe so the cache can be shared by a pool
+        self._stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+        # lookup tables are built once here rather than on every call
+        self.punctuation_table = str.maketrans({key: None for key in string.punctuation})
+        self.digit_word_pattern = re.compile(r"\w*\d\w*")
+        self.stop_words = resources.get_stop_words("english")
+
     def get_cleaned_text(self, text: str) -> str:
         """
         public facing method for cleaning text strings for NLP models
         """
+        return " ".join(self._clean_tokens(text))
+
+    def get_cleaned_texts(self, texts: Iterable[str]) -> list[str]:
+        """
+        public facing method for cleaning a batch of text strings for NLP models
+
+        Parameters:
+        - texts: Iterable[str]: text strings to clean
+
+        Returns:
+        - list[str]: cleaned text strings in the same order as the input
+        """
+        clean_tokens = self._clean_tokens
+        return [" ".join(clean_tokens(text)) for text in texts]
+
+    def _clean_tokens(self, text: str) -> list[str]:
+        """
+        fused single pass equivalent of the stepwise pipeline
+
+        lower casing, punctuation and digit removal run as C level string operations over the whole text,
+        then stopword filtering and stemming are applied in one scan over the tokens
+        """
+        text = self.digit_word_pattern.sub("", text.lower().translate(self.punctuation_table))
+        stop_words = self.stop_words
+        stem = self._stem
+        return [stem(word) for word in text.split() if word not in stop_words]
+
+    def _get_cleaned_text_stepwise(self, text: str) -> str:
+        """
+        reference pipeline running each preprocessing step as a separate pass
+        used to check the fused pipeline produces identical output
+        """
         preprocess_steps = [
             self._lowercase_text,
             self._remove_punctuation,
@@ -58,21 +105,19 @@ class TextPreprocessor:
         """
         remove punctuation from text
         """
-        table = str.maketrans({key: None for key in string.punctuation})
-        return text.translate(table)
+        return text.translate(self.punctuation_table)
 
     def _remove_digits(self, text: str) -> str:
         """
         remove digits and words containing digits
         """
-        return re.sub(r"\w*\d\w*", "", text).strip()
+        return self.digit_word_pattern.sub("", text).strip()
 
     def _remove_stop_words(self, text: str) -> str:
         """
         remove stopwords from text inc. like 'the', 'and', 'or'
         """
-        stop_words = set(stopwords.words("english"))
-        return " ".join([word for word in str(text).split() if word not in stop_words])
+        return " ".join([word for word in str(text).split() if word not in self.stop_words])
 
     def _remove_whitespace(self, text: str) -> str:
         """
@@ -85,7 +130,30 @@ class TextPreprocessor:
         lemmatize text
         i.e. running -> run, ate -> eat
         """
-        return " ".join([self.stemmer.stem(word) for word in text.split()])
+        return " ".join([self._stem(word) for word in text.split()])
+
+    def get_stem_cache_stats(self) -> dict[str, int | float]:
+        """
+        get stem cache statistics
+
+        Returns:
+        - dict: hits, misses, current size, max size and hit ratio of the stem cache
+        """
+        info = self._stem.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hit_ratio": info.hits / lookups if lookups else 0.0,
+        }
+
+    def clear_stem_cache(self) -> None:
+        """
+        empty the stem cache and reset its hit and miss counters
+        """
+        self._stem.cache_clear()
 
 
 if __name__ == "__main__":
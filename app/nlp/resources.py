@@ -0,0 +1,130 @@
+"""
+NLP Resource Manager
+Author: Tom Aston
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+logger = logging.getLogger("uvicorn")
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+class NLPResources:
+    """
+    class to load NLP resources once per process
+
+    Resources are loaded on first use or on an explicit warm up, never at import time:
+        - stopwords are read from the vendored files in app/nlp/data so no network access is needed
+        - spaCy is only imported when the first model is requested
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR) -> None:
+        """
+        constructor for NLPResources
+
+        Parameters:
+        - data_dir: str: directory holding the vendored stopword files
+        """
+        self.data_dir = data_dir
+        self.load_timings: dict[str, float] = {}
+        self._resources: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get_stop_words(self, language: str = "english") -> frozenset[str]:
+        """
+        get the stopwords for a language
+
+        Parameters:
+        - language: str: language of the stopword list i.e. english
+
+        Returns:
+        - frozenset[str]: stopwords
+        """
+        return self._get_or_load(f"stopwords:{language}", lambda: self._read_stop_words(language))
+
+    def get_spacy_model(self, model_name: str, exclude: Iterable[str] = ()) -> "Language":
+        """
+        get a spaCy model, importing spaCy and loading the model on first use
+
+        Parameters:
+        - model_name: str: name of an installed spaCy model i.e. en_core_web_md
+        - exclude: Iterable[str]: pipeline components not to load, each distinct set is loaded separately
+
+        Returns:
+        - Language: loaded spaCy pipeline
+        """
+        exclude = tuple(sorted(exclude))
+        key = f"spacy:{model_name}" + (f":exclude={','.join(exclude)}" if exclude else "")
+        return self._get_or_load(key, lambda: self._load_spacy_model(model_name, exclude))
+
+    def is_loaded(self, key: str) -> bool:
+        """
+        check if a resource has been loaded i.e. "stopwords:english" or "spacy:en_core_web_md"
+        """
+        return key in self._resources
+
+    def warm_up(self, spacy_models: Iterable[str] = (), languages: Iterable[str] = ("english",)) -> dict[str, float]:
+        """
+        eagerly load resources so the first request does not pay the load cost
+
+        Parameters:
+        - spacy_models: Iterable[str]: spaCy models to load
+        - languages: Iterable[str]: stopword languages to load
+
+        Returns:
+        - dict[str, float]: load time in seconds of every resource loaded so far
+        """
+        for language in languages:
+            self.get_stop_words(language)
+        for model_name in spacy_models:
+            self.get_spacy_model(model_name)
+        return dict(self.load_timings)
+
+    def _get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        return a cached resource or load it exactly once, recording how long the load took
+        """
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            # another thread may have loaded the resource while we waited on the lock
+            if key in self._resources:
+                return self._resources[key]
+
+            start_time = time.perf_counter()
+            resource = loader()
+            self.load_timings[key] = time.perf_counter() - start_time
+            self._resources[key] = resource
+
+        logger.info(f"Loaded NLP resource {key} in {self.load_timings[key]:.3f}s")
+        return resource
+
+    def _read_stop_words(self, language: str) -> frozenset[str]:
+        """
+        read a vendored stopword file with one word per line
+        """
+        with open(os.path.join(self.data_dir, f"stopwords_{language}.txt"), encoding="utf-8") as file:
+            return frozenset(line.strip() for line in file if line.strip())
+
+    def _load_spacy_model(self, model_name: str, exclude: tuple[str, ...]) -> "Language":
+        """
+        import spaCy lazily and load a model
+        """
+        import spacy
+
+        if exclude:
+            return spacy.load(model_name, exclude=list(exclude))
+        return spacy.load(model_name)
+
+
+nlp_resources = NLPResources()
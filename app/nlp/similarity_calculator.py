@@ -3,21 +3,56 @@ Similarity Calculator
 Author: Tom Aston
 """
 
-import spacy
-from preprocess import TextPreprocessor
+from typing import Iterable
+
+import numpy as np
+
+from app.nlp.embedding_engine import DEFAULT_SPACY_MODEL, EmbeddingEngine, SpacyEmbeddingEngine
+from app.nlp.preprocess import TextPreprocessor
+from app.nlp.resources import NLPResources, nlp_resources
 
 
 class SimilarityCalculator:
     """
     class to calculate similarity between two text strings
+
+    text is cleaned by the preprocessor then embedded by an embedding engine, by default a vectors only
+    spaCy pipeline loaded lazily through the NLP resource manager on first use
     """
 
-    def __init__(self, preprocessor: TextPreprocessor) -> None:
+    def __init__(
+        self,
+        preprocessor: TextPreprocessor,
+        model_name: str = DEFAULT_SPACY_MODEL,
+        resources: NLPResources = nlp_resources,
+        engine: EmbeddingEngine | None = None,
+    ) -> None:
         """
         constructor for SimilarityCalculator
         """
         self.preprocessor = preprocessor
-        self.nlp = spacy.load("en_core_web_md")
+        self.model_name = model_name
+        self.resources = resources
+        self.engine = engine or SpacyEmbeddingEngine(model_name=model_name, resources=resources)
+
+    @property
+    def model_id(self) -> str:
+        """
+        model name and version the embeddings are produced by i.e. en_core_web_md@3.8.0
+        """
+        return self.engine.model_id
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        preprocess a text string and return its document vector as float32
+        """
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        preprocess text strings and return their document vectors as a float32 matrix
+        """
+        return self.engine.embed_batch(self.preprocessor.get_cleaned_texts(texts))
 
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """
@@ -30,12 +65,21 @@ class SimilarityCalculator:
 
     def _calculate_cosine_similarity(self, text1: str, text2: str) -> float:
         """
-        calculate the cosine similarity between two text strings
+        calculate the cosine similarity between two cleaned text strings
         """
-        vector1 = self.nlp(text1)
-        vector2 = self.nlp(text2)
+        vector1, vector2 = self.engine.embed_batch([text1, text2])
 
-        return vector1.similarity(vector2)
+        return cosine_similarity(vector1, vector2)
+
+
+def cosine_similarity(vector1: np.ndarray, vector2: np.ndarray) -> float:
+    """
+    cosine similarity of two vectors, 0.0 if either vector is all zeros as in spaCy's Doc.similarity
+    """
+    norm = float(np.linalg.norm(vector1)) * float(np.linalg.norm(vector2))
+    if norm == 0.0:
+        return 0.0
+    return float(np.dot(vector1, vector2) / norm)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""
+Similarity Matrix
+Author: Tom Aston
+"""
+
+import numpy as np
+
+from app.nlp.vector_index import normalize_rows
+
+DEFAULT_BLOCK_SIZE = 1024
+
+
+def similarity_matrix(rows: np.ndarray, columns: np.ndarray, block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """
+    full cosine similarity matrix between two sets of vectors
+
+    vectors are normalized once and the product is computed one block of rows at a time, so apart from the
+    output only a block_size x len(columns) temporary is held
+
+    Returns:
+    - np.ndarray: float32 matrix of shape (len(rows), len(columns))
+    """
+    rows, columns = normalize_rows(rows), normalize_rows(columns)
+    matrix = np.empty((len(rows), len(columns)), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        np.matmul(rows[start : start + block_size], columns.T, out=matrix[start : start + block_size])
+    return matrix
+
+
+def top_k_similarities(
+    rows: np.ndarray,
+    columns: np.ndarray,
+    k: int,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    exclude_self: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    the k most similar columns for every row without materialising the full matrix
+
+    the product is computed in block_size x block_size tiles and a running top k per row is merged after each
+    tile, so memory stays bounded however many rows and columns there are
+
+    Parameters:
+    - rows: np.ndarray: matrix of row vectors
+    - columns: np.ndarray: matrix of column vectors
+    - k: int: number of columns kept per row
+    - block_size: int: tile size
+    - exclude_self: bool: rows and columns are the same vectors and row i should not match column i
+
+    Returns:
+    - np.ndarray: column indices of shape (len(rows), k) ordered by descending similarity
+    - np.ndarray: float32 similarities of the same shape
+    """
+    rows, columns = normalize_rows(rows), normalize_rows(columns)
+    k = min(k, len(columns) - 1 if exclude_self else len(columns))
+    top_indices = np.empty((len(rows), max(k, 0)), dtype=np.int64)
+    top_scores = np.empty((len(rows), max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return top_indices, top_scores
+
+    for row_start in range(0, len(rows), block_size):
+        row_block = rows[row_start : row_start + block_size]
+        best_indices = np.empty((len(row_block), 0), dtype=np.int64)
+        best_scores = np.empty((len(row_block), 0), dtype=np.float32)
+
+        for column_start in range(0, len(columns), block_size):
+            scores = row_block @ columns[column_start : column_start + block_size].T
+            if exclude_self:
+                row_ids = np.arange(row_start, row_start + len(row_block))
+                diagonal = row_ids - column_start
+                on_tile = (diagonal >= 0) & (diagonal < scores.shape[1])
+                scores[np.flatnonzero(on_tile), diagonal[on_tile]] = -np.inf
+
+            indices = np.broadcast_to(np.arange(column_start, column_start + scores.shape[1]), scores.shape)
+            candidate_scores = np.concatenate([best_scores, scores], axis=1)
+            candidate_indices = np.concatenate([best_indices, indices], axis=1)
+
+            keep = min(k, candidate_scores.shape[1])
+            partition = np.argpartition(candidate_scores, -keep, axis=1)[:, -keep:]
+            best_scores = np.take_along_axis(candidate_scores, partition, axis=1)
+            best_indices = np.take_along_axis(candidate_indices, partition, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        top_scores[row_start : row_start + len(row_block)] = np.take_along_axis(best_scores, order, axis=1)
+        top_indices[row_start : row_start + len(row_block)] = np.take_along_axis(best_indices, order, axis=1)
+
+    return top_indices, top_scores
@@ -0,0 +1,110 @@
+"""
+Static Vector Embedder
+Author: Tom Aston
+"""
+
+from typing import TYPE_CHECKING, Sequence
+
+import numpy as np
+
+from app.nlp.embedding_engine import DEFAULT_SPACY_MODEL, VECTORS_ONLY_EXCLUDE, EmbeddingEngine
+from app.nlp.resources import NLPResources, nlp_resources
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+OOV_ROW = -1
+
+
+class StaticVectorEmbedder(EmbeddingEngine):
+    """
+    class to embed already cleaned text straight from a spaCy model's static vectors table
+
+    Only the model's tokenizer runs, so contractions, unicode punctuation and whitespace are split into the same
+    tokens as in a Doc. Each token is mapped to its row in the vectors table through a cached token to row
+    dictionary, and the document vectors of a whole batch are summed with one NumPy scatter add. Out of vocabulary
+    tokens count towards the mean as zero vectors, exactly as in Doc.vector.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_SPACY_MODEL,
+        resources: NLPResources = nlp_resources,
+    ) -> None:
+        """
+        constructor for StaticVectorEmbedder
+
+        Parameters:
+        - model_name: str: name of an installed spaCy model with static vectors
+        - resources: NLPResources: resource manager the model is loaded from
+        """
+        self.model_name = model_name
+        self.resources = resources
+        self._rows: dict[str, int] = {}
+
+    @property
+    def nlp(self) -> "Language":
+        """
+        vectors only spaCy pipeline, loaded once per process on first access
+        """
+        return self.resources.get_spacy_model(self.model_name, exclude=VECTORS_ONLY_EXCLUDE)
+
+    @property
+    def model_id(self) -> str:
+        # the backend is part of the id so switching engines marks stored embeddings as stale
+        return f"{self.model_name}@{self.nlp.meta.get('version', 'unknown')}+static"
+
+    @property
+    def dim(self) -> int:
+        return int(self.nlp.vocab.vectors_length)
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        embed cleaned text strings as the mean of their token vectors
+
+        Returns:
+        - np.ndarray: float32 matrix of shape (len(texts), dim)
+        """
+        vectors = self.nlp.vocab.vectors
+        if vectors.mode != "default":
+            raise ValueError(f"static vector lookup does not support {vectors.mode} vectors")
+
+        row_of = self._row_of
+        rows: list[int] = []
+        counts = np.zeros(len(texts), dtype=np.float32)
+        for i, doc in enumerate(self.nlp.tokenizer.pipe(texts)):
+            counts[i] = len(doc)
+            rows.extend(row_of(token.text) for token in doc)
+
+        doc_index = np.repeat(np.arange(len(texts)), counts.astype(np.int64))
+        rows_array = np.asarray(rows, dtype=np.int64)
+        in_vocabulary = rows_array != OOV_ROW
+
+        sums = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+        np.add.at(sums, doc_index[in_vocabulary], vectors.data[rows_array[in_vocabulary]])
+
+        # empty texts are left as zero vectors rather than divided by zero
+        np.divide(sums, counts[:, None], out=sums, where=counts[:, None] > 0)
+        return sums
+
+    def _row_of(self, token: str) -> int:
+        """
+        row of a token in the vectors table, OOV_ROW if it has no vector, cached per token
+        """
+        row = self._rows.get(token)
+        if row is None:
+            vocab = self.nlp.vocab
+            # vectors are keyed on the lexeme attribute the table was built with, usually ORTH
+            key = vocab[token].norm if vocab.vectors.attr == _norm_attribute() else vocab.strings[token]
+            row = int(vocab.vectors.find(key=key))
+            self._rows[token] = row
+        return row
+
+
+def _norm_attribute() -> int:
+    """
+    spaCy's NORM attribute id, imported lazily with spaCy
+    """
+    from spacy.attrs import NORM
+
+    return NORM
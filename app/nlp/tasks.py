@@ -0,0 +1,68 @@
+"""
+NLP Worker Tasks
+Author: Tom Aston
+
+Module level functions run in the NLP executor's worker processes. Each worker builds one DocumentEmbedder in
+initialize_worker and reuses it, with its preprocessor and spaCy model, for every task it runs.
+"""
+
+from typing import Any, Sequence
+
+import numpy as np
+
+from app.nlp.embedding import DocumentEmbedder, DocumentEmbedding
+
+_embedder: DocumentEmbedder | None = None
+
+
+def initialize_worker(embedder_options: dict[str, Any], warm_up: bool = True) -> None:
+    """
+    build the worker's document embedder and optionally load its model straight away
+
+    Parameters:
+    - embedder_options: dict: keyword arguments for DocumentEmbedder
+    - warm_up: bool: load the preprocessor and spaCy model now rather than on the first task
+    """
+    global _embedder
+    _embedder = DocumentEmbedder(**embedder_options)
+    if warm_up:
+        _embedder.warm_up()
+
+
+def get_embedder() -> DocumentEmbedder:
+    """
+    the worker's document embedder, a default one if the worker was not initialized
+    """
+    global _embedder
+    if _embedder is None:
+        _embedder = DocumentEmbedder()
+    return _embedder
+
+
+def warm_up() -> str:
+    """
+    load the worker's model, returning its model id
+    """
+    get_embedder().warm_up()
+    return get_model_id()
+
+
+def get_model_id() -> str:
+    """
+    model name and version embeddings are produced by
+    """
+    return get_embedder().model_id
+
+
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """
+    preprocess and embed query text strings as a float32 matrix
+    """
+    return get_embedder().calculator.embed_batch(texts)
+
+
+def embed_documents(documents: Sequence[tuple[str, str]]) -> list[DocumentEmbedding]:
+    """
+    compute the stored embeddings of (title, content) pairs
+    """
+    return get_embedder().embed_documents(documents)
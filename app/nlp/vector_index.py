@@ -0,0 +1,323 @@
+"""
+Vector Index
+Author: Tom Aston
+"""
+
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+
+
+class SimilarityMatch(NamedTuple):
+    """
+    a document returned by a similarity search
+    """
+
+    id: int
+    title: str
+    score: float
+
+
+class IndexSnapshot(NamedTuple):
+    """
+    copy of every vector in an index to train on
+    """
+
+    generation: int
+    ids: list[int]
+    titles: list[str]
+    vectors: np.ndarray
+
+
+class TrainedLists(NamedTuple):
+    """
+    quantizer and inverted lists trained on a snapshot, ready to be installed
+    """
+
+    generation: int
+    centroids: np.ndarray
+    lists: list["VectorIndex"]
+    list_of: dict[int, int]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2 normalize each row of a matrix as float32, rows of all zeros are left as zeros
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class SimilarityIndex:
+    """
+    base class for indexes answering top k cosine similarity queries over document vectors
+    """
+
+    def clear(self) -> None:
+        """
+        remove all vectors
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def __len__(self) -> int:
+        raise NotImplementedError("Method not implemented")
+
+    def __contains__(self, id: int) -> bool:
+        raise NotImplementedError("Method not implemented")
+
+    @property
+    def needs_training(self) -> bool:
+        """
+        True if the index should be trained with snapshot, fit and install, only trained indexes override it
+        """
+        return False
+
+    def snapshot(self) -> IndexSnapshot:
+        """
+        copy every id, title and vector to train on, adds and removes from now on are replayed by install
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def fit(self, snapshot: IndexSnapshot) -> TrainedLists | None:
+        """
+        train on a snapshot without touching the index
+
+        Returns:
+        - TrainedLists: lists to install, None if the snapshot is empty
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def install(self, trained: TrainedLists | None) -> None:
+        """
+        swap trained lists in, replaying the adds and removes made since their snapshot
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def add(self, id: int, title: str, vector: np.ndarray) -> None:
+        """
+        add a document vector, replacing any vector already stored for the id
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def add_batch(self, ids: Sequence[int], titles: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        add many document vectors at once, replacing any vectors already stored for the ids
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def remove(self, id: int) -> bool:
+        """
+        remove a document vector
+
+        Returns:
+        - bool: True if the id was in the index, False otherwise
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def search(self, vector: np.ndarray, k: int) -> list[SimilarityMatch]:
+        """
+        find the k documents most similar to a query vector
+
+        Returns:
+        - list[SimilarityMatch]: matches ordered by descending cosine similarity
+        """
+        raise NotImplementedError("Method not implemented")
+
+    def search_batch(self, vectors: np.ndarray, k: int) -> list[list[SimilarityMatch]]:
+        """
+        find the k documents most similar to each of many query vectors
+
+        Returns:
+        - list[list[SimilarityMatch]]: matches for each query in the same order as the queries
+        """
+        return [self.search(vector, k) for vector in vectors]
+
+
+class VectorIndex(SimilarityIndex):
+    """
+    class to hold document vectors in memory and answer exact top k cosine similarity queries
+
+    Vectors are L2 normalized on insert and kept in one contiguous float32 matrix, so a query is a single
+    matrix-vector product followed by argpartition. The matrix grows by doubling and deletes swap the last row
+    into the freed slot, keeping inserts and deletes O(1) amortised.
+    """
+
+    def __init__(self, initial_capacity: int = INITIAL_CAPACITY) -> None:
+        """
+        constructor for VectorIndex
+        """
+        self.initial_capacity = initial_capacity
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        remove all vectors, the dimension is set again by the next insert
+        """
+        self.dim: int | None = None
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._titles: list[str] = []
+        self._positions: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._positions
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        document ids in row order as a read only view
+        """
+        view = self._ids[: len(self)]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def titles(self) -> list[str]:
+        """
+        document titles in row order
+        """
+        return list(self._titles)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        normalized vectors currently in the index as a read only view
+        """
+        view = self._matrix[: len(self)]
+        view.flags.writeable = False
+        return view
+
+    def get(self, id: int) -> tuple[str, np.ndarray] | None:
+        """
+        title and normalized vector stored for a document, None if the id is not in the index
+        """
+        position = self._positions.get(id)
+        if position is None:
+            return None
+        return self._titles[position], self._matrix[position].copy()
+
+    def add(self, id: int, title: str, vector: np.ndarray) -> None:
+        """
+        add a document vector, replacing any vector already stored for the id
+        """
+        self.add_batch([id], [title], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def add_batch(self, ids: Sequence[int], titles: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        add many document vectors at once, replacing any vectors already stored for the ids
+
+        Parameters:
+        - ids: Sequence[int]: document ids
+        - titles: Sequence[str]: document titles
+        - vectors: np.ndarray: matrix of shape (len(ids), dim)
+        """
+        vectors = normalize_rows(vectors)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids) or len(ids) != len(titles):
+            raise ValueError("ids, titles and vectors must have the same length")
+        if not len(ids):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._matrix = np.empty((max(self.initial_capacity, len(ids)), self.dim), dtype=np.float32)
+            self._ids = np.empty(self._matrix.shape[0], dtype=np.int64)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+        self._reserve(len(self) + len(ids))
+
+        for id, title, vector in zip(ids, titles, vectors):
+            position = self._positions.get(id)
+            if position is None:
+                position = len(self._titles)
+                self._positions[id] = position
+                self._titles.append(title)
+                self._ids[position] = id
+            else:
+                self._titles[position] = title
+            self._matrix[position] = vector
+
+    def remove(self, id: int) -> bool:
+        """
+        remove a document vector
+
+        Returns:
+        - bool: True if the id was in the index, False otherwise
+        """
+        position = self._positions.pop(id, None)
+        if position is None:
+            return False
+
+        last = len(self._titles) - 1
+        if position != last:
+            # move the last row into the freed slot so the matrix stays contiguous
+            self._matrix[position] = self._matrix[last]
+            self._ids[position] = self._ids[last]
+            self._titles[position] = self._titles[last]
+            self._positions[int(self._ids[position])] = position
+        self._titles.pop()
+        return True
+
+    def search(self, vector: np.ndarray, k: int) -> list[SimilarityMatch]:
+        """
+        find the k documents most similar to a query vector
+
+        Returns:
+        - list[SimilarityMatch]: matches ordered by descending cosine similarity
+        """
+        size = len(self)
+        if not size or k < 1:
+            return []
+
+        query = normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        scores = self._matrix[:size] @ query
+        return self._top_k(scores, np.arange(size), k)
+
+    def search_batch(self, vectors: np.ndarray, k: int) -> list[list[SimilarityMatch]]:
+        """
+        find the k documents most similar to each of many query vectors with one matrix-matrix product
+
+        Returns:
+        - list[list[SimilarityMatch]]: matches for each query in the same order as the queries
+        """
+        size = len(self)
+        if not size or k < 1:
+            return [[] for _ in range(len(vectors))]
+
+        queries = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        scores = queries @ self._matrix[:size].T
+        positions = np.arange(size)
+        return [self._top_k(row_scores, positions, k) for row_scores in scores]
+
+    def _top_k(self, scores: np.ndarray, positions: np.ndarray, k: int) -> list[SimilarityMatch]:
+        """
+        select the k highest scores with argpartition and sort only those k
+        """
+        if k < len(scores):
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            SimilarityMatch(id=int(self._ids[positions[i]]), title=self._titles[positions[i]], score=float(scores[i]))
+            for i in top
+        ]
+
+    def _reserve(self, capacity: int) -> None:
+        """
+        grow the matrix by doubling until it can hold capacity rows
+        """
+        current = self._matrix.shape[0]
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        matrix[: len(self)] = self._matrix[: len(self)]
+        ids = np.empty(new_capacity, dtype=np.int64)
+        ids[: len(self)] = self._ids[: len(self)]
+        self._matrix, self._ids = matrix, ids
@@ -3,115 +3,322 @@ Document Repository Layer
 Author: Tom Aston
 """
 
-from sqlalchemy import asc, desc, func
+from typing import AsyncIterator, Awaitable, Callable, Sequence
+
+from pydantic import BaseModel
+from sqlalchemy import Row, Select, asc, delete, desc, func, insert, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from sqlalchemy.sql import select
 
 from app.core.pagination import Pagination, SortEnum
 from app.models.document import Document
-from app.models.user import User
+from app.models.user import User  # noqa: F401 registers the User mapper Document relates to
+from app.nlp.embedding import DocumentEmbedding
 from app.schema.document_schema import (
     DocumentCreateClientRequest,
     DocumentUpdateClientRequest,
 )
 
 
+def select_documents(schema: type[BaseModel] | None = None) -> Select:
+    """
+    select whole documents, or only the columns behind the fields of a response schema
+
+    a projected select returns plain rows rather than ORM objects, so the unused text and embedding columns are
+    neither transferred nor hydrated
+
+    Parameters:
+    - schema: type[BaseModel]: response schema whose fields are all document columns, None for whole documents
+    """
+    if schema is None:
+        return select(Document)
+    return select(*(getattr(Document, field) for field in schema.model_fields))
+
+
 class DocumentRepository:
     """
     document repository class
+
+    read methods take an optional response schema, given one they return rows of only its columns. Their queries
+    are marked use_replica so they run on a read replica when one is configured, see ReplicaRouter, reads whose
+    results are cached pass use_replica=False so a lagging replica never refills a cache after an invalidation
     """
 
-    async def get_all(self, db: AsyncSession) -> list[Document] | None:
+    async def get_all(
+        self, db: AsyncSession, schema: type[BaseModel] | None = None, use_replica: bool = True
+    ) -> Sequence[Document | Row]:
         """
         get all documents
         """
-        statement = select(Document).order_by(Document.id)
+        statement = select_documents(schema).order_by(Document.id).execution_options(use_replica=use_replica)
         result = await db.execute(statement)
-        return result.scalars().all()
+        return result.all() if schema else result.scalars().all()
 
-    async def get_all_paginated(self, db: AsyncSession, pagination: Pagination) -> tuple[list[Document], int] | None:
+    async def stream_all(self, db: AsyncSession, batch_size: int) -> AsyncIterator[Sequence[Document]]:
         """
-        get all documents paginated
+        stream all documents ordered by id in batches through a server side cursor
+
+        only batch_size rows are fetched from the cursor and held at a time, and the embedding is never loaded
+
+        Parameters:
+        - batch_size: int: rows fetched from the cursor per batch
 
         Returns:
-        - list of documents
-        - total count of documents
+        - async iterator of document batches
         """
-        order = desc if pagination.order == SortEnum.DESC else asc
         statement = (
             select(Document)
-            .limit(pagination.perPage)
-            .offset(pagination.page - 1 if pagination.page == 1 else (pagination.page - 1) * pagination.perPage)
-            .order_by(order(Document.id))
+            .options(load_only(Document.id, Document.title, Document.content, Document.description, Document.created))
+            .order_by(Document.id)
+            .execution_options(yield_per=batch_size)
         )
+        result = await db.stream_scalars(statement)
+        async for documents in result.partitions():
+            yield documents
+
+    async def get_all_paginated(
+        self, db: AsyncSession, pagination: Pagination, schema: type[BaseModel] | None = None
+    ) -> tuple[list[Document | Row], bool]:
+        """
+        get a page of documents
+
+        with a cursor the page is read by seeking the primary key index from the cursor id, so every page costs
+        the same as the first, without one the page number is skipped to with OFFSET
+
+        Returns:
+        - list of documents in the requested order
+        - True if there are more documents beyond the page in the direction of travel
+        """
+        cursor = pagination.cursor
+        backwards = cursor is not None and cursor.direction == "prev"
+        # a previous page is read by scanning away from the cursor in the opposite order and reversing
+        scan_ascending = (pagination.order == SortEnum.DESC) == backwards
+
+        statement = (
+            select_documents(schema)
+            .order_by(asc(Document.id) if scan_ascending else desc(Document.id))
+            .limit(pagination.perPage + 1)
+            .execution_options(use_replica=True)
+        )
+        if cursor is not None:
+            statement = statement.where(Document.id > cursor.id if scan_ascending else Document.id < cursor.id)
+        else:
+            statement = statement.offset((pagination.page - 1) * pagination.perPage)
+
         result = await db.execute(statement)
-        count_result = await db.execute(select(func.count()).select_from(select(Document.id).subquery()))
-        count = count_result.scalar_one()
-        return (result.scalars().all(), count)
+        documents = list(result.all() if schema else result.scalars().all())
+        has_more = len(documents) > pagination.perPage
+        documents = documents[: pagination.perPage]
+        if backwards:
+            documents.reverse()
+        return (documents, has_more)
 
-    async def get_by_id(self, id: int, db: AsyncSession) -> Document | None:
+    async def count_documents(self, db: AsyncSession, use_replica: bool = True) -> int:
+        """
+        count all documents
+        """
+        statement = select(func.count()).select_from(Document).execution_options(use_replica=use_replica)
+        result = await db.execute(statement)
+        return result.scalar_one()
+
+    async def get_by_id(
+        self, id: int, db: AsyncSession, schema: type[BaseModel] | None = None, use_replica: bool = True
+    ) -> Document | Row | None:
         """
         get a document by id number
         """
-        statement = select(Document).where(Document.id == id)
+        statement = select_documents(schema).where(Document.id == id).execution_options(use_replica=use_replica)
         result = await db.execute(statement)
-        return result.scalars().first()
+        return result.first() if schema else result.scalars().first()
 
-    async def get_by_title(self, title: str, db: AsyncSession) -> Document | None:
+    async def get_by_title(
+        self, title: str, db: AsyncSession, schema: type[BaseModel] | None = None, use_replica: bool = True
+    ) -> Document | Row | None:
         """
         get all documents by title
         """
-        statement = select(Document).where(Document.title == title)
+        statement = (
+            select_documents(schema).where(Document.title == title).execution_options(use_replica=use_replica)
+        )
         result = await db.execute(statement)
-        return result.scalars().first()
+        return result.first() if schema else result.scalars().first()
 
     async def update_document(
         self,
         id: int,
         document_update_body: DocumentUpdateClientRequest,
         db: AsyncSession,
-    ) -> Document:
+        embed: Callable[[str, str], Awaitable[DocumentEmbedding]] | None = None,
+    ) -> Document | None:
         """
-        update a document by id
+        update a document by id with one UPDATE ... RETURNING
+
+        the embedding is derived from the title and content so it is only recomputed when either changes. It is
+        computed before the UPDATE and written by the same statement, so no row lock or transaction is held while
+        it is computed. With only one of the two given the other is read first, in a transaction of its own
+
+        Parameters:
+        - embed: async callable computing the embedding of a (title, content) pair, called when either changes
         """
-        db_document = await self.get_by_id(id, db)
+        changes = {key: value for key, value in document_update_body.model_dump().items() if value is not None}
+
+        if embed is not None and ("title" in changes or "content" in changes):
+            title, content = changes.get("title"), changes.get("content")
+            if title is None or content is None:
+                # read from the primary, a replica may not have the latest title and content to embed yet
+                result = await db.execute(select(Document.title, Document.content).where(Document.id == id))
+                current = result.first()
+                if current is None:
+                    return None
+                # ends the read's transaction so no connection is held while embedding
+                await db.commit()
+                title = title if title is not None else current.title
+                content = content if content is not None else current.content
+            changes.update((await embed(title, content))._asdict())
+
+        if changes:
+            db_document = await self.__update_returning(id, changes, db)
+        else:
+            result = await db.execute(select(Document).where(Document.id == id))
+            db_document = result.scalars().first()
 
         if not db_document:
             return None
 
-        for key, value in document_update_body.model_dump().items():
-            if value is not None:
-                setattr(db_document, key, value)
-
         await db.commit()
-        await db.refresh(db_document)
+
+        if embed is not None and db_document.embedding is None:
+            # a document stored without an embedding, embedded once the update above has released its row lock
+            embedding = await embed(db_document.title, db_document.content)
+            db_document = await self.__update_returning(id, embedding._asdict(), db) or db_document
+            await db.commit()
 
         return db_document
 
     async def create_document(
-        self, document_body: DocumentCreateClientRequest, db: AsyncSession, user: User
+        self,
+        document_body: DocumentCreateClientRequest,
+        db: AsyncSession,
+        user_id: int | None,
+        embedding: DocumentEmbedding | None = None,
     ) -> Document:
         """
-        create a new document
+        create a new document, stored with its precomputed embedding
         """
         document_dict = document_body.model_dump()
-        document_dict["user_id"] = user.id
-        db_document = Document(**document_dict)
-        db.add(db_document)
+        document_dict["user_id"] = user_id
+        if embedding is not None:
+            document_dict.update(embedding._asdict())
+        # RETURNING brings back generated fields like id and created without a refresh
+        statement = insert(Document).values(**document_dict).returning(Document)
+        result = await db.execute(statement)
+        db_document = result.scalars().one()
         await db.commit()
-        await db.refresh(db_document)  # Refresh to get auto-generated fields like 'id'
         return db_document
 
-    async def delete_document(self, id: int, db: AsyncSession) -> Document | None:
+    async def create_documents(self, documents: list[dict], db: AsyncSession) -> Sequence[Row]:
         """
-        delete a document by id
+        insert many documents with one multi row INSERT ... RETURNING, the caller commits
+
+        Parameters:
+        - documents: list[dict]: column values of each document, every dict must have the same keys
+
+        Returns:
+        - rows of (id, title) in the same order as documents
         """
-        db_document = await self.get_by_id(id, db)
+        statement = insert(Document).returning(Document.id, Document.title, sort_by_parameter_order=True)
+        result = await db.execute(statement, documents)
+        return result.all()
+
+    async def delete_document(self, id: int, db: AsyncSession) -> Row | None:
+        """
+        delete a document by id with one DELETE ... RETURNING
+
+        Returns:
+        - row of the deleted document's (id, title), None if there was no document with the id
+        """
+        statement = delete(Document).where(Document.id == id).returning(Document.id, Document.title)
+        result = await db.execute(statement)
+        db_document = result.first()
 
         if not db_document:
             return None
 
-        await db.delete(db_document)
         await db.commit()
 
         return db_document
+
+    async def get_all_embeddings(self, db: AsyncSession, embedding_model: str) -> Sequence[Row]:
+        """
+        get the stored embeddings of all documents embedded with a given model
+
+        Returns:
+        - rows of (id, title, embedding) ordered by id
+        """
+        statement = (
+            select(Document.id, Document.title, Document.embedding)
+            .where(Document.embedding.is_not(None), Document.embedding_model == embedding_model)
+            .order_by(Document.id)
+        )
+        result = await db.execute(statement)
+        return result.all()
+
+    async def get_embeddings_by_ids(self, ids: list[int], db: AsyncSession) -> Sequence[Row]:
+        """
+        get the stored embeddings of documents by id
+
+        Returns:
+        - rows of (id, title, content, embedding, embedding_model)
+        """
+        statement = select(
+            Document.id, Document.title, Document.content, Document.embedding, Document.embedding_model
+        ).where(Document.id.in_(ids))
+        result = await db.execute(statement)
+        return result.all()
+
+    async def get_without_embedding(
+        self, db: AsyncSession, embedding_model: str, after_id: int, limit: int
+    ) -> Sequence[Row]:
+        """
+        get the next batch of documents with no embedding or an embedding from a different model
+
+        Returns:
+        - rows of (id, title, content) ordered by id
+        """
+        statement = (
+            select(Document.id, Document.title, Document.content)
+            .where(
+                Document.id > after_id,
+                or_(
+                    Document.embedding.is_(None),
+                    Document.embedding_model.is_(None),
+                    Document.embedding_model != embedding_model,
+                ),
+            )
+            .order_by(Document.id)
+            .limit(limit)
+        )
+        result = await db.execute(statement)
+        return result.all()
+
+    async def update_embeddings(self, embeddings: dict[int, DocumentEmbedding], db: AsyncSession) -> None:
+        """
+        bulk update the embeddings of documents by id
+        """
+        await db.execute(
+            update(Document),
+            [{"id": id, **embedding._asdict()} for id, embedding in embeddings.items()],
+        )
+        await db.commit()
+
+    async def __update_returning(self, id: int, values: dict, db: AsyncSession) -> Document | None:
+        """
+        update columns of a document and return it as updated, the caller commits
+
+        Returns:
+        - the updated document, None if there was no document with the id
+        """
+        statement = update(Document).where(Document.id == id).values(**values).returning(Document)
+        result = await db.execute(statement)
+        return result.scalars().first()
@@ -4,9 +4,9 @@ Author: Tom Aston
 """
 
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class DocumentCreateClientRequest(BaseModel):
@@ -34,9 +34,14 @@ class DocumentCreatedClientResponse(BaseModel):
 class PaginationClientResponse(BaseModel):
     """
     client response for pagination
+
+    pages is the number of documents, next_cursor and prev_cursor lead to the neighbouring pages and are None
+    at either end
     """
 
     pages: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
     items: list[DocumentCreatedClientResponse]
 
 
@@ -58,3 +63,85 @@ class DocumentGetByIdClientResponse(BaseModel):
     id: int
     title: str
     created: datetime
+
+
+class DocumentSimilarityClientRequest(BaseModel):
+    """
+    client request body for finding the documents most similar to a text
+    """
+
+    text: str = Field(min_length=1)
+    k: int = Field(default=10, ge=1, le=100)
+
+
+class DocumentSimilarityClientResponse(BaseModel):
+    """
+    client response for a document matched by a similarity search
+    """
+
+    id: int
+    title: str
+    score: float
+
+
+class SimilarityMatrixClientRequest(BaseModel):
+    """
+    client request body for comparing many texts and stored documents at once
+    """
+
+    texts: list[str] = Field(default_factory=list, max_length=1000)
+    document_ids: list[int] = Field(default_factory=list, max_length=1000)
+    top_k: Optional[int] = Field(default=None, ge=1)
+
+
+class SimilarityMatrixItem(BaseModel):
+    """
+    a row and column of the similarity matrix, either a request text by index or a stored document by id
+    """
+
+    kind: Literal["text", "document"]
+    index: Optional[int] = None
+    id: Optional[int] = None
+
+
+class SimilarityMatrixMatch(BaseModel):
+    """
+    a column matched by a row of a top k similarity matrix
+    """
+
+    column: int
+    score: float
+
+
+class SimilarityMatrixClientResponse(BaseModel):
+    """
+    client response for a similarity matrix
+
+    items are the rows and columns in order, texts first then documents. matrix holds every score unless top_k
+    was requested, in which case top_k holds each row's best matches excluding itself
+    """
+
+    items: list[SimilarityMatrixItem]
+    matrix: Optional[list[list[float]]] = None
+    top_k: Optional[list[list[SimilarityMatrixMatch]]] = None
+
+
+class BulkIngestError(BaseModel):
+    """
+    a JSONL line that could not be ingested
+    """
+
+    line: int
+    error: str
+
+
+class BulkIngestClientResponse(BaseModel):
+    """
+    client response for a bulk document ingestion
+    """
+
+    inserted: int
+    failed: int
+    seconds: float
+    rows_per_second: float
+    errors: list[BulkIngestError]
@@ -3,27 +3,221 @@ Document Service Layer
 Author: Tom Aston
 """
 
-import json
-from datetime import datetime
+import asyncio
+import logging
+import threading
+import time
+from typing import AsyncIterator, Callable
 
+import numpy as np
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.cache import add_docs_to_cache, get_docs_from_cache, is_docs_in_cache
-from app.core.pagination import Pagination
+from app.core.cache import (
+    add_document_to_cache,
+    document_write_handlers,
+    get_document_from_cache,
+    get_document_id_by_title_from_cache,
+    get_or_compute_document_list,
+    invalidate_document_in_cache,
+    invalidate_documents_in_cache,
+)
+from app.core.config import config_manager
+from app.core.database import database
+from app.core.executor import nlp_executor
+from app.core.pagination import PageCursor, Pagination, encode_cursor
 from app.errors import DocumentNotFoundException
 from app.models.document import Document
-from app.models.user import User
+from app.nlp import tasks
+from app.nlp.embedding import DocumentEmbedding, bytes_to_vector
+from app.nlp.ivf_index import IVFIndex
+from app.nlp.micro_batcher import MicroBatcher
+from app.nlp.similarity_matrix import similarity_matrix, top_k_similarities
+from app.nlp.vector_index import SimilarityIndex, SimilarityMatch, TrainedLists, VectorIndex
 from app.repository.document_repository import DocumentRepository
 from app.schema.document_schema import (
+    BulkIngestClientResponse,
+    BulkIngestError,
     DocumentCreateClientRequest,
     DocumentCreatedClientResponse,
     DocumentGetByIdClientResponse,
+    DocumentSimilarityClientRequest,
+    DocumentSimilarityClientResponse,
     DocumentUpdateClientRequest,
     PaginationClientResponse,
+    SimilarityMatrixClientRequest,
+    SimilarityMatrixClientResponse,
+    SimilarityMatrixItem,
+    SimilarityMatrixMatch,
 )
 
+logger = logging.getLogger("uvicorn")
+
+
+def create_similarity_index() -> SimilarityIndex:
+    """
+    create the similarity index configured by SIMILARITY_INDEX
+    """
+    if config_manager.SIMILARITY_INDEX == "ivf":
+        return IVFIndex(
+            n_lists=config_manager.IVF_N_LISTS, n_probe=config_manager.IVF_N_PROBE, background_training=True
+        )
+    return VectorIndex()
+
+
+async def search_similar_batch(queries: list[tuple[str, int]]) -> list[list[SimilarityMatch]]:
+    """
+    embed a batch of (text, k) similarity queries in one executor task and score them in one index search on a
+    worker thread, so the event loop keeps serving requests while the vectors are scored
+    """
+    vectors = await nlp_executor.run(tasks.embed_texts, [text for text, _ in queries])
+    matches = await asyncio.to_thread(search_similarity_index, vectors, max(k for _, k in queries))
+    return [query_matches[:k] for query_matches, (_, k) in zip(matches, queries)]
+
+
+def search_similarity_index(vectors: np.ndarray, k: int) -> list[list[SimilarityMatch]]:
+    """
+    search the similarity index while holding its guard, run on a worker thread
+    """
+    with similarity_index_guard:
+        return similarity_index.search_batch(vectors, k)
+
+
+async def split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    split a stream of UTF-8 bytes into lines without holding more than one chunk and a partial line
+    """
+    remainder = b""
+    async for chunk in chunks:
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if remainder:
+        yield remainder.decode("utf-8", errors="replace")
+
+
 document_repository = DocumentRepository()
 
+# serializes a whole list of documents to JSON bytes in one call
+document_list_adapter = TypeAdapter(list[DocumentGetByIdClientResponse])
+
+# model id of the NLP workers, fetched from a worker once
+embedding_model_state: dict[str, str | None] = {"model_id": None}
+
+# in process index of stored document vectors, loaded from the database on the first similarity search and kept
+# in step with writes through every worker by sync_similarity_index
+similarity_index = create_similarity_index()
+similarity_index_state: dict = {"loaded": False, "training": None}
+similarity_index_lock = asyncio.Lock()
+# held on worker threads only, by searches and by every change to the index, so a search never sees a half
+# applied change and the event loop never waits for a search to finish
+similarity_index_guard = threading.Lock()
+# applies changes to the index one at a time in the order they were made, see update_similarity_index
+similarity_index_write_lock = asyncio.Lock()
+
+
+async def update_similarity_index(change: Callable[[], None]) -> None:
+    """
+    apply a change to the similarity index on a worker thread under its guard, after every change made before it
+    """
+    async with similarity_index_write_lock:
+        await asyncio.to_thread(_apply_guarded, change)
+
+
+def _apply_guarded(change: Callable[[], None]) -> None:
+    """
+    apply a change to the similarity index while holding its guard, run on a worker thread
+    """
+    with similarity_index_guard:
+        change()
+
+
+def schedule_similarity_index_training() -> None:
+    """
+    train the similarity index on a background thread once it needs it, searches keep using the old quantizer
+    until the new lists are installed on the event loop
+    """
+    task = similarity_index_state["training"]
+    if (task is not None and not task.done()) or not similarity_index.needs_training:
+        return
+    similarity_index_state["training"] = asyncio.create_task(train_similarity_index())
+
+
+async def train_similarity_index() -> None:
+    """
+    fit the similarity index on a worker thread and install the new lists, logging it if training failed
+    """
+    try:
+        trained = await asyncio.to_thread(fit_similarity_index)
+    except Exception:
+        logger.exception("Background training of the similarity index failed")
+        trained = None
+    try:
+        # None stops recording changes for the abandoned snapshot
+        await update_similarity_index(lambda: similarity_index.install(trained))
+    finally:
+        similarity_index_state["training"] = None
+
+
+def fit_similarity_index() -> TrainedLists | None:
+    """
+    copy the similarity index under its guard and train on the copy, run on a worker thread so neither the copy
+    nor k-means holds up the event loop, searches only wait for the copy
+    """
+    with similarity_index_guard:
+        snapshot = similarity_index.snapshot()
+    return similarity_index.fit(snapshot)
+
+
+async def sync_similarity_index(ids: list[int] | None) -> None:
+    """
+    apply documents written through any worker, this one included, to this worker's loaded similarity index
+
+    called by the cache invalidation listener, None means writes may have been missed and the index is reloaded
+    on the next similarity search. Waits for a load in progress so writes made while it ran are not lost
+    """
+    async with similarity_index_lock:
+        if not similarity_index_state["loaded"]:
+            return
+        if ids is None:
+            similarity_index_state["loaded"] = False
+            return
+
+        async with database.session_local() as db:
+            rows = await document_repository.get_embeddings_by_ids(ids, db)
+        current = [
+            row
+            for row in rows
+            if row.embedding is not None and row.embedding_model == embedding_model_state["model_id"]
+        ]
+        removed = set(ids) - {row.id for row in current}
+
+        def apply_writes() -> None:
+            for id in removed:
+                similarity_index.remove(id)
+            if current:
+                similarity_index.add_batch(
+                    [row.id for row in current],
+                    [row.title for row in current],
+                    np.stack([bytes_to_vector(row.embedding) for row in current]),
+                )
+
+        await update_similarity_index(apply_writes)
+    schedule_similarity_index_training()
+
+
+document_write_handlers.append(sync_similarity_index)
+
+# coalesces concurrent similarity queries so they are embedded and scored together
+similarity_batcher = MicroBatcher(
+    search_similar_batch,
+    max_batch_size=config_manager.SIMILARITY_BATCH_MAX_SIZE,
+    max_wait_ms=config_manager.SIMILARITY_BATCH_MAX_WAIT_MS,
+)
+
 
 class DocumentService:
     """
@@ -34,58 +228,131 @@ class DocumentService:
         """
         service for getting a document by id number
         """
-        repository_response: Document | None = await document_repository.get_by_id(id, db)
+        cached_document = await get_document_from_cache(id)
+        if cached_document is not None:
+            return DocumentGetByIdClientResponse.model_validate_json(cached_document)
+
+        # read from the primary as the result is cached, see DocumentRepository
+        repository_response = await document_repository.get_by_id(
+            id, db, schema=DocumentGetByIdClientResponse, use_replica=False
+        )
 
         if not repository_response:
             raise DocumentNotFoundException()
 
-        return DocumentGetByIdClientResponse(**repository_response.__dict__)
+        client_response = DocumentGetByIdClientResponse.model_validate(repository_response, from_attributes=True)
+        await add_document_to_cache(client_response.id, client_response.title, client_response.model_dump_json())
+
+        return client_response
 
     async def create_document(
-        self, document_body: DocumentCreateClientRequest, db: AsyncSession, user: User
+        self, document_body: DocumentCreateClientRequest, db: AsyncSession, user_id: int
     ) -> DocumentCreatedClientResponse:
         """
         service for a creating document
         """
-        db_document: Document = await document_repository.create_document(document_body=document_body, db=db, user=user)
+        embedding = await self.__embed_document(document_body.title, document_body.content)
+        db_document: Document = await document_repository.create_document(
+            document_body=document_body, db=db, user_id=user_id, embedding=embedding
+        )
+
+        await self.__index_document(db_document)
+        # drop any pointer from the title to an older document with the same title
+        await invalidate_document_in_cache(db_document.id, titles=[db_document.title])
 
         return DocumentCreatedClientResponse(**db_document.__dict__)
 
-    async def get_all(self, db: AsyncSession) -> list[DocumentGetByIdClientResponse]:
+    async def get_all(self) -> Response:
         """
         service for getting all documents
+
+        the cached JSON is already the response body, so a cache hit is returned as is without building
+        a model per document or serializing them again
         """
-        # if the docs are in the cache, return them
-        if await is_docs_in_cache("all_docs"):
-            json_response = await get_docs_from_cache("all_docs")
-            return json.loads(json_response, object_hook=lambda d: DocumentGetByIdClientResponse(**d))
+        # concurrent misses share one database query, see get_or_compute_document_list
+        json_response = await get_or_compute_document_list("all", self.__get_all_json)
+        return Response(content=json_response, media_type="application/json")
 
-        repository_response: list[Document] | None = await document_repository.get_all(db)
+    async def export_documents(self) -> StreamingResponse:
+        """
+        service for exporting every document as newline delimited JSON
 
-        if not repository_response:
-            raise DocumentNotFoundException()
+        the body is streamed from a server side cursor one batch at a time, so memory use does not grow with the
+        number of documents
+        """
+        return StreamingResponse(self.__export_ndjson(), media_type="application/x-ndjson")
 
-        # add the docs to the cache
-        await add_docs_to_cache(
-            "all_docs",
-            json.dumps([self.__serialize_document(doc) for doc in repository_response]),
-        )
+    async def ingest_documents(
+        self, lines: AsyncIterator[str], db: AsyncSession, user_id: int | None, batch_size: int
+    ) -> BulkIngestClientResponse:
+        """
+        service for creating documents in bulk from JSON lines, one DocumentCreateClientRequest per line
 
-        return [DocumentGetByIdClientResponse(**doc.__dict__) for doc in repository_response]
+        each batch is embedded in one executor task, inserted with one INSERT ... RETURNING and committed, a line
+        that cannot be parsed, embedded or inserted is recorded in the report and the rest of its batch is kept
+
+        Parameters:
+        - lines: AsyncIterator[str]: JSON lines, blank lines are skipped
+        - user_id: int: owner of the created documents
+        - batch_size: int: documents embedded and inserted together
+        """
+        start_time = time.perf_counter()
+        report = {"inserted": 0, "failed": 0, "errors": []}
+        batch: list[tuple[int, DocumentCreateClientRequest]] = []
+        line_number = 0
+
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                batch.append((line_number, DocumentCreateClientRequest.model_validate_json(line)))
+            except ValidationError as exc:
+                error = exc.errors()[0]
+                self.__record_ingest_error(report, line_number, f"{'.'.join(map(str, error['loc']))} {error['msg']}")
+
+            if len(batch) >= batch_size:
+                await self.__ingest_batch(batch, db, user_id, report)
+                batch = []
+                logger.info(
+                    f"Ingested {report['inserted']} documents "
+                    f"({report['inserted'] / (time.perf_counter() - start_time):.1f}/s), {report['failed']} failed"
+                )
+
+        if batch:
+            await self.__ingest_batch(batch, db, user_id, report)
+
+        seconds = time.perf_counter() - start_time
+        return BulkIngestClientResponse(
+            **report, seconds=seconds, rows_per_second=report["inserted"] / seconds if seconds else 0.0
+        )
 
     async def get_all_paginated(self, db: AsyncSession, pagination: Pagination) -> PaginationClientResponse:
         """
         service for getting all documents paginated
         """
+        # counted first in a session of its own, the request session keeps its connection once it has queried so
+        # counting after the page would hold two connections at once
+        count = await self.__count_documents()
 
-        documents, pages = await document_repository.get_all_paginated(db, pagination)
+        documents, has_more = await document_repository.get_all_paginated(
+            db, pagination, schema=DocumentCreatedClientResponse
+        )
 
         if not documents:
             raise DocumentNotFoundException()
 
+        cursor = pagination.cursor
+        if cursor is not None and cursor.direction == "prev":
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, cursor is not None or pagination.page > 1
+
         return PaginationClientResponse(
-            pages=pages,
-            items=[DocumentCreatedClientResponse(**doc.__dict__) for doc in documents],
+            pages=count,
+            next_cursor=encode_cursor(PageCursor(documents[-1].id, "next", pagination.order)) if has_next else None,
+            prev_cursor=encode_cursor(PageCursor(documents[0].id, "prev", pagination.order)) if has_prev else None,
+            items=[DocumentCreatedClientResponse.model_validate(doc, from_attributes=True) for doc in documents],
         )
 
     async def update_document(
@@ -95,46 +362,307 @@ class DocumentService:
         service for updating a document
         """
         db_document: Document | None = await document_repository.update_document(
-            id=id, document_update_body=document_body, db=db
+            id=id, document_update_body=document_body, db=db, embed=self.__embed_document
         )
 
         if not db_document:
             raise DocumentNotFoundException()
 
+        await self.__index_document(db_document)
+        # the pointer from the old title is left behind but is rejected on read as the title no longer matches
+        await invalidate_document_in_cache(db_document.id, titles=[db_document.title])
+
         return DocumentCreatedClientResponse(**db_document.__dict__)
 
     async def delete_document(self, id: int, db: AsyncSession) -> str:
         """
         service for deleting a document
         """
-        db_document: Document | None = await document_repository.delete_document(id, db)
+        db_document = await document_repository.delete_document(id, db)
 
         if not db_document:
             raise DocumentNotFoundException()
 
+        await update_similarity_index(lambda: similarity_index.remove(db_document.id))
+        await invalidate_document_in_cache(db_document.id, titles=[db_document.title])
+
         return f"Document [id: {db_document.id}, title: {db_document.title}] deleted successfully"
 
     async def get_by_title(self, title: str, db: AsyncSession) -> DocumentGetByIdClientResponse:
         """
         service for getting a document by title
         """
-        repository_response: Document | None = await document_repository.get_by_title(title, db)
+        cached_id = await get_document_id_by_title_from_cache(title)
+        if cached_id is not None:
+            cached_document = await get_document_from_cache(cached_id)
+            if cached_document is not None:
+                client_response = DocumentGetByIdClientResponse.model_validate_json(cached_document)
+                # the document may have been renamed since the title pointer was cached
+                if client_response.title == title:
+                    return client_response
+
+        # read from the primary as the result is cached, see DocumentRepository
+        repository_response = await document_repository.get_by_title(
+            title, db, schema=DocumentGetByIdClientResponse, use_replica=False
+        )
 
         if not repository_response:
             raise DocumentNotFoundException()
 
-        return DocumentGetByIdClientResponse(**repository_response.__dict__)
+        client_response = DocumentGetByIdClientResponse.model_validate(repository_response, from_attributes=True)
+        await add_document_to_cache(client_response.id, client_response.title, client_response.model_dump_json())
+
+        return client_response
 
-    def __serialize_document(self, obj: Document) -> dict:
+    async def get_similar(
+        self, similarity_request: DocumentSimilarityClientRequest, db: AsyncSession
+    ) -> list[DocumentSimilarityClientResponse]:
         """
-        Convert SQLAlchemy objects to JSON-serializable dictionaries.
+        service for finding the stored documents most similar to a text
         """
-        serialized = {}
-        for key, value in obj.__dict__.items():
-            if key == "_sa_instance_state":  # Skip SQLAlchemy instance state
-                continue
-            if isinstance(value, datetime):
-                serialized[key] = value.isoformat()  # Convert datetime to string
-            else:
-                serialized[key] = value
-        return serialized
+        await self.__load_similarity_index(db)
+
+        matches = await similarity_batcher.submit((similarity_request.text, similarity_request.k))
+
+        return [DocumentSimilarityClientResponse(**match._asdict()) for match in matches]
+
+    async def get_similarity_matrix(
+        self, matrix_request: SimilarityMatrixClientRequest, db: AsyncSession
+    ) -> SimilarityMatrixClientResponse:
+        """
+        service for comparing request texts and stored documents with each other in one matrix product
+        """
+        document_ids = list(dict.fromkeys(matrix_request.document_ids))
+        if not matrix_request.texts and not document_ids:
+            return SimilarityMatrixClientResponse(items=[], matrix=[])
+
+        document_vectors = await self.__get_document_vectors(document_ids, db)
+        text_vectors = (
+            await nlp_executor.run(tasks.embed_texts, matrix_request.texts)
+            if matrix_request.texts
+            else np.empty((0, 0), dtype=np.float32)
+        )
+
+        items = [SimilarityMatrixItem(kind="text", index=i) for i in range(len(matrix_request.texts))]
+        items += [SimilarityMatrixItem(kind="document", id=id) for id in document_ids]
+
+        vectors = np.concatenate([block for block in (text_vectors, document_vectors) if len(block)])
+        block_size = config_manager.SIMILARITY_MATRIX_BLOCK_SIZE
+
+        if matrix_request.top_k is None:
+            matrix = similarity_matrix(vectors, vectors, block_size=block_size)
+            return SimilarityMatrixClientResponse(items=items, matrix=matrix.tolist())
+
+        indices, scores = top_k_similarities(
+            vectors, vectors, matrix_request.top_k, block_size=block_size, exclude_self=True
+        )
+        top_k = [
+            [
+                SimilarityMatrixMatch(column=int(column), score=float(score))
+                for column, score in zip(row_indices, row_scores)
+            ]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+        return SimilarityMatrixClientResponse(items=items, top_k=top_k)
+
+    async def __ingest_batch(
+        self, batch: list[tuple[int, DocumentCreateClientRequest]], db: AsyncSession, user_id: int | None, report: dict
+    ) -> None:
+        """
+        embed, insert and commit one batch of parsed lines
+
+        the batch is inserted in a savepoint, if that fails each row is retried in a savepoint of its own so only
+        the rows that fail are dropped
+        """
+        embeddings = await self.__embed_ingest_batch(batch, report)
+        pending = [
+            (line_number, {**body.model_dump(), "user_id": user_id, **embedding._asdict()})
+            for (line_number, body), embedding in zip(batch, embeddings)
+            if embedding is not None
+        ]
+        if not pending:
+            return
+
+        try:
+            async with db.begin_nested():
+                rows = list(await document_repository.create_documents([values for _, values in pending], db))
+            inserted = pending
+        except SQLAlchemyError:
+            rows, inserted = [], []
+            for line_number, values in pending:
+                try:
+                    async with db.begin_nested():
+                        rows.extend(await document_repository.create_documents([values], db))
+                    inserted.append((line_number, values))
+                except SQLAlchemyError as exc:
+                    self.__record_ingest_error(report, line_number, str(getattr(exc, "orig", None) or exc))
+
+        await db.commit()
+        report["inserted"] += len(rows)
+
+        if inserted and similarity_index_state["loaded"]:
+            await update_similarity_index(
+                lambda: similarity_index.add_batch(
+                    [row.id for row in rows],
+                    [row.title for row in rows],
+                    np.stack([bytes_to_vector(values["embedding"]) for _, values in inserted]),
+                )
+            )
+            schedule_similarity_index_training()
+        await invalidate_documents_in_cache([row.id for row in rows], titles=[row.title for row in rows])
+
+    async def __embed_ingest_batch(
+        self, batch: list[tuple[int, DocumentCreateClientRequest]], report: dict
+    ) -> list[DocumentEmbedding | None]:
+        """
+        embed a batch of parsed lines in one executor task, falling back to one task per line if the batch fails
+
+        Returns:
+        - embeddings in the order of the batch, None for lines that failed and were recorded in the report
+        """
+        documents = [(body.title, body.content) for _, body in batch]
+        try:
+            return await nlp_executor.run(tasks.embed_documents, documents)
+        except Exception:
+            logger.exception("Embedding an ingestion batch failed, embedding its documents one at a time")
+
+        embeddings: list[DocumentEmbedding | None] = []
+        for (line_number, _), document in zip(batch, documents):
+            try:
+                embeddings.extend(await nlp_executor.run(tasks.embed_documents, [document]))
+            except Exception as exc:
+                self.__record_ingest_error(report, line_number, f"embedding failed: {exc}")
+                embeddings.append(None)
+        return embeddings
+
+    def __record_ingest_error(self, report: dict, line_number: int, error: str) -> None:
+        """
+        count a failed line and keep its error unless BULK_INGEST_MAX_ERRORS are already kept
+        """
+        report["failed"] += 1
+        if len(report["errors"]) < config_manager.BULK_INGEST_MAX_ERRORS:
+            report["errors"].append(BulkIngestError(line=line_number, error=error))
+
+    async def __export_ndjson(self) -> AsyncIterator[bytes]:
+        """
+        yield one chunk of JSON lines per batch of documents read from the database
+
+        the session is opened here rather than taken from the request, as request dependencies are closed before
+        a streaming body is sent
+        """
+        async with database.session_local() as db:
+            async for documents in document_repository.stream_all(db, batch_size=config_manager.EXPORT_BATCH_SIZE):
+                lines = [
+                    DocumentCreatedClientResponse.model_validate(document, from_attributes=True).model_dump_json()
+                    for document in documents
+                ]
+                yield ("\n".join(lines) + "\n").encode()
+
+    async def __count_documents(self) -> int:
+        """
+        count all documents, cached like the document lists so it is recounted after every document write
+        """
+        return int(await get_or_compute_document_list("count", self.__get_count_json))
+
+    async def __get_count_json(self) -> str:
+        """
+        count all documents in a session of its own for the cache, on the primary as the count is cached
+        """
+        async with database.session_local() as db:
+            return str(await document_repository.count_documents(db, use_replica=False))
+
+    async def __get_all_json(self) -> str:
+        """
+        query all documents and serialize them for the cache
+
+        runs in its own session as it may be shared by many requests or refresh the cache after the request
+        that started it has finished, and on the primary so a lagging replica never refills the cache
+
+        Throws:
+        - DocumentNotFoundException if there are no documents
+        """
+        async with database.session_local() as db:
+            repository_response = await document_repository.get_all(
+                db, schema=DocumentGetByIdClientResponse, use_replica=False
+            )
+
+        if not repository_response:
+            raise DocumentNotFoundException()
+
+        # only the response model columns were selected, the rows are validated and serialized in bulk
+        client_response = document_list_adapter.validate_python(repository_response, from_attributes=True)
+        return document_list_adapter.dump_json(client_response).decode()
+
+    async def __get_document_vectors(self, ids: list[int], db: AsyncSession) -> np.ndarray:
+        """
+        get the vectors of stored documents in the order of ids, embedding any without a current stored embedding
+
+        Throws:
+        - DocumentNotFoundException if any id does not exist
+        """
+        if not ids:
+            return np.empty((0, 0), dtype=np.float32)
+
+        rows = {row.id: row for row in await document_repository.get_embeddings_by_ids(ids, db)}
+        if len(rows) != len(ids):
+            raise DocumentNotFoundException()
+
+        model_id = await self.__get_model_id()
+        stale_ids = [id for id in ids if rows[id].embedding is None or rows[id].embedding_model != model_id]
+        fresh = []
+        if stale_ids:
+            fresh = await nlp_executor.run(
+                tasks.embed_documents, [(rows[id].title, rows[id].content) for id in stale_ids]
+            )
+        vectors = {id: bytes_to_vector(embedding.embedding) for id, embedding in zip(stale_ids, fresh)}
+
+        return np.stack([vectors[id] if id in vectors else bytes_to_vector(rows[id].embedding) for id in ids])
+
+    async def __load_similarity_index(self, db: AsyncSession) -> None:
+        """
+        load all stored document vectors into the similarity index once per process
+        """
+        if similarity_index_state["loaded"]:
+            return
+
+        async with similarity_index_lock:
+            if similarity_index_state["loaded"]:
+                return
+
+            rows = await document_repository.get_all_embeddings(db, embedding_model=await self.__get_model_id())
+
+            def load_rows() -> None:
+                similarity_index.clear()
+                if rows:
+                    similarity_index.add_batch(
+                        [row.id for row in rows],
+                        [row.title for row in rows],
+                        np.stack([bytes_to_vector(row.embedding) for row in rows]),
+                    )
+
+            await update_similarity_index(load_rows)
+            similarity_index_state["loaded"] = True
+        schedule_similarity_index_training()
+
+    async def __embed_document(self, title: str, content: str) -> DocumentEmbedding:
+        """
+        compute the stored embedding of a document on the NLP executor
+        """
+        return (await nlp_executor.run(tasks.embed_documents, [(title, content)]))[0]
+
+    async def __get_model_id(self) -> str:
+        """
+        model id embeddings are currently produced by
+        """
+        if embedding_model_state["model_id"] is None:
+            embedding_model_state["model_id"] = await nlp_executor.run(tasks.get_model_id)
+        return embedding_model_state["model_id"]
+
+    async def __index_document(self, db_document: Document) -> None:
+        """
+        keep a loaded similarity index in step with a created or updated document
+        """
+        if similarity_index_state["loaded"] and db_document.embedding is not None:
+            id, title, vector = db_document.id, db_document.title, bytes_to_vector(db_document.embedding)
+            await update_similarity_index(lambda: similarity_index.add(id, title, vector))
+            schedule_similarity_index_training()
@@ -89,7 +89,7 @@ class UserService:
         if not verify_password(user_login_data.password, user.password_hash):
             raise InvalidCredentialsException()
 
-        user_data = {"id": user.id, "username": user.username, "email": user.email}
+        user_data = self.__user_data(user)
 
         # 3. Create access token
         access_token = create_access_token(user_data=user_data)
@@ -110,9 +110,12 @@ class UserService:
             }
         )
 
-    async def refresh_token(self, token: dict) -> JSONResponse:
+    async def refresh_token(self, token: dict, db: AsyncSession) -> JSONResponse:
         """
         service for refreshing a token
+
+        the user is read again so the new access token carries the current role, not the one signed into the
+        refresh token at login
         """
         expiry_timestamp = token.get("exp")
         expiry_datetime = datetime.fromtimestamp(expiry_timestamp)
@@ -121,14 +124,25 @@ class UserService:
         if expiry_datetime < datetime.now():
             raise InvalidTokenException()
 
-        # 2. Create new access token
-        access_token = create_access_token(user_data=token["user"])
+        # 2. Check the user still exists and read its current claims
+        user: User | None = await user_repository.get_by_email(token["user"]["email"], db)
+        if not user:
+            raise InvalidTokenException()
+
+        # 3. Create new access token
+        access_token = create_access_token(user_data=self.__user_data(user))
 
         return JSONResponse(
             content={"message": "Token refreshed", "access_token": access_token},
             status_code=200,
         )
 
+    def __user_data(self, user: User) -> dict:
+        """
+        claims of a user signed into its tokens
+        """
+        return {"id": user.id, "username": user.username, "email": user.email, "role": user.role.value}
+
     async def logout_user(self, token: dict) -> JSONResponse:
         """
         service for logging out a user
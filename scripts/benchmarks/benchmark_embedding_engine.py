@@ -0,0 +1,66 @@
+"""
+Embedding Engine Benchmark
+Author: Tom Aston
+
+Compares embedding with the full spaCy pipeline one text at a time, as SimilarityCalculator used to,
+against the vectors only engine batching through nlp.pipe and the static vector lookup embedder,
+and checks all three produce the same vectors.
+Requires the spaCy model to be installed.
+
+Usage:
+    python -m scripts.benchmarks.benchmark_embedding_engine [n_documents] [batch_size] [n_process]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from app.nlp.embedding_engine import DEFAULT_SPACY_MODEL, SpacyEmbeddingEngine
+from app.nlp.preprocess import TextPreprocessor
+from app.nlp.resources import nlp_resources
+from app.nlp.static_vector_embedder import StaticVectorEmbedder
+from scripts.benchmarks.benchmark_preprocess import generate_corpus
+
+
+def main() -> None:
+    n_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    n_process = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    texts = TextPreprocessor().get_cleaned_texts(generate_corpus(n_documents, 200))
+
+    full_nlp = nlp_resources.get_spacy_model(DEFAULT_SPACY_MODEL)
+    engine = SpacyEmbeddingEngine(batch_size=batch_size, n_process=n_process)
+    static_embedder = StaticVectorEmbedder()
+    engine.embed_batch(texts[:1])  # load the vectors only model outside the timed section
+
+    start = time.perf_counter()
+    full_vectors = np.stack([full_nlp(text).vector for text in texts])
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine_vectors = engine.embed_batch(texts)
+    engine_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    static_vectors = static_embedder.embed_batch(texts)
+    static_time = time.perf_counter() - start
+
+    if not np.allclose(full_vectors, engine_vectors, atol=1e-5):
+        raise SystemExit("vectors only engine output differs from the full pipeline")
+    if not np.allclose(full_vectors, static_vectors, atol=1e-5):
+        raise SystemExit("static vector embedder output differs from the full pipeline")
+
+    print(f"documents: {n_documents}, batch size: {batch_size}, processes: {n_process}")
+    print(f"full pipeline, one text per call: {full_time:.2f}s ({n_documents / full_time:,.0f} docs/s)")
+    print(f"vectors only nlp.pipe:            {engine_time:.2f}s ({n_documents / engine_time:,.0f} docs/s)")
+    print(f"static vector lookup:             {static_time:.2f}s ({n_documents / static_time:,.0f} docs/s)")
+    print(
+        f"speedup over full pipeline: nlp.pipe {full_time / engine_time:.2f}x, "
+        f"static lookup {full_time / static_time:.2f}x, vectors match"
+    )
+
+
+if __name__ == "__main__":
+    main()
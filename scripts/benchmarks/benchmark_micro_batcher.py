@@ -0,0 +1,100 @@
+"""
+Micro Batcher Benchmark
+Author: Tom Aston
+
+Measures similarity query throughput and latency at increasing concurrency, with every query processed on its
+own and with concurrent queries coalesced by the MicroBatcher.
+
+Each batch is cleaned with the real TextPreprocessor, embedded by summing hashed token vectors (a stand in for
+the spaCy vectors table, which this script does not need installed) and scored against an in memory VectorIndex
+on a worker thread, as the service does through the NLP executor.
+
+Usage:
+    python -m scripts.benchmarks.benchmark_micro_batcher [index_size] [concurrency ...]
+"""
+
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from app.nlp.micro_batcher import MicroBatcher
+from app.nlp.preprocess import TextPreprocessor
+from app.nlp.vector_index import VectorIndex
+from scripts.benchmarks.benchmark_preprocess import generate_corpus
+
+DIM = 300
+VOCABULARY_ROWS = 20_000
+K = 10
+REQUESTS_PER_LEVEL = 2_000
+MAX_WAIT_MS = 2.0
+MAX_BATCH_SIZE = 64
+
+
+class QueryScorer:
+    """
+    embeds and scores batches of query texts against a random index
+    """
+
+    def __init__(self, index_size: int, rng: np.random.Generator) -> None:
+        self.preprocessor = TextPreprocessor()
+        self.token_vectors = rng.standard_normal((VOCABULARY_ROWS, DIM), dtype=np.float32)
+        self.index = VectorIndex(initial_capacity=index_size)
+        self.index.add_batch(
+            range(index_size), [f"doc {i}" for i in range(index_size)], rng.standard_normal((index_size, DIM))
+        )
+
+    def score(self, texts: list[str]) -> list[list]:
+        vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+        for i, cleaned in enumerate(self.preprocessor.get_cleaned_texts(texts)):
+            rows = [hash(token) % VOCABULARY_ROWS for token in cleaned.split()]
+            if rows:
+                vectors[i] = self.token_vectors[rows].sum(axis=0)
+        return self.index.search_batch(vectors, K)
+
+    async def score_batch(self, texts: list[str]) -> list[list]:
+        return await asyncio.to_thread(self.score, texts)
+
+
+async def run_level(scorer: QueryScorer, queries: list[str], concurrency: int, batched: bool) -> None:
+    batcher = MicroBatcher(
+        scorer.score_batch, max_batch_size=MAX_BATCH_SIZE if batched else 1, max_wait_ms=MAX_WAIT_MS
+    )
+    latencies: list[float] = []
+    next_query = iter(queries)
+
+    async def client() -> None:
+        for query in next_query:
+            start = time.perf_counter()
+            await batcher.submit(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    stats = batcher.get_stats()
+    print(
+        f"{'batched' if batched else 'single':>7} | concurrency {concurrency:>4} | "
+        f"{len(latencies) / elapsed:8.0f} queries/s | p50 {p50:7.2f}ms p99 {p99:7.2f}ms | "
+        f"mean batch {stats['mean_batch_size']:5.1f}"
+    )
+
+
+async def main() -> None:
+    index_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    levels = [int(level) for level in sys.argv[2:]] or [1, 8, 32, 128, 512]
+
+    scorer = QueryScorer(index_size, np.random.default_rng(0))
+    queries = generate_corpus(REQUESTS_PER_LEVEL, words_per_document=12)
+    print(f"{index_size:,} indexed vectors, {REQUESTS_PER_LEVEL:,} queries per run, max wait {MAX_WAIT_MS}ms")
+
+    for concurrency in levels:
+        for batched in (False, True):
+            await run_level(scorer, queries, concurrency, batched)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Preprocessing Benchmark
+Author: Tom Aston
+
+Compares the original reduce based TextPreprocessor pipeline against the fused batch cleaner
+and checks both produce identical output.
+
+Usage:
+    python -m scripts.benchmarks.benchmark_preprocess [n_documents] [words_per_document]
+"""
+
+import random
+import re
+import string
+import sys
+import time
+from functools import reduce
+
+from app.nlp.preprocess import TextPreprocessor
+
+VOCABULARY = (
+    "the electrical cabinet was found smoking after a fire in one of the cupboards and engineers were "
+    "called to inspect wiring running through the building while reports of overheating equipment "
+    "continued during maintenance of pumps valves turbines generators transformers switchgear cables"
+).split()
+
+
+def legacy_cleaned_text(preprocessor: TextPreprocessor, text: str) -> str:
+    """
+    the original reduce based pipeline, rebuilding the punctuation table and stopword set on every call
+    """
+
+    def remove_punctuation(t: str) -> str:
+        table = str.maketrans({key: None for key in string.punctuation})
+        return t.translate(table)
+
+    def remove_stop_words(t: str) -> str:
+        stop_words = set(preprocessor.stop_words)
+        return " ".join([word for word in str(t).split() if word not in stop_words])
+
+    preprocess_steps = [
+        lambda t: t.lower(),
+        remove_punctuation,
+        lambda t: re.sub(r"\w*\d\w*", "", t).strip(),
+        remove_stop_words,
+        lambda t: " ".join(t.split()),
+        lambda t: " ".join([preprocessor.stemmer.stem(word) for word in t.split()]),
+    ]
+    return reduce(lambda t, step: step(t), preprocess_steps, text)
+
+
+def generate_corpus(n_documents: int, words_per_document: int, seed: int = 42) -> list[str]:
+    """
+    generate a reproducible corpus with mixed case, punctuation and digits
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n_documents):
+        words = []
+        for _ in range(words_per_document):
+            word = rng.choice(VOCABULARY)
+            roll = rng.random()
+            if roll < 0.05:
+                word = f"{word}{rng.randint(0, 99)}"
+            elif roll < 0.15:
+                word = word.capitalize() + rng.choice(",.;:!?")
+            words.append(word)
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def main() -> None:
+    n_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    words_per_document = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    corpus = generate_corpus(n_documents, words_per_document)
+    preprocessor = TextPreprocessor()
+
+    start = time.perf_counter()
+    legacy_output = [legacy_cleaned_text(preprocessor, text) for text in corpus]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fused_output = preprocessor.get_cleaned_texts(corpus)
+    fused_time = time.perf_counter() - start
+
+    if legacy_output != fused_output:
+        raise SystemExit("fused pipeline output differs from the legacy pipeline")
+
+    print(f"documents: {n_documents}, words per document: {words_per_document}")
+    print(f"legacy reduce pipeline: {legacy_time:.3f}s ({n_documents / legacy_time:,.0f} docs/s)")
+    print(f"fused batch pipeline:   {fused_time:.3f}s ({n_documents / fused_time:,.0f} docs/s)")
+    print(f"speedup: {legacy_time / fused_time:.2f}x, outputs identical")
+    print(f"stem cache: {preprocessor.get_stem_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
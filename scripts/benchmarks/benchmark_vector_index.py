@@ -0,0 +1,65 @@
+"""
+Vector Index Benchmark
+Author: Tom Aston
+
+Measures build time and top k query latency of the in memory vector index at increasing corpus sizes.
+
+Usage:
+    python -m scripts.benchmarks.benchmark_vector_index [sizes ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from app.nlp.vector_index import VectorIndex
+
+DIM = 300  # en_core_web_md vector width
+K = 10
+N_QUERIES = 100
+CHUNK_SIZE = 100_000
+
+
+def build_index(size: int, rng: np.random.Generator) -> VectorIndex:
+    """
+    build an index of random vectors in chunks to keep peak memory close to the final matrix size
+    """
+    index = VectorIndex(initial_capacity=size)
+    for start in range(0, size, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, size)
+        vectors = rng.standard_normal((stop - start, DIM), dtype=np.float32)
+        index.add_batch(range(start, stop), [f"doc {i}" for i in range(start, stop)], vectors)
+    return index
+
+
+def benchmark(size: int) -> None:
+    rng = np.random.default_rng(size)
+
+    start = time.perf_counter()
+    index = build_index(size, rng)
+    build_time = time.perf_counter() - start
+
+    queries = rng.standard_normal((N_QUERIES, DIM), dtype=np.float32)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, K)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(
+        f"{size:>9,} docs | build {build_time:6.2f}s | "
+        f"top-{K} latency p50 {p50:7.2f}ms p95 {p95:7.2f}ms p99 {p99:7.2f}ms | "
+        f"matrix {index.vectors.nbytes / 1e6:,.0f}MB"
+    )
+
+
+def main() -> None:
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        benchmark(size)
+
+
+if __name__ == "__main__":
+    main()
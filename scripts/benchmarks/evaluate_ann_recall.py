@@ -0,0 +1,64 @@
+"""
+ANN Recall Evaluation
+Author: Tom Aston
+
+Sweeps n_probe on an IVF index and reports recall@k and latency against exact search.
+Random gaussian vectors have no cluster structure and are the worst case for IVF, real document
+embeddings cluster by topic and reach a given recall with fewer probes.
+
+Usage:
+    python -m scripts.benchmarks.evaluate_ann_recall [n_documents] [n_lists]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from app.nlp.index_evaluation import evaluate_index
+from app.nlp.ivf_index import IVFIndex
+from app.nlp.vector_index import VectorIndex
+
+DIM = 300
+K = 10
+N_QUERIES = 200
+N_TOPICS = 2000
+
+
+def generate_vectors(n: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    generate vectors clustered around random topic centres to resemble document embeddings
+    """
+    topics = rng.standard_normal((N_TOPICS, DIM), dtype=np.float32)
+    return topics[rng.integers(0, N_TOPICS, n)] + 1.5 * rng.standard_normal((n, DIM), dtype=np.float32)
+
+
+def main() -> None:
+    n_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_lists = int(sys.argv[2]) if len(sys.argv) > 2 else int(4 * np.sqrt(n_documents))
+
+    rng = np.random.default_rng(0)
+    vectors = generate_vectors(n_documents + N_QUERIES, rng)
+    documents, queries = vectors[:n_documents], vectors[n_documents:]
+    ids = list(range(n_documents))
+    titles = [f"doc {i}" for i in ids]
+
+    exact_index = VectorIndex(initial_capacity=n_documents)
+    exact_index.add_batch(ids, titles, documents)
+
+    start = time.perf_counter()
+    ivf_index = IVFIndex(n_lists=n_lists)
+    ivf_index.add_batch(ids, titles, documents)
+    print(f"{n_documents:,} documents, {n_lists} lists, trained in {time.perf_counter() - start:.1f}s")
+
+    for n_probe in (1, 2, 4, 8, 16, 32, 64):
+        ivf_index.n_probe = n_probe
+        result = evaluate_index(ivf_index, exact_index, queries, K)
+        print(
+            f"n_probe {n_probe:>3} | recall@{K} {result['recall']:.3f} | "
+            f"ivf p95 {result['approximate_p95_ms']:6.2f}ms | exact p95 {result['exact_p95_ms']:6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,19 @@ Author: Tom Aston
 
 import asyncio
 from typing import AsyncGenerator
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 
+import fakeredis
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
 from httpx._transports.asgi import ASGITransport
 
+from app.core import cache
+from app.core.bloom_filter import BloomFilter
 from app.core.config import ConfigManager
+from app.core.local_cache import LocalCache
+from app.core.single_flight import SingleFlight
 from app.core.database import database
 from app.main import AppCreator
 
@@ -56,3 +61,22 @@ def mock_db_session() -> AsyncMock:  # noqa: F811
     mock_session.commit = AsyncMock()
     mock_session.refresh = AsyncMock()
     return mock_session
+
+
+@pytest.fixture
+def fake_redis():
+    """Replace the redis clients with an in memory stand in and reset the cache stats"""
+    fake_docs_cache = fakeredis.FakeAsyncRedis(decode_responses=True)
+    fake_jti_blocklist = fakeredis.FakeAsyncRedis(decode_responses=True)
+    stats = {kind: {"hits": 0, "misses": 0} for kind in cache.docs_cache_stats}
+    with (
+        patch.object(cache, "docs_cache", fake_docs_cache),
+        patch.object(cache, "jti_blocklist", fake_jti_blocklist),
+        patch.object(cache, "docs_cache_stats", stats),
+        patch.object(cache, "local_docs_cache", LocalCache(max_size=16, ttl=60)),
+        patch.dict(cache.invalidation_listener_state, {"subscribed": False, "task": None}),
+        patch.object(cache, "document_list_flights", SingleFlight()),
+        patch.dict(cache.jti_filter_state, {"filter": BloomFilter(1000, 0.001), "synced": False, "task": None}),
+        patch.dict(cache.jti_filter_stats, {"filtered": 0, "checked": 0}),
+    ):
+        yield fake_docs_cache
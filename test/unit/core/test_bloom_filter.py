@@ -0,0 +1,48 @@
+"""
+Bloom Filter Unit Test
+Author: Tom Aston
+"""
+
+import pytest
+
+from app.core.bloom_filter import BloomFilter
+
+
+class TestBloomFilter:
+    """
+    Unit Test BloomFilter
+    """
+
+    def test_added_items_are_always_present(self):
+        """
+        Test there are no false negatives
+        """
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f"jti-{i}" for i in range(1000)]
+        for item in items:
+            bloom_filter.add(item)
+
+        assert all(item in bloom_filter for item in items)
+        assert len(bloom_filter) == 1000
+
+    def test_false_positive_rate_at_capacity(self):
+        """
+        Test about error_rate of items never added are reported present once the filter is full
+        """
+        bloom_filter = BloomFilter(capacity=10_000, error_rate=0.01)
+        for i in range(10_000):
+            bloom_filter.add(f"revoked-{i}")
+
+        false_positives = sum(f"live-{i}" in bloom_filter for i in range(20_000))
+
+        assert false_positives / 20_000 < 0.02
+        assert bloom_filter.get_stats()["false_positive_rate"] == pytest.approx(0.01, rel=0.2)
+
+    def test_invalid_sizing(self):
+        """
+        Test a filter cannot be sized for no items or an impossible error rate
+        """
+        with pytest.raises(ValueError):
+            BloomFilter(capacity=0, error_rate=0.01)
+        with pytest.raises(ValueError):
+            BloomFilter(capacity=10, error_rate=1.0)
@@ -0,0 +1,347 @@
+"""
+Cache Unit Test
+Author: Tom Aston
+"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+
+from app.core import cache
+
+
+@pytest.mark.usefixtures("fake_redis")
+class TestDocsCache:
+    """
+    Unit Test document cache against an in memory redis
+    """
+
+    @pytest.mark.asyncio
+    async def test_document_entries_and_title_pointers(self):
+        """
+        Test documents are cached by id with a title pointer and removed on invalidation
+        """
+        await cache.add_document_to_cache(7, "fire", '{"id": 7}')
+
+        assert await cache.get_document_from_cache(7) == '{"id": 7}'
+        assert await cache.get_document_id_by_title_from_cache("fire") == 7
+
+        await cache.invalidate_document_in_cache(7, titles=["fire"])
+
+        assert await cache.get_document_from_cache(7) is None
+        assert await cache.get_document_id_by_title_from_cache("fire") is None
+        stats = cache.get_docs_cache_stats()
+        assert stats["redis"]["document"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+    @pytest.mark.asyncio
+    async def test_document_read_before_a_write_is_not_cached_after_it(self):
+        """
+        Test a document written since it was read is not cached again until the write marker expires
+        """
+        await cache.invalidate_document_in_cache(7, titles=["fire"])
+        # a read that loaded the old row before the write committed tries to fill the cache
+        await cache.add_document_to_cache(7, "fire", '{"id": 7}')
+        await cache.add_document_to_cache(8, "water", '{"id": 8}')
+
+        assert await cache.get_document_from_cache(7) is None
+        assert await cache.get_document_id_by_title_from_cache("fire") is None
+        assert await cache.get_document_from_cache(8) == '{"id": 8}'
+
+        with patch.object(cache.config_manager, "DOCS_CACHE_WRITE_TOMBSTONE_MS", 10):
+            await cache.invalidate_document_in_cache(7)
+        await asyncio.sleep(0.05)
+        await cache.add_document_to_cache(7, "fire", '{"id": 7}')
+
+        assert await cache.get_document_from_cache(7) == '{"id": 7}'
+
+    @pytest.mark.asyncio
+    async def test_list_written_before_a_write_is_never_read(self):
+        """
+        Test a write moves lists to a new version, including a list computed while the write happened
+        """
+        computed = []
+
+        async def compute():
+            computed.append(len(computed))
+            if len(computed) == 2:
+                # a write lands while this list is being computed
+                await cache.invalidate_document_in_cache(1)
+            return f"[{len(computed)}]"
+
+        assert await cache.get_or_compute_document_list("all", compute) == "[1]"
+        assert await cache.get_or_compute_document_list("all", compute) == "[1]"
+
+        await cache.invalidate_document_in_cache(1)
+        assert await cache.get_or_compute_document_list("all", compute) == "[2]"
+        assert await cache.get_or_compute_document_list("all", compute) == "[3]"
+        assert await cache.get_or_compute_document_list("all", compute) == "[3]"
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_compute_once(self):
+        """
+        Test concurrent misses for a list are coalesced into one computation
+        """
+        computed = []
+
+        async def compute():
+            computed.append(1)
+            await asyncio.sleep(0.05)
+            return "[]"
+
+        results = await asyncio.gather(*(cache.get_or_compute_document_list("all", compute) for _ in range(20)))
+
+        assert results == ["[]"] * 20
+        assert len(computed) == 1
+
+    @pytest.mark.asyncio
+    async def test_miss_waits_for_worker_holding_the_lock(self, fake_redis: fakeredis.FakeAsyncRedis):
+        """
+        Test a miss waits for the list stored by another worker holding the lock instead of computing it
+        """
+        key = cache.DOCUMENT_LIST_KEY.format(name="all", version=0)
+        await fake_redis.set(f"{key}:lock", "other worker", px=2000)
+
+        async def other_worker():
+            await asyncio.sleep(0.05)
+            await fake_redis.set(key, cache._pack_list_entry(0.1, time.time() + 60, "[other]"))
+
+        async def compute():
+            raise AssertionError("the list should not be computed while another worker holds the lock")
+
+        results = await asyncio.gather(cache.get_or_compute_document_list("all", compute), other_worker())
+
+        assert results[0] == "[other]"
+
+    @pytest.mark.asyncio
+    async def test_miss_computes_once_the_lock_is_released_without_a_list(self, fake_redis: fakeredis.FakeAsyncRedis):
+        """
+        Test a miss stops waiting and takes the lock as soon as another worker releases it without storing a list
+        """
+        key = cache.DOCUMENT_LIST_KEY.format(name="all", version=0)
+        await fake_redis.set(f"{key}:lock", "other worker", px=2000)
+
+        async def other_worker_fails():
+            await asyncio.sleep(0.05)
+            await fake_redis.delete(f"{key}:lock")
+
+        async def compute():
+            return "[mine]"
+
+        start_time = time.monotonic()
+        results = await asyncio.gather(cache.get_or_compute_document_list("all", compute), other_worker_fails())
+
+        assert results[0] == "[mine]"
+        assert time.monotonic() - start_time < 1.0
+
+    @pytest.mark.asyncio
+    async def test_miss_during_a_skipped_refresh_gets_the_list(self, fake_redis: fakeredis.FakeAsyncRedis):
+        """
+        Test a miss while an early refresh is skipped for another worker's lock still waits for the stored list
+        """
+        key = cache.DOCUMENT_LIST_KEY.format(name="all", version=0)
+        await fake_redis.set(key, cache._pack_list_entry(10.0, time.time() + 0.01, "[old]"))
+        await fake_redis.set(f"{key}:lock", "other worker", px=2000)
+
+        async def compute():
+            raise AssertionError("the list should not be computed while another worker holds the lock")
+
+        async def other_worker():
+            await asyncio.sleep(0.05)
+            await fake_redis.set(key, cache._pack_list_entry(0.1, time.time() + 60, "[other]"))
+
+        set_lock = fake_redis.set
+
+        async def slow_set(*args, **kwargs):
+            # keeps the refresh in flight while the miss arrives
+            await asyncio.sleep(0.02)
+            return await set_lock(*args, **kwargs)
+
+        with patch.object(fake_redis, "set", slow_set):
+            assert await cache.get_or_compute_document_list("all", compute) == "[old]"
+            # the entry expires while the refresh is running
+            await fake_redis.delete(key)
+            results = await asyncio.gather(cache.get_or_compute_document_list("all", compute), other_worker())
+            await asyncio.gather(*cache.refresh_tasks)
+
+        assert results[0] == "[other]"
+
+    @pytest.mark.asyncio
+    async def test_list_close_to_expiry_is_refreshed_early(self, fake_redis: fakeredis.FakeAsyncRedis):
+        """
+        Test a hit on a list about to expire returns it and refreshes it in the background
+        """
+        key = cache.DOCUMENT_LIST_KEY.format(name="all", version=0)
+        await fake_redis.set(key, cache._pack_list_entry(10.0, time.time() + 0.01, "[old]"))
+
+        async def compute():
+            return "[new]"
+
+        assert await cache.get_or_compute_document_list("all", compute) == "[old]"
+        await asyncio.gather(*cache.refresh_tasks)
+
+        assert await cache.get_or_compute_document_list("all", compute) == "[new]"
+        assert await fake_redis.get(f"{key}:lock") is None
+
+    @pytest.mark.asyncio
+    async def test_local_tier_is_invalidated_by_other_workers(self, fake_redis: fakeredis.FakeAsyncRedis):
+        """
+        Test hot documents are served locally and dropped when another worker publishes an invalidation
+        """
+        cache.start_invalidation_listener()
+        try:
+            while not cache.invalidation_listener_state["subscribed"]:
+                await asyncio.sleep(0.01)
+
+            await fake_redis.set(cache.DOCUMENT_ID_KEY.format(id=7), "v1")
+            for _ in range(3):
+                assert await cache.get_document_from_cache(7) == "v1"
+
+            stats = cache.get_docs_cache_stats()
+            assert stats["local"]["hits"] == 2
+            assert stats["redis"]["document"]["hits"] == 1
+
+            # another worker writes the document and publishes the invalidation
+            await fake_redis.set(cache.DOCUMENT_ID_KEY.format(id=7), "v2")
+            await fake_redis.publish(
+                cache.config_manager.DOCS_CACHE_INVALIDATION_CHANNEL, f'["{cache.DOCUMENT_ID_KEY.format(id=7)}"]'
+            )
+            for _ in range(100):
+                if not len(cache.local_docs_cache):
+                    break
+                await asyncio.sleep(0.01)
+
+            assert await cache.get_document_from_cache(7) == "v2"
+        finally:
+            await cache.stop_invalidation_listener()
+
+        assert not cache.invalidation_listener_state["subscribed"]
+
+    @pytest.mark.asyncio
+    async def test_listener_passes_written_document_ids_to_handlers(self):
+        """
+        Test the listener calls write handlers with None on subscribing and then with the ids of written documents
+        """
+        calls = []
+
+        async def handler(ids):
+            calls.append(ids)
+
+        with patch.object(cache, "document_write_handlers", [handler]):
+            cache.start_invalidation_listener()
+            try:
+                while not cache.invalidation_listener_state["subscribed"]:
+                    await asyncio.sleep(0.01)
+
+                await cache.invalidate_documents_in_cache([3, 4], titles=["fire"])
+                for _ in range(100):
+                    if len(calls) == 2:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                await cache.stop_invalidation_listener()
+
+        assert calls == [None, [3, 4]]
+
+    @pytest.mark.asyncio
+    async def test_slow_handler_does_not_hold_up_local_invalidation(self):
+        """
+        Test keys are dropped from the local tier while a write handler is still running, and handlers run in order
+        """
+        calls = []
+        release = asyncio.Event()
+
+        async def handler(ids):
+            if ids == [3]:
+                await release.wait()
+            calls.append(ids)
+
+        with patch.object(cache, "document_write_handlers", [handler]):
+            cache.start_invalidation_listener()
+            try:
+                while not cache.invalidation_listener_state["subscribed"]:
+                    await asyncio.sleep(0.01)
+
+                await cache.invalidate_document_in_cache(3)
+                cache.local_docs_cache.set(cache.DOCUMENT_ID_KEY.format(id=4), "stale")
+                # published by another worker, so only the listener drops it from this worker's local tier
+                await cache.docs_cache.publish(
+                    cache.config_manager.DOCS_CACHE_INVALIDATION_CHANNEL, f'["{cache.DOCUMENT_ID_KEY.format(id=4)}"]'
+                )
+                for _ in range(100):
+                    if cache.local_docs_cache.get(cache.DOCUMENT_ID_KEY.format(id=4)) is None:
+                        break
+                    await asyncio.sleep(0.01)
+
+                assert cache.local_docs_cache.get(cache.DOCUMENT_ID_KEY.format(id=4)) is None
+                assert calls == [None]
+
+                release.set()
+                for _ in range(100):
+                    if len(calls) == 3:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                await cache.stop_invalidation_listener()
+
+        assert calls == [None, [3], [4]]
+
+
+@pytest.mark.usefixtures("fake_redis")
+class TestJtiFilter:
+    """
+    Unit Test the revoked token filter in front of the blocklist
+    """
+
+    @pytest.mark.asyncio
+    async def test_unrevoked_tokens_are_answered_without_redis_once_synced(self):
+        """
+        Test only tokens in the synced filter are checked against redis
+        """
+        await cache.add_jti_to_blocklist("revoked")
+        cache.jti_filter_state["filter"] = await cache.load_jti_filter()
+        cache.jti_filter_state["synced"] = True
+
+        assert await cache.is_jti_blacklisted("revoked")
+        assert not any([await cache.is_jti_blacklisted(f"live-{i}") for i in range(100)])
+        stats = cache.get_jti_filter_stats()
+        assert stats["checked"] < 5
+        assert stats["filtered"] + stats["checked"] == 101
+
+    @pytest.mark.asyncio
+    async def test_every_token_is_checked_against_redis_until_synced(self):
+        """
+        Test a revoked token missing from an unsynced filter is still rejected
+        """
+        await cache.jti_blocklist.set("revoked", "")
+
+        assert await cache.is_jti_blacklisted("revoked")
+        assert cache.get_jti_filter_stats()["checked"] == 1
+
+    @pytest.mark.asyncio
+    async def test_listener_mirrors_revocations_from_other_workers(self):
+        """
+        Test the listener loads the blocklist on subscribing and adds tokens revoked elsewhere
+        """
+        await cache.jti_blocklist.set("before", "")
+        cache.start_revocation_listener()
+        try:
+            while not cache.jti_filter_state["synced"]:
+                await asyncio.sleep(0.01)
+            assert "before" in cache.jti_filter_state["filter"]
+
+            # another worker revoking a token
+            await cache.jti_blocklist.set("after", "")
+            await cache.jti_blocklist.publish(cache.config_manager.JTI_REVOCATION_CHANNEL, "after")
+            for _ in range(100):
+                if "after" in cache.jti_filter_state["filter"]:
+                    break
+                await asyncio.sleep(0.01)
+
+            assert "after" in cache.jti_filter_state["filter"]
+            assert await cache.is_jti_blacklisted("after")
+        finally:
+            await cache.stop_revocation_listener()
+        assert not cache.jti_filter_state["synced"]
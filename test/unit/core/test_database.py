@@ -0,0 +1,222 @@
+"""
+Database Unit Test
+Author: Tom Aston
+"""
+
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import greenlet_spawn
+
+from app.core.database import (
+    BaseModel,
+    ClientWrites,
+    InstrumentedQueuePool,
+    PoolMetrics,
+    ReplicaRouter,
+    RoutingSession,
+    client_writes,
+)
+from app.models.document import Document
+from app.models.user import User  # noqa: F401 registers the User mapper Document relates to
+
+
+class TestPoolMetrics:
+    """
+    Unit Test PoolMetrics
+    """
+
+    def test_counts_checkouts_and_connections_held(self, tmp_path):
+        """
+        Test checkouts, checkins and the most connections held at once are counted from pool events
+        """
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", poolclass=QueuePool)
+        pool_metrics = PoolMetrics()
+        pool_metrics.attach(engine.pool)
+
+        with engine.connect() as first:
+            first.execute(text("SELECT 1"))
+            with engine.connect() as second:
+                second.execute(text("SELECT 1"))
+        with engine.connect() as third:
+            third.execute(text("SELECT 1"))
+
+        stats = pool_metrics.get_stats()
+        assert (stats["checkouts"], stats["checkins"]) == (3, 3)
+        # the third checkout reuses a pooled connection
+        assert stats["connects"] == 2
+        assert stats["checked_out"] == 0
+        assert stats["max_checked_out"] == 2
+        engine.dispose()
+
+    def test_wait_histogram(self):
+        """
+        Test checkout waits are counted in the bucket of their upper bound
+        """
+        pool_metrics = PoolMetrics()
+        for seconds in (0.0005, 0.003, 0.003, 2.0, 60.0):
+            pool_metrics.record_wait(seconds)
+        pool_metrics.record_wait(30.0, timed_out=True)
+
+        stats = pool_metrics.get_stats()
+        assert stats["timeouts"] == 1
+        assert stats["wait_ms"]["count"] == 6
+        assert stats["wait_ms"]["max"] == 60_000
+        histogram = stats["wait_ms"]["histogram"]
+        assert (histogram["le_1"], histogram["le_5"], histogram["le_5000"], histogram["inf"]) == (1, 2, 1, 2)
+
+    @pytest.mark.asyncio
+    async def test_instrumented_pool_times_an_exhausted_pool(self, tmp_path):
+        """
+        Test a checkout from an exhausted pool is timed and counted as a timeout
+        """
+        pool = InstrumentedQueuePool(
+            lambda: sqlite3.connect(tmp_path / "test.db"), pool_size=1, max_overflow=0, timeout=0.05
+        )
+        pool_metrics = PoolMetrics()
+        pool.metrics = pool_metrics
+
+        def check_out_twice() -> None:
+            connection = pool.connect()
+            with pytest.raises(PoolTimeoutError):
+                pool.connect()
+            connection.close()
+
+        # the async adapted pool waits for a connection with await, which needs a greenlet like the async engine
+        await greenlet_spawn(check_out_twice)
+
+        stats = pool_metrics.get_stats()
+        assert stats["timeouts"] == 1
+        assert stats["wait_ms"]["count"] == 2
+        assert stats["wait_ms"]["max"] >= 50
+        assert pool.recreate().metrics is pool_metrics
+        pool.dispose()
+
+
+class TestReplicaRouting:
+    """
+    Unit Test ReplicaRouter and RoutingSession against one primary and two replica databases
+    """
+
+    @pytest.fixture
+    def engines(self, tmp_path):
+        """
+        a primary and two replicas, each holding one document titled with its name
+        """
+        engines = {}
+        for name in ("primary", "replica-1", "replica-2"):
+            engine = create_engine(f"sqlite:///{tmp_path / name}.db", poolclass=QueuePool)
+            BaseModel.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(insert(Document).values(title=name))
+            engines[name] = engine
+        yield engines
+        for engine in engines.values():
+            engine.dispose()
+
+    @staticmethod
+    def create_session(engines: dict, clock=lambda: 0.0, **router_options) -> RoutingSession:
+        router = ReplicaRouter(
+            engines["primary"], [engines["replica-1"], engines["replica-2"]], clock=clock, **router_options
+        )
+        return RoutingSession(bind=engines["primary"], info={"router": router})
+
+    @staticmethod
+    def read_title(session: RoutingSession, use_replica: bool = True) -> str:
+        statement = select(Document.title).order_by(Document.id).limit(1)
+        return session.execute(statement.execution_options(use_replica=use_replica)).scalar_one()
+
+    def test_marked_reads_are_spread_over_replicas(self, engines: dict):
+        """
+        Test marked reads run on each replica in turn and unmarked reads on the primary
+        """
+        session = self.create_session(engines)
+
+        titles = [self.read_title(session) for _ in range(4)]
+
+        assert titles == ["replica-1", "replica-2", "replica-1", "replica-2"]
+        assert self.read_title(session, use_replica=False) == "primary"
+        session.close()
+
+    def test_reads_stay_on_the_primary_after_a_write(self, engines: dict):
+        """
+        Test the session that wrote and, for the read your writes window, the writing client's later requests
+        read the primary while other clients keep reading replicas
+        """
+        now = [100.0]
+        router = ReplicaRouter(
+            engines["primary"],
+            [engines["replica-1"], engines["replica-2"]],
+            read_your_writes_seconds=5.0,
+            clock=lambda: now[0],
+        )
+
+        writes = ClientWrites()
+        token = client_writes.set(writes)
+        writer = RoutingSession(bind=engines["primary"], info={"router": router})
+        writer.execute(insert(Document).values(title="written"))
+        writer.commit()
+        assert writer.execute(
+            select(Document.title).where(Document.title == "written").execution_options(use_replica=True)
+        ).scalar_one() == "written"
+        client_writes.reset(token)
+        writer.close()
+        assert writes.wrote and writes.last_write == 100.0
+
+        # another client is not pinned by the write
+        token = client_writes.set(ClientWrites())
+        other = RoutingSession(bind=engines["primary"], info={"router": router})
+        assert self.read_title(other).startswith("replica")
+        client_writes.reset(token)
+        other.close()
+
+        # the writing client's next request, on any worker, carries its last write and reads the primary
+        token = client_writes.set(ClientWrites(writes.last_write))
+        reader = RoutingSession(bind=engines["primary"], info={"router": router})
+        assert self.read_title(reader) == "primary"
+        now[0] = 106.0
+        assert self.read_title(reader).startswith("replica")
+        client_writes.reset(token)
+        reader.close()
+
+        assert router.get_stats()["pinned"] == 1
+
+    def test_last_write_in_the_future_does_not_pin(self, engines: dict):
+        """
+        Test a forged last write time ahead of the clock is ignored
+        """
+        session = self.create_session(engines)
+
+        token = client_writes.set(ClientWrites(last_write=1e12))
+        assert self.read_title(session).startswith("replica")
+        client_writes.reset(token)
+        session.close()
+
+    def test_least_connections(self, engines: dict):
+        """
+        Test the replica with fewer connections checked out is chosen
+        """
+        session = self.create_session(engines, policy="least_connections")
+
+        with engines["replica-1"].connect():
+            assert self.read_title(session) == "replica-2"
+        session.close()
+
+    def test_without_replicas_everything_runs_on_the_primary(self, engines: dict):
+        """
+        Test marked reads run on the primary when there are no replicas
+        """
+        session = RoutingSession(bind=engines["primary"], info={"router": ReplicaRouter(engines["primary"])})
+
+        assert self.read_title(session) == "primary"
+        session.close()
+
+    def test_unknown_policy(self, engines: dict):
+        """
+        Test an unknown replica policy is rejected
+        """
+        with pytest.raises(ValueError):
+            ReplicaRouter(engines["primary"], policy="random")
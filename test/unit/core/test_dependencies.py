@@ -0,0 +1,152 @@
+"""
+Dependencies Unit Test
+Author: Tom Aston
+"""
+
+from typing import Annotated
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import Depends, FastAPI
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import dependencies
+from app.core.cache import add_jti_to_blocklist
+from app.core.database import database
+from app.core.dependencies import AccessTokenBearer, AuthContext, RoleChecker, get_auth_context, get_current_user
+from app.errors import register_all_errors
+from app.models.user import User, UserRole
+
+
+def create_app(override_db: bool = True) -> FastAPI:
+    """
+    app with routes depending on the auth dependencies the way the routers do
+    """
+    app = FastAPI()
+    register_all_errors(app)
+    if override_db:
+        app.dependency_overrides[database.get_db] = lambda: AsyncMock()
+
+    # a bearer of the route's own, as the routers create theirs
+    access_token_bearer = AccessTokenBearer()
+    admin_role_checker = RoleChecker(["admin"])
+
+    @app.get("/claims")
+    async def claims(
+        token: Annotated[dict, Depends(access_token_bearer)],
+        _: Annotated[bool, Depends(admin_role_checker)],
+        auth: Annotated[AuthContext, Depends(get_auth_context)],
+    ) -> dict:
+        return {"user_id": auth.user_id, "role": auth.role}
+
+    @app.get("/user")
+    async def user(
+        _: Annotated[bool, Depends(admin_role_checker)],
+        user: Annotated[User, Depends(get_current_user)],
+        db: Annotated[AsyncSession, Depends(database.get_db)],
+    ) -> dict:
+        return {"username": user.username}
+
+    return app
+
+
+def mock_decode_token(role: str | None) -> MagicMock:
+    """
+    stand in for decode_token returning the claims of an access token, without a role claim if role is None
+    """
+    user_data = {"id": 3, "username": "tom", "email": "tom@test.com"}
+    if role is not None:
+        user_data["role"] = role
+    return MagicMock(return_value={"user": user_data, "jti": "jti-1", "refresh": False})
+
+
+@pytest.mark.usefixtures("fake_redis")
+class TestAuthDependencies:
+    """
+    Unit Test the auth dependencies
+    """
+
+    @pytest.mark.asyncio
+    async def test_role_is_checked_from_claims_with_one_decode_and_no_query(self):
+        """
+        Test a token with a role claim is decoded once per request and the user table is never queried
+        """
+        get_by_email = AsyncMock()
+
+        with (
+            patch.object(dependencies, "decode_token", mock_decode_token("admin")) as decode_token,
+            patch.object(dependencies.user_service, "get_by_email", get_by_email),
+        ):
+            async with AsyncClient(transport=ASGITransport(app=create_app()), base_url="http://test") as client:
+                response = await client.get("/claims", headers={"Authorization": "Bearer token"})
+
+        assert response.status_code == 200
+        assert response.json() == {"user_id": 3, "role": "admin"}
+        assert decode_token.call_count == 1
+        get_by_email.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_token_without_role_claim_loads_the_user_once(self):
+        """
+        Test a token issued without a role claim falls back to one user query shared with get_current_user
+        """
+        user = User(id=3, username="tom", email="tom@test.com", role=UserRole.ADMIN)
+        get_by_email = AsyncMock(return_value=user)
+
+        with (
+            patch.object(dependencies, "decode_token", mock_decode_token(None)),
+            patch.object(dependencies.user_service, "get_by_email", get_by_email),
+        ):
+            async with AsyncClient(transport=ASGITransport(app=create_app()), base_url="http://test") as client:
+                response = await client.get("/user", headers={"Authorization": "Bearer token"})
+
+        assert response.status_code == 200
+        assert response.json() == {"username": "tom"}
+        get_by_email.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_role_claim_not_allowed(self):
+        """
+        Test a role claim outside the allowed roles is forbidden
+        """
+        with patch.object(dependencies, "decode_token", mock_decode_token("user")):
+            async with AsyncClient(transport=ASGITransport(app=create_app()), base_url="http://test") as client:
+                response = await client.get("/claims", headers={"Authorization": "Bearer token"})
+
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_revoked_token_is_rejected(self):
+        """
+        Test a token whose jti is on the blocklist is rejected
+        """
+        await add_jti_to_blocklist("jti-1")
+
+        with patch.object(dependencies, "decode_token", mock_decode_token("admin")):
+            async with AsyncClient(transport=ASGITransport(app=create_app()), base_url="http://test") as client:
+                response = await client.get("/claims", headers={"Authorization": "Bearer token"})
+
+        assert response.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_dependencies_share_one_session_per_request(self):
+        """
+        Test the route, the role checker and get_current_user all get the same request session
+        """
+        user = User(id=3, username="tom", email="tom@test.com", role=UserRole.ADMIN)
+        get_by_email = AsyncMock(return_value=user)
+        request_sessions = database.request_sessions
+
+        with (
+            patch.object(dependencies, "decode_token", mock_decode_token(None)),
+            patch.object(dependencies.user_service, "get_by_email", get_by_email),
+        ):
+            async with AsyncClient(
+                transport=ASGITransport(app=create_app(override_db=False)), base_url="http://test"
+            ) as client:
+                response = await client.get("/user", headers={"Authorization": "Bearer token"})
+
+        assert response.status_code == 200
+        assert database.request_sessions - request_sessions == 1
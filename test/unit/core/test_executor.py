@@ -0,0 +1,93 @@
+"""
+NLP Executor Unit Test
+Author: Tom Aston
+"""
+
+import asyncio
+import math
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core.executor import NLPExecutor
+from app.errors import NLPExecutorBusyException
+
+
+class TestNLPExecutor:
+    """
+    Unit Test NLP Executor
+    """
+
+    @pytest.mark.asyncio
+    async def test_run_in_process_initializes_once_and_records_timings(self):
+        """
+        Test tasks run without workers call the initializer once and are timed per task name
+        """
+        initialized = []
+        executor = NLPExecutor(max_workers=0, max_pending=4, initializer=initialized.append, initargs=("model",))
+
+        assert await executor.run(math.factorial, 5) == 120
+        assert await executor.run(math.factorial, 3) == 6
+
+        stats = executor.get_stats()
+        assert initialized == ["model"]
+        assert stats["completed"] == 2
+        assert stats["tasks"]["factorial"]["count"] == 2
+        assert stats["pending"] == 0 and stats["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_rejects_tasks_beyond_max_pending(self):
+        """
+        Test a task is rejected once max_in_flight tasks are running and max_pending are waiting
+        """
+        release = threading.Event()
+        executor = NLPExecutor(max_workers=0, max_pending=1, max_in_flight=1)
+
+        running = asyncio.create_task(executor.run(release.wait, 5))
+        waiting = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+
+        assert executor.in_flight == 1 and executor.pending == 1
+        with pytest.raises(NLPExecutorBusyException):
+            await executor.run(release.wait, 5)
+
+        release.set()
+        assert await asyncio.gather(running, waiting) == [True, True]
+        assert executor.get_stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_run_in_worker_process(self):
+        """
+        Test tasks run in the process pool and the pool is recreated after shutdown
+        """
+        executor = NLPExecutor(max_workers=1, max_pending=4)
+        try:
+            assert await executor.run(math.factorial, 10) == 3628800
+            executor.shutdown()
+            assert await executor.run(math.factorial, 4) == 24
+        finally:
+            executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_broken_pool_does_not_shut_down_its_replacement(self):
+        """
+        Test a task failing with a pool that was already replaced leaves the replacement running
+        """
+        executor = NLPExecutor(max_workers=1, max_pending=4)
+        broken, replacement = MagicMock(), MagicMock()
+        executor._pool, executor._started = broken, True
+
+        async def run_in_executor(pool, fn, *args):
+            # another task failed with the same pool first and a request has started a new one
+            executor._pool = replacement
+            raise BrokenProcessPool()
+
+        with patch.object(asyncio.get_running_loop(), "run_in_executor", run_in_executor):
+            with pytest.raises(BrokenProcessPool):
+                await executor.run(math.factorial, 3)
+
+        assert executor._pool is replacement
+        replacement.shutdown.assert_not_called()
+        assert executor.get_stats()["failed"] == 1
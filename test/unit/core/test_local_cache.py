@@ -0,0 +1,42 @@
+"""
+Local Cache Unit Test
+Author: Tom Aston
+"""
+
+from app.core.local_cache import LocalCache
+
+
+class TestLocalCache:
+    """
+    Unit Test Local Cache
+    """
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """
+        Test the least recently read entry is evicted once the cache is full
+        """
+        local_cache = LocalCache(max_size=2, ttl=60)
+        local_cache.set("a", 1)
+        local_cache.set("b", 2)
+        local_cache.get("a")
+        local_cache.set("c", 3)
+
+        assert local_cache.get("b") is None
+        assert local_cache.get("a") == 1 and local_cache.get("c") == 3
+        assert local_cache.get_stats()["evictions"] == 1
+
+    def test_entries_expire_after_ttl(self):
+        """
+        Test an entry is no longer served once its ttl has passed
+        """
+        now = [0.0]
+        local_cache = LocalCache(max_size=8, ttl=5, clock=lambda: now[0])
+        local_cache.set("a", 1)
+
+        now[0] = 4.9
+        assert local_cache.get("a") == 1
+        now[0] = 5.0
+        assert local_cache.get("a") is None
+
+        stats = local_cache.get_stats()
+        assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 1, 1, 0)
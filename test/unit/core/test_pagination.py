@@ -0,0 +1,33 @@
+"""
+Pagination Unit Test
+Author: Tom Aston
+"""
+
+import pytest
+
+from app.core.pagination import PageCursor, SortEnum, decode_cursor, encode_cursor, pagination_params
+from app.errors import InvalidCursorException
+
+
+class TestPagination:
+    """
+    Unit Test Pagination
+    """
+
+    def test_cursor_round_trip(self):
+        """
+        Test an encoded cursor decodes to the same position
+        """
+        cursor = PageCursor(id=42, direction="prev", order=SortEnum.ASC)
+
+        assert decode_cursor(encode_cursor(cursor)) == cursor
+
+    @pytest.mark.parametrize(
+        "cursor", ["", "not a cursor", "eyJpZCI6MX0", encode_cursor(PageCursor(1, "next", SortEnum.ASC))]
+    )
+    def test_invalid_cursor_is_rejected(self, cursor: str):
+        """
+        Test malformed cursors, and a cursor issued for the other order, are rejected
+        """
+        with pytest.raises(InvalidCursorException):
+            pagination_params(page=1, perPage=10, order=SortEnum.DESC, cursor=cursor)
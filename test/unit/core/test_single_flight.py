@@ -0,0 +1,61 @@
+"""
+Single Flight Unit Test
+Author: Tom Aston
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    """
+    Unit Test Single Flight
+    """
+
+    @pytest.mark.asyncio
+    async def test_failed_call_is_raised_to_every_waiter_and_not_remembered(self):
+        """
+        Test every caller of a failing call gets its exception and the next call runs again
+        """
+        single_flight = SingleFlight()
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("query failed")
+
+        results = await asyncio.gather(*(single_flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(calls) == 1
+        assert "key" not in single_flight
+
+        async def succeed():
+            return 1
+
+        assert await single_flight.do("key", succeed) == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_first_caller_does_not_cancel_the_others(self):
+        """
+        Test the caller that started a call can be cancelled while another caller still gets its result
+        """
+        single_flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(single_flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(single_flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "result"
+        assert leader.cancelled()
+        assert "key" not in single_flight
@@ -0,0 +1,53 @@
+"""
+Document Embedding Unit Test
+Author: Tom Aston
+"""
+
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.nlp.embedding import DocumentEmbedder, bytes_to_vector, vector_to_bytes
+from app.nlp.similarity_calculator import cosine_similarity
+
+
+class TestDocumentEmbedding:
+    """
+    Unit Test Document Embedding
+    """
+
+    def test_vector_bytes_round_trip(self):
+        """
+        Test vectors are stored as compact float32 bytes and decoded unchanged
+        """
+        vector = np.array([0.5, -1.25, 3.0], dtype=np.float64)
+
+        data = vector_to_bytes(vector)
+        decoded = bytes_to_vector(data)
+
+        assert len(data) == 3 * 4
+        assert decoded.dtype == np.float32
+        assert np.array_equal(decoded, vector.astype(np.float32))
+
+    def test_embed_document(self):
+        """
+        Test a document is embedded from its title and content and tagged with the model id
+        """
+        calculator = MagicMock()
+        calculator.embed.return_value = np.ones(4, dtype=np.float32)
+        calculator.model_id = "en_core_web_md@3.8.0"
+        embedder = DocumentEmbedder(calculator=calculator)
+
+        embedding = embedder.embed_document("title", "content")
+
+        calculator.embed.assert_called_once_with("title content")
+        assert np.array_equal(bytes_to_vector(embedding.embedding), np.ones(4, dtype=np.float32))
+        assert embedding.embedding_model == "en_core_web_md@3.8.0"
+
+    def test_cosine_similarity(self):
+        """
+        Test cosine similarity including the zero vector case
+        """
+        assert cosine_similarity(np.array([1.0, 0.0]), np.array([2.0, 0.0])) == 1.0
+        assert cosine_similarity(np.array([1.0, 0.0]), np.array([0.0, 3.0])) == 0.0
+        assert cosine_similarity(np.array([1.0, 0.0]), np.zeros(2)) == 0.0
@@ -0,0 +1,54 @@
+"""
+Embedding Engine Unit Test
+Author: Tom Aston
+"""
+
+from unittest.mock import MagicMock
+
+import numpy as np
+import spacy
+
+from app.nlp.embedding_engine import VECTORS_ONLY_EXCLUDE, SpacyEmbeddingEngine
+
+
+def blank_pipeline_with_vectors() -> spacy.language.Language:
+    nlp = spacy.blank("en")
+    nlp.vocab.set_vector("cat", np.array([1.0, 0.0, 0.0], dtype=np.float32))
+    nlp.vocab.set_vector("dog", np.array([0.0, 1.0, 0.0], dtype=np.float32))
+    return nlp
+
+
+class TestSpacyEmbeddingEngine:
+    """
+    Unit Test spaCy Embedding Engine
+    """
+
+    def test_embed_batch_matches_doc_vector(self):
+        """
+        Test batched nlp.pipe embeddings match Doc.vector for each text
+        """
+        nlp = blank_pipeline_with_vectors()
+        resources = MagicMock()
+        resources.get_spacy_model.return_value = nlp
+        engine = SpacyEmbeddingEngine(resources=resources, batch_size=2)
+        texts = ["cat dog", "dog", "bird", "", "cat cat bird"]
+
+        vectors = engine.embed_batch(texts)
+
+        assert vectors.dtype == np.float32
+        assert vectors.shape == (5, 3)
+        for text, vector in zip(texts, vectors):
+            assert np.allclose(vector, nlp(text).vector)
+
+    def test_vectors_only_excludes_pipeline_components(self):
+        """
+        Test vectors only mode loads the model without the components vectors do not need
+        """
+        resources = MagicMock()
+        resources.get_spacy_model.return_value = blank_pipeline_with_vectors()
+
+        SpacyEmbeddingEngine(model_name="en_core_web_md", resources=resources).embed_batch(["cat"])
+        resources.get_spacy_model.assert_called_with("en_core_web_md", exclude=VECTORS_ONLY_EXCLUDE)
+
+        SpacyEmbeddingEngine(model_name="en_core_web_md", vectors_only=False, resources=resources).embed_batch(["cat"])
+        resources.get_spacy_model.assert_called_with("en_core_web_md", exclude=())
@@ -0,0 +1,114 @@
+"""
+IVF Index Unit Test
+Author: Tom Aston
+"""
+
+import numpy as np
+
+from app.nlp.index_evaluation import recall_at_k
+from app.nlp.ivf_index import IVFIndex
+from app.nlp.vector_index import VectorIndex
+
+
+def build_indexes(n: int, n_lists: int, n_probe: int) -> tuple[IVFIndex, VectorIndex, np.ndarray]:
+    rng = np.random.default_rng(1)
+    topics = rng.standard_normal((20, 32)).astype(np.float32)
+    vectors = topics[rng.integers(0, 20, n)] + 0.3 * rng.standard_normal((n, 32)).astype(np.float32)
+    ids = list(range(n))
+    titles = [f"doc {i}" for i in ids]
+
+    ivf_index = IVFIndex(n_lists=n_lists, n_probe=n_probe)
+    ivf_index.add_batch(ids, titles, vectors)
+    exact_index = VectorIndex()
+    exact_index.add_batch(ids, titles, vectors)
+    return ivf_index, exact_index, vectors
+
+
+class TestIVFIndex:
+    """
+    Unit Test IVF Index
+    """
+
+    def test_probing_every_list_is_exact(self):
+        """
+        Test recall is perfect when every list is probed
+        """
+        ivf_index, exact_index, vectors = build_indexes(n=2000, n_lists=16, n_probe=16)
+
+        assert ivf_index.is_trained
+        assert recall_at_k(ivf_index, exact_index, vectors[:50], k=10) == 1.0
+
+    def test_recall_with_few_probes(self):
+        """
+        Test clustered data keeps high recall while probing a fraction of the lists
+        """
+        ivf_index, exact_index, vectors = build_indexes(n=2000, n_lists=16, n_probe=4)
+
+        assert recall_at_k(ivf_index, exact_index, vectors[:50], k=10) >= 0.9
+
+    def test_incremental_insert_and_delete(self):
+        """
+        Test documents added and removed after training are searchable and then gone
+        """
+        ivf_index, _, vectors = build_indexes(n=2000, n_lists=16, n_probe=4)
+
+        ivf_index.add(5000, "new doc", vectors[0] * 2)
+        assert ivf_index.search(vectors[0], k=2)[0].id in {0, 5000}
+        assert 5000 in ivf_index
+
+        assert ivf_index.remove(5000)
+        assert ivf_index.remove(0)
+        assert {match.id for match in ivf_index.search(vectors[0], k=5)}.isdisjoint({0, 5000})
+        assert len(ivf_index) == 1999
+
+    def test_untrained_index_searches_exactly(self):
+        """
+        Test an index below its training threshold answers with exact search
+        """
+        ivf_index = IVFIndex(n_lists=16, n_probe=1)
+        ivf_index.add(1, "x", np.array([1.0, 0.0]))
+        ivf_index.add(2, "y", np.array([0.0, 1.0]))
+
+        assert not ivf_index.is_trained
+        assert [match.id for match in ivf_index.search(np.array([0.1, 1.0]), k=2)] == [2, 1]
+
+    def test_background_training_replays_changes_made_while_fitting(self):
+        """
+        Test lists fitted off the index are installed with the adds and removes made since their snapshot
+        """
+        rng = np.random.default_rng(2)
+        vectors = rng.standard_normal((200, 8)).astype(np.float32)
+        ivf_index = IVFIndex(n_lists=4, n_probe=4, background_training=True)
+        ivf_index.add_batch(list(range(200)), [f"doc {i}" for i in range(200)], vectors)
+
+        assert not ivf_index.is_trained
+        assert ivf_index.needs_training
+
+        snapshot = ivf_index.snapshot()
+        ivf_index.add(500, "new doc", vectors[0])
+        ivf_index.remove(0)
+        ivf_index.add(1, "moved doc", -vectors[1])
+        trained = ivf_index.fit(snapshot)
+        assert not ivf_index.is_trained
+
+        ivf_index.install(trained)
+
+        assert ivf_index.is_trained
+        assert not ivf_index.needs_training
+        assert len(ivf_index) == 200
+        assert 500 in ivf_index and 0 not in ivf_index
+        assert ivf_index.search(-vectors[1], k=1)[0].title == "moved doc"
+
+    def test_lists_trained_before_a_clear_are_dropped(self):
+        """
+        Test installing lists fitted on a snapshot from before a clear leaves the index untrained
+        """
+        ivf_index = IVFIndex(n_lists=2, n_probe=1, train_threshold=2, background_training=True)
+        ivf_index.add_batch([1, 2], ["x", "y"], np.eye(2, dtype=np.float32))
+        snapshot = ivf_index.snapshot()
+        ivf_index.clear()
+
+        ivf_index.install(ivf_index.fit(snapshot))
+
+        assert not ivf_index.is_trained
+        assert len(ivf_index) == 0
@@ -0,0 +1,65 @@
+"""
+Micro Batcher Unit Test
+Author: Tom Aston
+"""
+
+import asyncio
+
+import pytest
+
+from app.nlp.micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher:
+    """
+    Unit Test Micro Batcher
+    """
+
+    @pytest.mark.asyncio
+    async def test_concurrent_items_are_processed_as_one_batch(self):
+        """
+        Test concurrent submits within the wait window share one batch and each gets its own result
+        """
+        batches = []
+
+        async def process_batch(items):
+            batches.append(items)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=10, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        assert results == [0, 2, 4, 6, 8]
+        assert batches == [[0, 1, 2, 3, 4]]
+        assert batcher.get_stats()["mean_batch_size"] == 5
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_flushed_without_waiting(self):
+        """
+        Test a batch is processed as soon as max_batch_size items are queued
+        """
+        batches = []
+
+        async def process_batch(items):
+            batches.append(items)
+            return items
+
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait_ms=10_000)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), timeout=1)
+
+        assert results == [0, 1, 2, 3]
+        assert batches == [[0, 1], [2, 3]]
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_fails_every_caller(self):
+        """
+        Test an exception from process_batch is raised to every caller in the batch
+        """
+
+        async def process_batch(items):
+            raise RuntimeError("model unavailable")
+
+        batcher = MicroBatcher(process_batch, max_batch_size=10, max_wait_ms=1)
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
@@ -100,3 +100,65 @@ class TestPreprocessorSuite:
         actual_cleaned_text = text_preprocessor.get_cleaned_text(test_string)
         expected_cleaned_text = 'run eat'
         assert actual_cleaned_text == expected_cleaned_text
+
+
+    def test_get_cleaned_texts(self) -> None:
+        '''
+        ensure batch cleaning matches cleaning each text individually
+        '''
+        text_preprocessor = TextPreprocessor()
+        test_strings = ['Hello my name is John', 'i am at the meeting call', '', 'running eating']
+        actual_cleaned_texts = text_preprocessor.get_cleaned_texts(iter(test_strings))
+        expected_cleaned_texts = ['hello name john', 'meet call', '', 'run eat']
+        assert actual_cleaned_texts == expected_cleaned_texts
+
+
+    def test_fused_pipeline_matches_stepwise_pipeline(self) -> None:
+        '''
+        ensure the fused single pass cleaner produces identical output to the stepwise pipeline
+        '''
+        text_preprocessor = TextPreprocessor()
+        test_strings = [
+            'The QUICK brown fox; jumped over 2 lazy dogs!!',
+            'abc1def ghi’2jkl mno—pqr',
+            '\tTabs\nand newlines\r\n  everywhere  ',
+            'Cafés & naïve résumés were İstanbul-based',
+            'x² equals 4５ and ٣ items',
+            'it\'s they\'re we\'ve THE The the',
+            '',
+            '    ',
+            '1234 5678',
+        ]
+        for test_string in test_strings:
+            expected_cleaned_text = text_preprocessor._get_cleaned_text_stepwise(test_string)
+            assert text_preprocessor.get_cleaned_text(test_string) == expected_cleaned_text
+        assert text_preprocessor.get_cleaned_texts(test_strings) == [
+            text_preprocessor._get_cleaned_text_stepwise(test_string) for test_string in test_strings
+        ]
+
+
+    def test_stem_cache_counts_hits_and_misses(self) -> None:
+        '''
+        ensure repeated words are served from the stem cache
+        '''
+        text_preprocessor = TextPreprocessor(stem_cache_size=2)
+        text_preprocessor.get_cleaned_texts(['running eating', 'running running'])
+        stats = text_preprocessor.get_stem_cache_stats()
+        assert stats['misses'] == 2
+        assert stats['hits'] == 2
+        assert stats['size'] == 2
+        assert stats['max_size'] == 2
+        assert stats['hit_ratio'] == 0.5
+        text_preprocessor.clear_stem_cache()
+        assert text_preprocessor.get_stem_cache_stats()['size'] == 0
+
+
+    def test_stem_cache_is_bounded(self) -> None:
+        '''
+        ensure the stem cache evicts least recently used words once full
+        '''
+        text_preprocessor = TextPreprocessor(stem_cache_size=2)
+        assert text_preprocessor.get_cleaned_text('running eating walking running') == 'run eat walk run'
+        stats = text_preprocessor.get_stem_cache_stats()
+        assert stats['size'] == 2
+        assert stats['misses'] == 4
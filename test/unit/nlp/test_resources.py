@@ -0,0 +1,53 @@
+"""
+NLP Resources Unit Test
+Author: Tom Aston
+"""
+
+from unittest.mock import MagicMock, patch
+
+from app.nlp.resources import NLPResources
+
+
+class TestNLPResources:
+    """
+    Unit Test NLP Resource Manager
+    """
+
+    def test_stop_words_are_loaded_from_vendored_file(self):
+        """
+        Test stopwords are read from the packaged data directory without nltk
+        """
+        resources = NLPResources()
+
+        stop_words = resources.get_stop_words("english")
+
+        assert {"the", "and", "or", "am", "at"} <= stop_words
+        assert "meeting" not in stop_words
+        assert resources.is_loaded("stopwords:english")
+        assert resources.load_timings["stopwords:english"] >= 0
+
+    def test_resources_are_loaded_once(self):
+        """
+        Test a resource is only loaded on first use and then served from memory
+        """
+        resources = NLPResources()
+        fake_model = MagicMock()
+
+        with patch("spacy.load", return_value=fake_model) as mock_load:
+            assert not resources.is_loaded("spacy:en_core_web_md")
+
+            assert resources.get_spacy_model("en_core_web_md") is fake_model
+            assert resources.get_spacy_model("en_core_web_md") is fake_model
+
+            mock_load.assert_called_once_with("en_core_web_md")
+
+    def test_warm_up_records_load_timings(self):
+        """
+        Test warm up eagerly loads resources and reports timings
+        """
+        resources = NLPResources()
+
+        with patch("spacy.load", return_value=MagicMock()):
+            timings = resources.warm_up(spacy_models=["en_core_web_md"])
+
+        assert set(timings) == {"stopwords:english", "spacy:en_core_web_md"}
@@ -0,0 +1,61 @@
+"""
+Similarity Matrix Unit Test
+Author: Tom Aston
+"""
+
+import numpy as np
+
+from app.nlp.similarity_matrix import similarity_matrix, top_k_similarities
+
+
+def cosine_matrix(rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    rows = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+    columns = columns / np.linalg.norm(columns, axis=1, keepdims=True)
+    return rows @ columns.T
+
+
+class TestSimilarityMatrix:
+    """
+    Unit Test Similarity Matrix
+    """
+
+    def test_blocked_matrix_matches_dense_product(self):
+        """
+        Test the blocked product equals the dense cosine matrix when rows do not divide evenly into blocks
+        """
+        rng = np.random.default_rng(0)
+        rows = rng.standard_normal((23, 8)).astype(np.float32)
+        columns = rng.standard_normal((17, 8)).astype(np.float32)
+
+        matrix = similarity_matrix(rows, columns, block_size=5)
+
+        assert matrix.shape == (23, 17)
+        assert np.allclose(matrix, cosine_matrix(rows, columns), atol=1e-6)
+
+    def test_top_k_matches_dense_top_k(self):
+        """
+        Test tiled top k selection agrees with sorting the dense matrix
+        """
+        rng = np.random.default_rng(1)
+        rows = rng.standard_normal((30, 8)).astype(np.float32)
+        columns = rng.standard_normal((41, 8)).astype(np.float32)
+
+        indices, scores = top_k_similarities(rows, columns, k=4, block_size=7)
+
+        dense = cosine_matrix(rows, columns)
+        expected = np.argsort(-dense, axis=1)[:, :4]
+        assert np.array_equal(indices, expected)
+        assert np.allclose(scores, np.take_along_axis(dense, expected, axis=1), atol=1e-6)
+
+    def test_top_k_excludes_self_matches(self):
+        """
+        Test a row is never its own match when comparing a set with itself
+        """
+        rng = np.random.default_rng(2)
+        vectors = rng.standard_normal((12, 4)).astype(np.float32)
+
+        indices, _ = top_k_similarities(vectors, vectors, k=20, block_size=5, exclude_self=True)
+
+        assert indices.shape == (12, 11)
+        for row, row_indices in enumerate(indices):
+            assert row not in row_indices
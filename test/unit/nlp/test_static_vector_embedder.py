@@ -0,0 +1,72 @@
+"""
+Static Vector Embedder Unit Test
+Author: Tom Aston
+"""
+
+from unittest.mock import MagicMock
+
+import numpy as np
+import spacy
+
+from app.nlp.embedding_engine import SpacyEmbeddingEngine
+from app.nlp.static_vector_embedder import OOV_ROW, StaticVectorEmbedder
+
+
+class TestStaticVectorEmbedder:
+    """
+    Unit Test Static Vector Embedder
+    """
+
+    def test_embed_batch_matches_doc_vector(self):
+        """
+        Test vocabulary lookups reproduce Doc.vector including out of vocabulary tokens, empty texts, contractions,
+        unicode punctuation and repeated whitespace
+        """
+        rng = np.random.default_rng(0)
+        nlp = spacy.blank("en")
+        for word in ["fire", "electr", "cupboard", "cabinet", "smoke", "ca", "do", "nt", "n't", "\u201c", "\u2014"]:
+            nlp.vocab.set_vector(word, rng.standard_normal(8).astype(np.float32))
+        resources = MagicMock()
+        resources.get_spacy_model.return_value = nlp
+        embedder = StaticVectorEmbedder(resources=resources)
+        texts = [
+            "fire electr cupboard",
+            "electr cabinet found smoke",
+            "unknown words only",
+            "",
+            "fire fire",
+            "cant dont smoke",
+            "\u201cfire\u201d \u2014 smoke",
+            "fire   smoke\n",
+        ]
+
+        vectors = embedder.embed_batch(texts)
+
+        assert vectors.dtype == np.float32
+        assert vectors.shape == (8, 8)
+        for text, vector in zip(texts, vectors):
+            assert np.allclose(vector, nlp(text).vector, rtol=1e-6, atol=1e-7)
+
+    def test_token_rows_are_cached(self):
+        """
+        Test each distinct token is looked up in the vectors table once
+        """
+        nlp = spacy.blank("en")
+        nlp.vocab.set_vector("cat", np.ones(4, dtype=np.float32))
+        resources = MagicMock()
+        resources.get_spacy_model.return_value = nlp
+        embedder = StaticVectorEmbedder(resources=resources)
+
+        embedder.embed_batch(["cat bird", "cat cat bird"])
+
+        assert embedder._rows == {"cat": 0, "bird": OOV_ROW}
+
+    def test_model_id_names_the_backend(self):
+        """
+        Test the model id differs from the nlp.pipe engine's so switching backends marks embeddings as stale
+        """
+        nlp = spacy.blank("en")
+        resources = MagicMock()
+        resources.get_spacy_model.return_value = nlp
+
+        assert StaticVectorEmbedder(resources=resources).model_id != SpacyEmbeddingEngine(resources=resources).model_id
@@ -0,0 +1,81 @@
+"""
+Vector Index Unit Test
+Author: Tom Aston
+"""
+
+import numpy as np
+import pytest
+
+from app.nlp.vector_index import VectorIndex
+
+
+class TestVectorIndex:
+    """
+    Unit Test Vector Index
+    """
+
+    def test_search_returns_top_k_by_cosine_similarity(self):
+        """
+        Test search matches brute force cosine similarity ordering
+        """
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((500, 16)).astype(np.float32)
+        index = VectorIndex(initial_capacity=8)
+        index.add_batch(list(range(500)), [f"doc {i}" for i in range(500)], vectors)
+        query = rng.standard_normal(16).astype(np.float32)
+
+        matches = index.search(query, k=5)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected_scores = normalized @ (query / np.linalg.norm(query))
+        expected_ids = list(np.argsort(-expected_scores)[:5])
+        assert [match.id for match in matches] == expected_ids
+        assert matches[0].title == f"doc {expected_ids[0]}"
+        assert matches[0].score == pytest.approx(float(expected_scores[expected_ids[0]]), abs=1e-5)
+
+    def test_add_replaces_and_remove_keeps_matrix_contiguous(self):
+        """
+        Test re-adding an id overwrites it and removing swaps the last row into the freed slot
+        """
+        index = VectorIndex(initial_capacity=2)
+        index.add(1, "x", np.array([1.0, 0.0]))
+        index.add(2, "y", np.array([0.0, 1.0]))
+        index.add(3, "z", np.array([1.0, 1.0]))
+        index.add(1, "x updated", np.array([0.0, 2.0]))
+
+        assert len(index) == 3
+        assert index.remove(1)
+        assert not index.remove(1)
+        assert 1 not in index
+        assert len(index) == 2
+
+        matches = index.search(np.array([0.0, 1.0]), k=10)
+        assert [(match.id, match.title) for match in matches] == [(2, "y"), (3, "z")]
+        assert np.allclose(np.linalg.norm(index.vectors, axis=1), 1.0)
+
+    def test_search_empty_index_and_dimension_mismatch(self):
+        """
+        Test searching an empty index returns nothing and mismatched dimensions are rejected
+        """
+        index = VectorIndex()
+        assert index.search(np.ones(3), k=3) == []
+
+        index.add(1, "x", np.ones(3))
+        with pytest.raises(ValueError):
+            index.add(2, "y", np.ones(4))
+
+    def test_search_batch_matches_single_searches(self):
+        """
+        Test a batch search returns the same matches as searching each query on its own
+        """
+        rng = np.random.default_rng(3)
+        index = VectorIndex()
+        index.add_batch(list(range(200)), [f"doc {i}" for i in range(200)], rng.standard_normal((200, 8)))
+        queries = rng.standard_normal((6, 8)).astype(np.float32)
+
+        batch_matches = index.search_batch(queries, k=4)
+
+        for query, matches in zip(queries, batch_matches):
+            expected = index.search(query, k=4)
+            assert [match.id for match in matches] == [match.id for match in expected]
+            assert np.allclose([match.score for match in matches], [match.score for match in expected], atol=1e-5)
@@ -0,0 +1,190 @@
+"""
+Unit Test Document Repository
+Author: Tom Aston
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.pagination import PageCursor, Pagination, SortEnum
+from app.models.document import Document
+from app.models.user import User  # noqa: F401 registers the User mapper Document relates to
+from app.nlp.embedding import DocumentEmbedding
+from app.repository.document_repository import DocumentRepository
+from app.schema.document_schema import (
+    DocumentCreateClientRequest,
+    DocumentGetByIdClientResponse,
+    DocumentUpdateClientRequest,
+)
+
+document_repository = DocumentRepository()
+
+
+class TestDocumentRepository:
+    """
+    Unit Test Document Repository
+    """
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "order, direction, expected_sql",
+        [
+            (SortEnum.DESC, "next", "WHERE document.id < 50 ORDER BY document.id DESC"),
+            (SortEnum.DESC, "prev", "WHERE document.id > 50 ORDER BY document.id ASC"),
+            (SortEnum.ASC, "next", "WHERE document.id > 50 ORDER BY document.id ASC"),
+            (SortEnum.ASC, "prev", "WHERE document.id < 50 ORDER BY document.id DESC"),
+        ],
+    )
+    async def test_get_all_paginated_seeks_from_the_cursor(
+        self, mock_db_session: AsyncMock, order: SortEnum, direction: str, expected_sql: str
+    ):
+        """
+        Test a cursor page seeks the id index without OFFSET and fetches one extra row to detect more pages
+        """
+        # rows in the order the database scans them away from the cursor
+        scanned = [Document(id=id) for id in (51, 52, 53)]
+        result = MagicMock()
+        result.scalars.return_value.all.return_value = scanned
+        mock_db_session.execute = AsyncMock(return_value=result)
+        pagination = Pagination(perPage=2, page=1, order=order, cursor=PageCursor(50, direction, order))
+
+        documents, has_more = await document_repository.get_all_paginated(mock_db_session, pagination)
+
+        statement = mock_db_session.execute.call_args.args[0]
+        sql = " ".join(str(statement.compile(compile_kwargs={"literal_binds": True})).split())
+        assert expected_sql in sql
+        assert "LIMIT 3" in sql and "OFFSET" not in sql
+        assert has_more
+        # a previous page is read backwards and returned in the requested order
+        expected_ids = [51, 52] if direction == "next" else [52, 51]
+        assert [document.id for document in documents] == expected_ids
+
+    @pytest.mark.asyncio
+    async def test_get_all_with_schema_selects_only_its_columns(self, mock_db_session: AsyncMock):
+        """
+        Test a projected read selects only the response schema columns and returns rows rather than documents
+        """
+        rows = [MagicMock(id=1, title="t", created=None)]
+        result = MagicMock()
+        result.all.return_value = rows
+        mock_db_session.execute = AsyncMock(return_value=result)
+
+        documents = await document_repository.get_all(mock_db_session, schema=DocumentGetByIdClientResponse)
+
+        statement = mock_db_session.execute.call_args.args[0]
+        sql = " ".join(str(statement.compile()).split())
+        assert sql.startswith("SELECT document.id, document.title, document.created FROM document")
+        assert statement.get_execution_options()["use_replica"]
+        assert documents == rows
+        result.scalars.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_create_document_is_one_insert_returning(self, mock_db_session: AsyncMock):
+        """
+        Test a document is created with one INSERT ... RETURNING and no refresh
+        """
+        created = Document(id=1, title="t")
+        mock_db_session.execute = AsyncMock(return_value=self.__result(created))
+
+        db_document = await document_repository.create_document(
+            DocumentCreateClientRequest(title="t", content="c", description="d"), mock_db_session, 2
+        )
+
+        assert db_document is created
+        assert self.__statements(mock_db_session) == ["INSERT"]
+        mock_db_session.commit.assert_awaited_once()
+        mock_db_session.refresh.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "changes, expected_statements, expected_embedded",
+        [
+            ({"description": "d"}, ["UPDATE"], None),
+            ({"title": "new", "content": "new content"}, ["UPDATE"], ("new", "new content")),
+            ({"title": "new"}, ["SELECT", "UPDATE"], ("new", "content")),
+        ],
+    )
+    async def test_update_document_is_one_update_returning(
+        self, mock_db_session: AsyncMock, changes: dict, expected_statements: list[str], expected_embedded: tuple
+    ):
+        """
+        Test an update is one UPDATE ... RETURNING writing the embedding computed beforehand, after a read of
+        the unchanged column when the embedding depends on it
+        """
+        updated = Document(id=1, title=changes.get("title", "t"), content="content", embedding=b"e")
+        mock_db_session.execute = AsyncMock(return_value=self.__result(updated))
+        embed = AsyncMock(return_value=DocumentEmbedding(embedding=b"v", embedding_model="model@1"))
+
+        db_document = await document_repository.update_document(
+            1, DocumentUpdateClientRequest(**changes), mock_db_session, embed=embed
+        )
+
+        assert db_document is updated
+        assert self.__statements(mock_db_session) == expected_statements
+        update_calls = [call for call in mock_db_session.execute.call_args_list if "UPDATE" in self.__sql(call.args[0])]
+        assert len(update_calls) == 1 and "RETURNING" in self.__sql(update_calls[0].args[0])
+        if expected_embedded is None:
+            embed.assert_not_awaited()
+        else:
+            embed.assert_awaited_once_with(*expected_embedded)
+            assert "embedding" in self.__sql(update_calls[0].args[0]).split("RETURNING")[0]
+        # the embedding was computed with no transaction open, after any read was committed
+        assert mock_db_session.commit.await_count == len(expected_statements)
+        mock_db_session.refresh.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "changes, expected_statements", [({"description": "d"}, ["UPDATE"]), ({"title": "t"}, ["SELECT"])]
+    )
+    async def test_update_document_not_found(
+        self, mock_db_session: AsyncMock, changes: dict, expected_statements: list[str]
+    ):
+        """
+        Test updating a missing document returns None without embedding or committing
+        """
+        mock_db_session.execute = AsyncMock(return_value=self.__result(None))
+        embed = AsyncMock()
+
+        db_document = await document_repository.update_document(
+            1, DocumentUpdateClientRequest(**changes), mock_db_session, embed=embed
+        )
+
+        assert db_document is None
+        assert self.__statements(mock_db_session) == expected_statements
+        embed.assert_not_awaited()
+        mock_db_session.commit.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("found", [True, False])
+    async def test_delete_document_is_one_delete_returning(self, mock_db_session: AsyncMock, found: bool):
+        """
+        Test a document is deleted with one DELETE ... RETURNING and a missing document returns None
+        """
+        row = MagicMock(id=1, title="t") if found else None
+        result = MagicMock()
+        result.first.return_value = row
+        mock_db_session.execute = AsyncMock(return_value=result)
+
+        db_document = await document_repository.delete_document(1, mock_db_session)
+
+        assert db_document is row
+        assert self.__statements(mock_db_session) == ["DELETE"]
+        assert "RETURNING document.id, document.title" in self.__sql(mock_db_session.execute.call_args.args[0])
+        assert mock_db_session.commit.await_count == (1 if found else 0)
+
+    @staticmethod
+    def __result(document: Document | None) -> MagicMock:
+        result = MagicMock()
+        result.scalars.return_value.first.return_value = document
+        result.scalars.return_value.one.return_value = document
+        result.first.return_value = document
+        return result
+
+    @classmethod
+    def __statements(cls, mock_db_session: AsyncMock) -> list[str]:
+        return [cls.__sql(call.args[0]).split()[0] for call in mock_db_session.execute.call_args_list]
+
+    @staticmethod
+    def __sql(statement) -> str:
+        return " ".join(str(statement.compile()).split())
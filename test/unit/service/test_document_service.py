@@ -4,17 +4,43 @@ Author: Tom Aston
 """
 
 from datetime import datetime
-from unittest.mock import AsyncMock, patch
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import asyncio
+import contextlib
+import json
+import threading
+import time
+
+import numpy as np
 import pytest
+from sqlalchemy.exc import IntegrityError
 
 from app.models.document import Document
+from app.errors import DocumentNotFoundException
+from app.models.user import User  # noqa: F401 registers the User mapper Document relates to
+from app.nlp import tasks
+from app.nlp.embedding import DocumentEmbedding, vector_to_bytes
+from app.nlp.ivf_index import IVFIndex
+from app.nlp.vector_index import SimilarityMatch, VectorIndex
 from app.repository.document_repository import DocumentRepository
-from app.schema.document_schema import DocumentCreateClientRequest
-from app.service.document_service import DocumentService
+from app.core.cache import get_docs_cache_stats
+from app.core.pagination import PageCursor, Pagination, SortEnum, decode_cursor
+from app.schema.document_schema import (
+    DocumentCreateClientRequest,
+    DocumentGetByIdClientResponse,
+    DocumentSimilarityClientRequest,
+    DocumentUpdateClientRequest,
+    SimilarityMatrixClientRequest,
+)
+from app.service import document_service as document_service_module
+from app.service.document_service import DocumentService, split_lines
 
 document_service = DocumentService()
 
+pytestmark = pytest.mark.usefixtures("fake_redis")
+
 
 class TestDocumentService:
     """
@@ -34,17 +60,21 @@ class TestDocumentService:
             created=datetime.strptime("2021-01-01 00:00:00", "%Y-%m-%d %H:%M:%S"),
         )
 
+        embedding = DocumentEmbedding(embedding=vector_to_bytes(np.ones(2)), embedding_model="model@1")
+
         with patch.object(
             DocumentRepository,
             "create_document",
             AsyncMock(return_value=created_document),
-        ) as mock_repo:
+        ) as mock_repo, patch.object(
+            document_service_module.nlp_executor, "run", AsyncMock(return_value=[embedding])
+        ) as mock_run:
             test_client_request = DocumentCreateClientRequest(
                 title="test", content="test", description="test"
             )
 
             response = await document_service.create_document(
-                test_client_request, mock_db_session
+                test_client_request, mock_db_session, 1
             )
 
             assert response.id == created_document.id
@@ -55,8 +85,9 @@ class TestDocumentService:
 
             # ensure mock was called
             mock_repo.assert_called_once_with(
-                document_body=test_client_request, db=mock_db_session
+                document_body=test_client_request, db=mock_db_session, user_id=1, embedding=embedding
             )
+            mock_run.assert_called_once_with(tasks.embed_documents, [("test", "test")])
 
     @pytest.mark.asyncio
     async def test_get_by_id(self, mock_db_session: AsyncMock):
@@ -80,8 +111,10 @@ class TestDocumentService:
             assert response.title == document.title
             assert response.created == document.created
 
-            # ensure mock was called
-            mock_repo.assert_called_once_with(1, mock_db_session)
+            # ensure mock was called, on the primary as the result is cached
+            mock_repo.assert_called_once_with(
+                1, mock_db_session, schema=DocumentGetByIdClientResponse, use_replica=False
+            )
 
     @pytest.mark.asyncio
     async def test_delete_document(self, mock_db_session: AsyncMock):
@@ -110,3 +143,445 @@ class TestDocumentService:
 
             # ensure mock was called
             mock_repo.assert_called_once_with(1, mock_db_session)
+
+    @pytest.mark.asyncio
+    async def test_get_similarity_matrix(self, mock_db_session: AsyncMock):
+        """
+        Test texts and stored documents are compared in one matrix with stored embeddings reused
+        """
+        embed_texts = MagicMock(
+            side_effect=lambda texts: np.array(
+                [[1.0, 0.0] if "fire" in text else [0.0, 1.0] for text in texts], dtype=np.float32
+            )
+        )
+        worker_tasks = {tasks.embed_texts: embed_texts, tasks.get_model_id: lambda: "model@1"}
+
+        async def run(fn, *args):
+            return worker_tasks[fn](*args)
+        stored = SimpleNamespace(
+            id=7, title="fire", content="fire", embedding=vector_to_bytes(np.array([2.0, 0.0])), embedding_model="model@1"
+        )
+
+        with (
+            patch.object(document_service_module.nlp_executor, "run", run),
+            patch.object(DocumentRepository, "get_embeddings_by_ids", AsyncMock(return_value=[stored])),
+        ):
+            response = await document_service.get_similarity_matrix(
+                SimilarityMatrixClientRequest(texts=["fire alarm", "flood"], document_ids=[7]), mock_db_session
+            )
+            top_k_response = await document_service.get_similarity_matrix(
+                SimilarityMatrixClientRequest(texts=["fire alarm", "flood"], document_ids=[7], top_k=1),
+                mock_db_session,
+            )
+
+        assert [(item.kind, item.index, item.id) for item in response.items] == [
+            ("text", 0, None),
+            ("text", 1, None),
+            ("document", None, 7),
+        ]
+        assert np.allclose(response.matrix, [[1, 0, 1], [0, 1, 0], [1, 0, 1]])
+        assert top_k_response.top_k[0][0].column == 2
+        assert top_k_response.top_k[2][0].column == 0
+        assert top_k_response.top_k[1][0].score == 0.0
+        # only the request texts are embedded, the stored document embedding is reused
+        assert all(call.args[0] == ["fire alarm", "flood"] for call in embed_texts.call_args_list)
+
+    @pytest.mark.asyncio
+    async def test_get_similarity_matrix_without_texts_skips_the_executor(self, mock_db_session: AsyncMock):
+        """
+        Test an empty request, or one of stored documents only, does not dispatch text embedding to the executor
+        """
+        run = AsyncMock(return_value="model@1")
+        stored = SimpleNamespace(
+            id=7, title="fire", content="fire", embedding=vector_to_bytes(np.array([2.0, 0.0])), embedding_model="model@1"
+        )
+
+        with (
+            patch.object(document_service_module.nlp_executor, "run", run),
+            patch.object(DocumentRepository, "get_embeddings_by_ids", AsyncMock(return_value=[stored])),
+        ):
+            empty_response = await document_service.get_similarity_matrix(
+                SimilarityMatrixClientRequest(), mock_db_session
+            )
+            assert run.await_count == 0
+            response = await document_service.get_similarity_matrix(
+                SimilarityMatrixClientRequest(document_ids=[7]), mock_db_session
+            )
+
+        assert (empty_response.items, empty_response.matrix) == ([], [])
+        assert np.allclose(response.matrix, [[1]])
+        assert tasks.embed_texts not in [call.args[0] for call in run.await_args_list]
+
+    @pytest.mark.asyncio
+    async def test_get_similarity_matrix_unknown_document(self, mock_db_session: AsyncMock):
+        """
+        Test a missing document id raises not found
+        """
+        with patch.object(DocumentRepository, "get_embeddings_by_ids", AsyncMock(return_value=[])):
+            with pytest.raises(DocumentNotFoundException):
+                await document_service.get_similarity_matrix(
+                    SimilarityMatrixClientRequest(document_ids=[404]), mock_db_session
+                )
+
+    @pytest.mark.asyncio
+    async def test_get_similar_batches_concurrent_queries(self, mock_db_session: AsyncMock):
+        """
+        Test concurrent similarity queries are embedded in one executor task and each gets its own top k
+        """
+        stored = [
+            SimpleNamespace(id=1, title="fire", embedding=vector_to_bytes(np.array([1.0, 0.0]))),
+            SimpleNamespace(id=2, title="flood", embedding=vector_to_bytes(np.array([0.0, 1.0]))),
+        ]
+        embedded_batches = []
+
+        async def run(fn, *args):
+            if fn is tasks.get_model_id:
+                return "model@1"
+            embedded_batches.append(args[0])
+            return np.array([[1.0, 0.1] if "fire" in text else [0.1, 1.0] for text in args[0]], dtype=np.float32)
+
+        with (
+            patch.dict(document_service_module.similarity_index_state, {"loaded": False}),
+            patch.object(document_service_module.nlp_executor, "run", run),
+            patch.object(DocumentRepository, "get_all_embeddings", AsyncMock(return_value=stored)),
+        ):
+            fire, flood = await asyncio.gather(
+                document_service.get_similar(DocumentSimilarityClientRequest(text="fire", k=2), mock_db_session),
+                document_service.get_similar(DocumentSimilarityClientRequest(text="flood", k=1), mock_db_session),
+            )
+
+        assert embedded_batches == [["fire", "flood"]]
+        assert [match.id for match in fire] == [1, 2]
+        assert [match.id for match in flood] == [2]
+
+    @pytest.mark.asyncio
+    async def test_similarity_search_runs_off_the_event_loop(self):
+        """
+        Test a batch of similarity queries is scored on a worker thread holding the index guard
+        """
+        search_threads = []
+
+        def search_batch(vectors, k):
+            search_threads.append(threading.current_thread())
+            assert document_service_module.similarity_index_guard.locked()
+            return [[SimilarityMatch(id=1, title="fire", score=1.0)] * k for _ in vectors]
+
+        async def run(fn, texts):
+            return np.ones((len(texts), 2), dtype=np.float32)
+
+        with (
+            patch.object(document_service_module.nlp_executor, "run", run),
+            patch.object(document_service_module, "similarity_index", MagicMock(search_batch=search_batch)),
+        ):
+            matches = await document_service_module.search_similar_batch([("fire", 1), ("flood", 2)])
+
+        assert [len(query_matches) for query_matches in matches] == [1, 2]
+        assert search_threads and search_threads[0] is not threading.main_thread()
+
+    @pytest.mark.asyncio
+    async def test_index_changes_wait_for_a_search_off_the_event_loop(self):
+        """
+        Test a change made while a search holds the index guard waits on a worker thread, not on the event loop
+        """
+        index = VectorIndex()
+        guard = document_service_module.similarity_index_guard
+        release = threading.Event()
+
+        def search():
+            with guard:
+                release.wait(1.0)
+
+        with patch.object(document_service_module, "similarity_index", index):
+            search_task = asyncio.create_task(asyncio.to_thread(search))
+            while not guard.locked():
+                await asyncio.sleep(0.001)
+
+            change = asyncio.create_task(
+                document_service_module.update_similarity_index(lambda: index.add(1, "fire", np.ones(2)))
+            )
+            start_time = time.monotonic()
+            await asyncio.sleep(0.01)
+            assert time.monotonic() - start_time < 0.5
+            assert not change.done() and 1 not in index
+
+            release.set()
+            await asyncio.gather(search_task, change)
+
+        assert 1 in index
+
+    @pytest.mark.asyncio
+    async def test_sync_similarity_index_applies_writes_from_other_workers(self):
+        """
+        Test written documents are upserted or removed from a loaded index and a missed write forces a reload
+        """
+        index = VectorIndex()
+        index.add_batch([1, 2], ["fire", "flood"], np.eye(2, dtype=np.float32))
+        rows = [
+            SimpleNamespace(id=id, title=title, embedding=vector_to_bytes(np.array(vector)), embedding_model=model)
+            for id, title, vector, model in [
+                (1, "wildfire", [1.0, 0.0], "model@1"),
+                (3, "storm", [0.0, 1.0], "model@1"),
+                (4, "stale", [0.0, 1.0], "model@0"),
+            ]
+        ]
+
+        with (
+            patch.object(document_service_module, "similarity_index", index),
+            patch.dict(document_service_module.similarity_index_state, {"loaded": True}),
+            patch.dict(document_service_module.embedding_model_state, {"model_id": "model@1"}),
+            patch.object(DocumentRepository, "get_embeddings_by_ids", AsyncMock(return_value=rows)),
+        ):
+            await document_service_module.sync_similarity_index([1, 2, 3, 4])
+
+            assert sorted(index.ids.tolist()) == [1, 3]
+            assert index.search(np.array([1.0, 0.0]), k=1)[0].title == "wildfire"
+
+            await document_service_module.sync_similarity_index(None)
+            assert not document_service_module.similarity_index_state["loaded"]
+
+    @pytest.mark.asyncio
+    async def test_ivf_index_is_trained_off_the_event_loop(self):
+        """
+        Test an index that needs training is fitted in a background task and installed when it finishes
+        """
+        index = IVFIndex(n_lists=2, n_probe=1, train_threshold=4, background_training=True)
+        index.add_batch([1, 2, 3, 4], ["a", "b", "c", "d"], np.eye(4, dtype=np.float32)[:, :2] + 0.1)
+
+        with (
+            patch.object(document_service_module, "similarity_index", index),
+            patch.dict(document_service_module.similarity_index_state, {"training": None}),
+        ):
+            document_service_module.schedule_similarity_index_training()
+            task = document_service_module.similarity_index_state["training"]
+            assert task is not None and not index.is_trained
+
+            await task
+            await asyncio.sleep(0)
+
+            assert index.is_trained
+            assert document_service_module.similarity_index_state["training"] is None
+
+    @pytest.mark.asyncio
+    async def test_get_by_id_is_cached_until_the_document_is_updated(self, mock_db_session: AsyncMock):
+        """
+        Test repeated reads are served from the cache and an update is visible on the next read
+        """
+        created = datetime(2021, 1, 1)
+        document = Document(id=1, title="fire", content="c", description="d", created=created)
+        renamed = Document(id=1, title="flood", content="c", description="d", created=created)
+
+        with (
+            patch.object(DocumentRepository, "get_by_id", AsyncMock(side_effect=[document, renamed])) as mock_get,
+            patch.object(DocumentRepository, "update_document", AsyncMock(return_value=renamed)),
+        ):
+            for _ in range(3):
+                assert (await document_service.get_by_id(1, mock_db_session)).title == "fire"
+            assert mock_get.call_count == 1
+            assert get_docs_cache_stats()["redis"]["document"]["hit_ratio"] == 2 / 3
+
+            await document_service.update_document(1, DocumentUpdateClientRequest(title="flood"), mock_db_session)
+
+            assert (await document_service.get_by_id(1, mock_db_session)).title == "flood"
+            assert mock_get.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_get_by_title_does_not_return_a_renamed_document(self, mock_db_session: AsyncMock):
+        """
+        Test a title pointer to a document that has since been renamed is treated as a miss
+        """
+        created = datetime(2021, 1, 1)
+        document = Document(id=1, title="fire", content="c", description="d", created=created)
+        renamed = Document(id=1, title="flood", content="c", description="d", created=created)
+
+        with (
+            patch.object(DocumentRepository, "get_by_title", AsyncMock(side_effect=[document, None])) as mock_get,
+            patch.object(DocumentRepository, "get_by_id", AsyncMock(return_value=renamed)),
+            patch.object(DocumentRepository, "update_document", AsyncMock(return_value=renamed)),
+        ):
+            assert (await document_service.get_by_title("fire", mock_db_session)).id == 1
+            assert (await document_service.get_by_title("fire", mock_db_session)).id == 1
+            assert mock_get.call_count == 1
+
+            await document_service.update_document(1, DocumentUpdateClientRequest(title="flood"), mock_db_session)
+            # re-cache the renamed document under its id, the old title still points at it
+            await document_service.get_by_id(1, mock_db_session)
+
+            with pytest.raises(DocumentNotFoundException):
+                await document_service.get_by_title("fire", mock_db_session)
+
+    @pytest.mark.asyncio
+    async def test_get_all_runs_one_query_for_concurrent_misses(self):
+        """
+        Test concurrent requests missing the cache share one repository query
+        """
+        documents = [Document(id=i, title=f"doc {i}", created=datetime(2021, 1, 1)) for i in range(3)]
+
+        async def get_all(db, schema, use_replica):
+            assert not use_replica
+            await asyncio.sleep(0.02)
+            return documents
+
+        with patch.object(DocumentRepository, "get_all", AsyncMock(side_effect=get_all)) as mock_get_all:
+            responses = await asyncio.gather(*(document_service.get_all() for _ in range(10)))
+            cached_response = await document_service.get_all()
+
+        assert mock_get_all.call_count == 1
+        assert all(response.body == cached_response.body for response in responses)
+        assert cached_response.media_type == "application/json"
+        assert [doc["id"] for doc in json.loads(cached_response.body)] == [0, 1, 2]
+        assert set(json.loads(cached_response.body)[0]) == {"id", "title", "created"}
+
+    @pytest.mark.asyncio
+    async def test_get_all_paginated_returns_cursors_and_cached_count(self, mock_db_session: AsyncMock):
+        """
+        Test a page carries cursors to its neighbours and the document count, counted once for many pages
+        """
+        documents = [
+            Document(id=id, title="t", content="c", description="d", created=datetime(2021, 1, 1)) for id in (9, 8)
+        ]
+
+        with (
+            patch.object(DocumentRepository, "get_all_paginated", AsyncMock(return_value=(documents, True))),
+            patch.object(DocumentRepository, "count_documents", AsyncMock(return_value=9)) as mock_count,
+        ):
+            first = await document_service.get_all_paginated(
+                mock_db_session, Pagination(perPage=2, page=1, order=SortEnum.DESC)
+            )
+            following = await document_service.get_all_paginated(
+                mock_db_session,
+                Pagination(perPage=2, page=1, order=SortEnum.DESC, cursor=decode_cursor(first.next_cursor)),
+            )
+
+        assert first.prev_cursor is None
+        assert decode_cursor(first.next_cursor) == PageCursor(8, "next", SortEnum.DESC)
+        assert decode_cursor(following.prev_cursor) == PageCursor(9, "prev", SortEnum.DESC)
+        assert first.pages == following.pages == 9
+        assert mock_count.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_get_all_paginated_counts_before_the_page_query(self, mock_db_session: AsyncMock):
+        """
+        Test the total is counted before the request session queries, so the request never holds two connections
+        """
+        calls = []
+        documents = [Document(id=1, title="t", content="c", description="d", created=datetime(2021, 1, 1))]
+
+        async def get_all_paginated(db, pagination, schema):
+            calls.append("page")
+            return documents, False
+
+        async def count_documents(db, use_replica):
+            assert not use_replica
+            calls.append("count")
+            return 1
+
+        with (
+            patch.object(DocumentRepository, "get_all_paginated", AsyncMock(side_effect=get_all_paginated)),
+            patch.object(DocumentRepository, "count_documents", AsyncMock(side_effect=count_documents)),
+        ):
+            await document_service.get_all_paginated(mock_db_session, Pagination(perPage=2, page=1, order=SortEnum.DESC))
+
+        assert calls == ["count", "page"]
+
+    @pytest.mark.asyncio
+    async def test_export_documents_streams_one_chunk_per_batch(self):
+        """
+        Test the export streams newline delimited JSON with one chunk per batch read from the cursor
+        """
+        batches = [
+            [Document(id=id, title=f"t{id}", content="c", description="d", created=datetime(2021, 1, 1)) for id in ids]
+            for ids in ([1, 2], [3])
+        ]
+
+        async def stream_all(repository, db, batch_size):
+            for batch in batches:
+                yield batch
+
+        with patch.object(DocumentRepository, "stream_all", stream_all):
+            response = await document_service.export_documents()
+            chunks = [chunk async for chunk in response.body_iterator]
+
+        assert response.media_type == "application/x-ndjson"
+        assert len(chunks) == 2
+        lines = b"".join(chunks).decode().splitlines()
+        assert [json.loads(line)["id"] for line in lines] == [1, 2, 3]
+        assert set(json.loads(lines[0])) == {"id", "title", "content", "description", "created"}
+
+    @pytest.mark.asyncio
+    async def test_ingest_documents_reports_bad_lines_and_keeps_the_rest(self, mock_db_session: AsyncMock):
+        """
+        Test a failed batch insert is retried row by row and only the unparseable and failing lines are dropped
+        """
+        lines = [
+            json.dumps({"title": "a", "content": "a", "description": "a"}),
+            "{not json",
+            json.dumps({"title": "duplicate", "content": "b", "description": "b"}),
+            "",
+            json.dumps({"title": "c", "description": "c"}),
+            json.dumps({"title": "d", "content": "d", "description": "d"}),
+        ]
+
+        async def chunks():
+            # split mid line to check lines are reassembled across chunks
+            body = "\n".join(lines).encode()
+            yield body[:30]
+            yield body[30:]
+
+        def embed_documents(fn, documents):
+            return [DocumentEmbedding(embedding=vector_to_bytes(np.ones(2)), embedding_model="model@1")] * len(
+                documents
+            )
+
+        async def create_documents(documents, db):
+            if len(documents) > 1 or documents[0]["title"] == "duplicate":
+                raise IntegrityError("INSERT", {}, Exception("duplicate key value"))
+            return [SimpleNamespace(id=ord(documents[0]["title"]), title=documents[0]["title"])]
+
+        mock_db_session.begin_nested = MagicMock(side_effect=lambda: contextlib.nullcontext())
+
+        with (
+            patch.object(document_service_module.nlp_executor, "run", AsyncMock(side_effect=embed_documents)),
+            patch.object(DocumentRepository, "create_documents", AsyncMock(side_effect=create_documents)),
+        ):
+            report = await document_service.ingest_documents(split_lines(chunks()), mock_db_session, 1, 10)
+
+        assert (report.inserted, report.failed) == (2, 3)
+        errors = {error.line: error.error for error in report.errors}
+        assert set(errors) == {2, 3, 5}
+        assert "duplicate key value" in errors[3]
+        assert errors[5].startswith("content")
+        mock_db_session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_ingest_documents_survives_a_batch_where_every_row_fails(self, mock_db_session: AsyncMock):
+        """
+        Test a batch whose rows all fail to insert is reported without aborting the ingestion or touching a loaded
+        similarity index
+        """
+        lines = [json.dumps({"title": title, "content": "c", "description": "d"}) for title in ("a", "b")]
+
+        async def chunks():
+            yield "\n".join(lines).encode()
+
+        def embed_documents(fn, documents):
+            return [DocumentEmbedding(embedding=vector_to_bytes(np.ones(2)), embedding_model="model@1")] * len(
+                documents
+            )
+
+        mock_db_session.begin_nested = MagicMock(side_effect=lambda: contextlib.nullcontext())
+        index = MagicMock()
+
+        with (
+            patch.object(document_service_module.nlp_executor, "run", AsyncMock(side_effect=embed_documents)),
+            patch.object(
+                DocumentRepository,
+                "create_documents",
+                AsyncMock(side_effect=IntegrityError("INSERT", {}, Exception("duplicate key value"))),
+            ),
+            patch.object(document_service_module, "similarity_index", index),
+            patch.dict(document_service_module.similarity_index_state, {"loaded": True}),
+        ):
+            report = await document_service.ingest_documents(split_lines(chunks()), mock_db_session, 1, 10)
+
+        assert (report.inserted, report.failed) == (0, 2)
+        index.add_batch.assert_not_called()
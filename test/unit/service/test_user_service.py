@@ -0,0 +1,62 @@
+"""
+Unit Test User Service
+Author: Tom Aston
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.errors import InvalidTokenException
+from app.models.document import Document  # noqa: F401 registers the Document mapper User relates to
+from app.models.user import User, UserRole
+from app.service import user_service as user_service_module
+from app.service.user_service import UserService, user_repository
+
+user_service = UserService()
+
+
+def refresh_token_data(role: str) -> dict:
+    """
+    decoded refresh token of a user signed in with role
+    """
+    return {
+        "user": {"id": 1, "username": "tom", "email": "tom@example.com", "role": role},
+        "exp": (datetime.now() + timedelta(minutes=5)).timestamp(),
+        "jti": "refresh-jti",
+        "refresh": True,
+    }
+
+
+class TestUserService:
+    """
+    Unit Test User Service
+    """
+
+    @pytest.mark.asyncio
+    async def test_refresh_token_carries_the_current_role(self, mock_db_session: AsyncMock):
+        """
+        Test a refreshed access token carries the role the user has now, not the one of the refresh token
+        """
+        user = User(id=1, username="tom", email="tom@example.com", role=UserRole.USER)
+
+        with (
+            patch.object(user_repository, "get_by_email", AsyncMock(return_value=user)) as get_by_email,
+            patch.object(user_service_module, "create_access_token", return_value="access") as create_access_token,
+        ):
+            response = await user_service.refresh_token(refresh_token_data("admin"), mock_db_session)
+
+        assert response.status_code == 200
+        get_by_email.assert_awaited_once_with("tom@example.com", mock_db_session)
+        user_data = create_access_token.call_args.kwargs["user_data"]
+        assert user_data == {"id": 1, "username": "tom", "email": "tom@example.com", "role": UserRole.USER.value}
+
+    @pytest.mark.asyncio
+    async def test_refresh_token_of_a_deleted_user_is_rejected(self, mock_db_session: AsyncMock):
+        """
+        Test a refresh token of a user that no longer exists does not get a new access token
+        """
+        with patch.object(user_repository, "get_by_email", AsyncMock(return_value=None)):
+            with pytest.raises(InvalidTokenException):
+                await user_service.refresh_token(refresh_token_data("admin"), mock_db_session)
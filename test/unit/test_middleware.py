@@ -0,0 +1,63 @@
+"""
+Middleware Unit Test
+Author: Tom Aston
+"""
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+
+from app.core.database import client_writes
+from app.middleware import LAST_WRITE_COOKIE, parse_last_write, register_middleware
+
+
+def create_app() -> FastAPI:
+    """
+    app with a route that writes, standing in for a flush through the router, and one reporting the client's writes
+    """
+    app = FastAPI()
+    register_middleware(app)
+
+    @app.post("/write")
+    async def write() -> None:
+        writes = client_writes.get()
+        writes.last_write = 123.5
+        writes.wrote = True
+
+    @app.get("/read")
+    async def read() -> dict:
+        return {"last_write": client_writes.get().last_write}
+
+    return app
+
+
+class TestReadYourWritesMiddleware:
+    """
+    Unit Test the read your writes middleware
+    """
+
+    @pytest.mark.asyncio
+    async def test_last_write_travels_with_the_client(self):
+        """
+        Test a write sets the last write cookie and the client's next request carries it
+        """
+        async with AsyncClient(transport=ASGITransport(app=create_app()), base_url="http://test") as client:
+            read_before = await client.get("/read")
+            write = await client.post("/write")
+            read_after = await client.get("/read")
+
+        assert read_before.json() == {"last_write": None}
+        assert LAST_WRITE_COOKIE not in read_before.cookies
+        assert write.cookies[LAST_WRITE_COOKIE] == "123.5"
+        assert read_after.json() == {"last_write": 123.5}
+        assert client_writes.get() is None
+
+    def test_malformed_cookie_is_ignored(self):
+        """
+        Test a missing, malformed or non finite cookie gives no last write
+        """
+        assert parse_last_write(None) is None
+        assert parse_last_write("soon") is None
+        assert parse_last_write("inf") is None
+        assert parse_last_write("12.5") == 12.5